@@ -1,7 +1,8 @@
 #!/bin/sh
 set -e
 
-if [ "$BACKUP_ENABLE" = "TRUE"  ] || [ "$CONSUME_ENABLE" = "TRUE"  ]; then
+if [ "$BACKUP_ENABLE" = "TRUE"  ] || [ "$CONSUME_ENABLE" = "TRUE"  ] || [ "$DEFERRED_PROCESSING_ENABLE" = "TRUE"  ] || \
+   [ "$READING_PROGRESS_BUFFER_ENABLE" = "TRUE"  ]; then
   python .venv/bin/supervisord -c supervisord.conf
 fi
 
@@ -24,5 +25,15 @@ HOST_PORT="${HOST_PORT:-8000}"
 
 python manage.py migrate
 python manage.py clean_up
+# index the page texts of pdfs uploaded before the full-text search was added. This runs in the background, so that
+# PdfDing is available in the meantime. Indexed pdfs are skipped, so later starts only check for unindexed pdfs.
+python manage.py index_page_texts &
 
-exec python -m gunicorn --bind 0.0.0.0:$HOST_PORT --workers 3 core.wsgi:application
+# PdfDing is served via ASGI by uvicorn workers, so that pdf files are streamed asynchronously.
+# Set SERVER_INTERFACE to WSGI in order to use gunicorn's synchronous workers instead.
+if [ "$SERVER_INTERFACE" = "WSGI" ]
+then
+    exec python -m gunicorn --bind 0.0.0.0:$HOST_PORT --workers 3 core.wsgi:application
+else
+    exec python -m gunicorn --bind 0.0.0.0:$HOST_PORT --workers 3 -k uvicorn.workers.UvicornWorker core.asgi:application
+fi
@@ -48,7 +48,7 @@ class OverviewMixin(BaseAdminMixin):
         Filter the PDFs when performing a search in the overview.
         """
 
-        users = User.objects.all()
+        users = User.objects.select_related('profile')
 
         search = request.GET.get('search', '')
         tags = request.GET.get('tags', [])
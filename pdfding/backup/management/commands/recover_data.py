@@ -1,10 +1,24 @@
+import json
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from io import BytesIO
 from pathlib import Path
+from shutil import copyfile
 
-from backup.service import decrypt_file, get_encryption_key
+from backup.service import (
+    CONTENT_PREFIX,
+    MANIFEST_OBJECT_NAME,
+    decrypt_stream,
+    get_content_object_name,
+    get_encryption_key,
+    get_file_hash,
+)
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from minio import Minio
+from minio.error import S3Error
 
 minio_client = Minio(
     endpoint=settings.BACKUP_ENDPOINT,
@@ -15,11 +29,87 @@ minio_client = Minio(
 
 logger = logging.getLogger('management')
 
+# the journal is stored in the data dir and is removed after a successful recovery
+RECOVERY_JOURNAL_NAME = 'recover_data_journal.jsonl'
+
+
+@dataclass
+class Recovery:
+    """
+    The recovery of a backed up object. The object is downloaded once and copied to all files sharing its content.
+    The version identifies the backed up content of the files in the recovery journal.
+    """
+
+    object_name: str
+    file_names: list[str]
+    version: str
+    content_hash: str | None = None
+    size: int | None = None
+
+
+class RecoveryJournal:
+    """
+    Journal of the recovered files. Every verified file is appended to the journal, so that an interrupted recovery
+    can be resumed without downloading the already recovered files again.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def load(self) -> dict[str, str]:
+        """Load the recovered files mapped to the versions of their backed up content."""
+
+        recovered_files = {}
+
+        if self.path.exists():
+            with open(self.path) as journal_file:
+                for line in journal_file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # the last line might be incomplete, if the recovery was interrupted while writing it
+                        continue
+
+                    recovered_files[entry['file_name']] = entry['version']
+
+        return recovered_files
+
+    def add(self, file_name: str, version: str):
+        """Add a recovered file to the journal. The journal is shared by all threads."""
+
+        with self.lock, open(self.path, 'a') as journal_file:
+            journal_file.write(json.dumps({'file_name': file_name, 'version': version}) + '\n')
+
+    def remove(self):
+        self.path.unlink(missing_ok=True)
+
 
 class Command(BaseCommand):
     help = "Recover data from S3 backup"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-w',
+            '--workers',
+            type=int,
+            default=settings.BACKUP_UPLOAD_WORKERS,
+            help='Number of files that are downloaded and decrypted in parallel',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only show which files would be recovered without changing anything',
+        )
+
     def handle(self, *args, **kwargs):
+        if kwargs['workers'] < 1:
+            raise CommandError('The number of workers needs to be at least 1.')
+
+        if kwargs['dry_run']:
+            self.log_recovery_plan()
+            return
+
         logger.info('----------------------------------------------------')
         logger.info('Are you sure you want to proceed with the data recovery?')
         logger.info('If you are using a sqlite DB, this operation will overwrite your local DB!')
@@ -40,20 +130,22 @@ class Command(BaseCommand):
 
                 db_backup_path = settings.DATABASES['default']['BACKUP_NAME']
 
-                self.get_file_from_minio(
-                    db_backup_path.name,
-                    db_backup_path.parent,
-                    encryption_key,
-                )
+                self.get_file_from_minio(db_backup_path.name, db_backup_path, encryption_key)
 
                 db_backup_path.rename(settings.DATABASES['default']['NAME'])
 
-            logger.info('Recovering PDF files and QR codes')
-            objects = minio_client.list_objects(settings.BACKUP_BUCKET_NAME, recursive=True)
-            for obj in objects:
-                obj_name = obj.object_name
-                if obj_name != settings.DATABASES['default']['BACKUP_NAME'].name:
-                    self.get_file_from_minio(obj_name, settings.MEDIA_ROOT, encryption_key)
+            logger.info('Recovering PDF files, QR codes, thumbnails, previews and linearized copies')
+            journal = RecoveryJournal(settings.DATA_DIR / RECOVERY_JOURNAL_NAME)
+            recoveries = self.get_recoveries(encryption_key)
+            failed_files = self.recover_files(recoveries, journal, encryption_key, kwargs['workers'])
+
+            if failed_files:
+                raise CommandError(
+                    f'{len(failed_files)} files could not be recovered. Run the command again to retry them, '
+                    f'already recovered files will be skipped.'
+                )
+
+            journal.remove()
 
             logger.info('Data recovery completed successfully.')
             logger.info('----------------------------------------------------')
@@ -61,18 +153,220 @@ class Command(BaseCommand):
             logger.info('Aborting data recovery.')
             logger.info('----------------------------------------------------')
 
+    @classmethod
+    def log_recovery_plan(cls):
+        """Log the files that would be recovered. Files already recovered by an interrupted recovery are skipped."""
+
+        encryption_key = get_encryption_key(
+            settings.BACKUP_ENCRYPTION_ENABLED, settings.BACKUP_ENCRYPTION_PASSWORD, settings.BACKUP_ENCRYPTION_SALT
+        )
+        recovered_files = RecoveryJournal(settings.DATA_DIR / RECOVERY_JOURNAL_NAME).load()
+        number_of_files = number_of_skipped_files = number_of_downloads = 0
+
+        if settings.DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+            logger.info(f'Would recover the database from {settings.DATABASES["default"]["BACKUP_NAME"].name}')
+
+        for recovery in cls.get_recoveries(encryption_key):
+            pending_file_names, recovered_file_names = cls.split_recovered_files(recovery, recovered_files)
+            number_of_files += len(recovery.file_names)
+            number_of_skipped_files += len(recovered_file_names)
+
+            if pending_file_names and not recovered_file_names:
+                number_of_downloads += 1
+                logger.info(f'Would download {recovery.object_name} to {", ".join(pending_file_names)}')
+            elif pending_file_names:
+                logger.info(f'Would copy {recovered_file_names[0]} to {", ".join(pending_file_names)}')
+
+        logger.info(
+            f'Would recover {number_of_files - number_of_skipped_files} of {number_of_files} files with '
+            f'{number_of_downloads} downloads, {number_of_skipped_files} files are already recovered.'
+        )
+
+    @classmethod
+    def get_recoveries(cls, encryption_key: bytes) -> list[Recovery]:
+        """
+        Get the recoveries of the backed up files. If the backup has a manifest, the files sharing the same content
+        are recovered from one content object and are verified by their content hash. Backups created before the
+        files were stored by their content hash contain objects named like the files. These are verified by their
+        size, if they are not encrypted. Encrypted objects are authenticated while they are decrypted.
+
+        Objects named like the files are recovered as well, if the manifest does not contain their file. The backup
+        keeps these objects until their file is backed up by its content, e.g. if they are the only remaining copy.
+        """
+
+        manifest = cls.get_manifest_from_minio(encryption_key) or {}
+        file_names_by_hash = {}
+
+        for file_name, content_hash in sorted(manifest.items()):
+            file_names_by_hash.setdefault(content_hash, []).append(file_name)
+
+        recoveries = [
+            Recovery(
+                get_content_object_name(content_hash, encryption_key),
+                file_names,
+                content_hash,
+                content_hash=content_hash,
+            )
+            for content_hash, file_names in file_names_by_hash.items()
+        ]
+
+        excluded_objects = [settings.DATABASES['default']['BACKUP_NAME'].name, MANIFEST_OBJECT_NAME]
+        recoveries += [
+            Recovery(obj.object_name, [obj.object_name], obj.etag, size=None if encryption_key else obj.size)
+            for obj in minio_client.list_objects(settings.BACKUP_BUCKET_NAME, recursive=True)
+            if obj.object_name not in excluded_objects
+            and not obj.object_name.startswith(CONTENT_PREFIX)
+            and obj.object_name not in manifest
+        ]
+
+        return recoveries
+
+    @staticmethod
+    def split_recovered_files(recovery: Recovery, recovered_files: dict[str, str]) -> tuple[list[str], list[str]]:
+        """Split the files of the recovery into the pending files and the files recovered by an earlier run."""
+
+        pending_file_names, recovered_file_names = [], []
+
+        for file_name in recovery.file_names:
+            if recovered_files.get(file_name) == recovery.version and (settings.MEDIA_ROOT / file_name).exists():
+                recovered_file_names.append(file_name)
+            else:
+                pending_file_names.append(file_name)
+
+        return pending_file_names, recovered_file_names
+
+    @classmethod
+    def recover_files(
+        cls, recoveries: list[Recovery], journal: RecoveryJournal, encryption_key: bytes, workers: int
+    ) -> list[str]:
+        """
+        Recover the files using a bounded thread pool. All threads share the minio client. Files recorded in the
+        journal are skipped. Returns the names of the files that could not be recovered.
+        """
+
+        recovered_files = journal.load()
+        failed_files = []
+        number_of_skipped_files = number_of_recovered_files = 0
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+
+            for recovery in recoveries:
+                pending_file_names, recovered_file_names = cls.split_recovered_files(recovery, recovered_files)
+                number_of_skipped_files += len(recovered_file_names)
+
+                if pending_file_names:
+                    future = executor.submit(
+                        cls.recover_object, recovery, pending_file_names, recovered_file_names, journal, encryption_key
+                    )
+                    futures[future] = pending_file_names
+
+            logger.info(
+                f'Need to recover {sum(len(file_names) for file_names in futures.values())} files, '
+                f'{number_of_skipped_files} files were already recovered.'
+            )
+
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    number_of_recovered_files += len(futures[future])
+                except Exception as e:  # nosec # noqa
+                    logger.error(f'Could not recover {", ".join(futures[future])}: {e}')
+                    failed_files.extend(futures[future])
+
+        logger.info(f'Recovered {number_of_recovered_files} files, {len(failed_files)} files failed.')
+
+        return failed_files
+
+    @classmethod
+    def recover_object(
+        cls,
+        recovery: Recovery,
+        pending_file_names: list[str],
+        recovered_file_names: list[str],
+        journal: RecoveryJournal,
+        encryption_key: bytes,
+    ):
+        """
+        Recover the pending files of the recovery. The object is only downloaded, if none of its files was recovered
+        by an earlier run. Otherwise, the already recovered file is copied.
+        """
+
+        if recovered_file_names:
+            source_path = settings.MEDIA_ROOT / recovered_file_names[0]
+        else:
+            file_name, *pending_file_names = pending_file_names
+            source_path = settings.MEDIA_ROOT / file_name
+
+            cls.get_file_from_minio(recovery.object_name, source_path, encryption_key)
+            cls.verify_file(source_path, recovery)
+            journal.add(file_name, recovery.version)
+
+        for file_name in pending_file_names:
+            target_path = settings.MEDIA_ROOT / file_name
+            target_path.parent.mkdir(exist_ok=True, parents=True)
+            copyfile(source_path, target_path)
+            journal.add(file_name, recovery.version)
+
     @staticmethod
-    def get_file_from_minio(obj_name: str, target_parent_path: Path, encryption_key: bytes):
+    def verify_file(file_path: Path, recovery: Recovery):
+        """Verify the recovered file against the content hash or size of the backup. Invalid files are removed."""
+
+        if recovery.content_hash is not None and get_file_hash(file_path) != recovery.content_hash:
+            file_path.unlink()
+            raise ValueError(f'{file_path.name} does not match its content hash.')
+        elif recovery.size is not None and file_path.stat().st_size != recovery.size:
+            file_path.unlink()
+            raise ValueError(f'{file_path.name} does not match the size of the backed up object.')
+
+    @staticmethod
+    def get_manifest_from_minio(encryption_key: bytes) -> dict[str, str] | None:
         """
-        Get a file to minio. If an encryption key is provided the file will be decrypted beforehand using cryptography's
-        fernet algorithm.
+        Get the manifest mapping the names of the backed up files to their content hashes. Returns None, if the
+        backup has no manifest.
+        """
+
+        try:
+            response = minio_client.get_object(settings.BACKUP_BUCKET_NAME, MANIFEST_OBJECT_NAME)
+        except S3Error as e:
+            if e.code == 'NoSuchKey':
+                return None
+
+            raise
+
+        manifest_content = BytesIO()
+
+        try:
+            if encryption_key:
+                decrypt_stream(encryption_key, response, manifest_content)
+            else:
+                manifest_content.write(response.read())
+        finally:
+            response.close()
+            response.release_conn()
+
+        return json.loads(manifest_content.getvalue())['files']
+
+    @staticmethod
+    def get_file_from_minio(obj_name: str, target_path: Path, encryption_key: bytes):
+        """
+        Get a file from minio. If an encryption key is provided the file will be decrypted while it is downloaded.
+        Backups encrypted with cryptography's fernet algorithm by older versions are decrypted as well.
         """
 
         if encryption_key:
-            # get encrypted file from minio, decrypt it and delete the local tmp file
-            encrypted_file_path = Path(__file__).parent / 'tmp_encrypted'
-            minio_client.fget_object(settings.BACKUP_BUCKET_NAME, obj_name, str(encrypted_file_path))
-            decrypt_file(encryption_key, encrypted_file_path, target_parent_path / obj_name)
-            encrypted_file_path.unlink()
+            target_path.parent.mkdir(exist_ok=True, parents=True)
+            response = minio_client.get_object(settings.BACKUP_BUCKET_NAME, obj_name)
+
+            try:
+                with open(target_path, 'wb') as target_file:
+                    decrypt_stream(encryption_key, response, target_file)
+            except Exception:
+                # do not leave a partially decrypted file behind
+                target_path.unlink(missing_ok=True)
+                raise
+            finally:
+                response.close()
+                response.release_conn()
         else:
-            minio_client.fget_object(settings.BACKUP_BUCKET_NAME, obj_name, str(target_parent_path / obj_name))
+            minio_client.fget_object(settings.BACKUP_BUCKET_NAME, obj_name, str(target_path))
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name='BackupManifestEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64)),
+                ('file_name', models.CharField(max_length=500, unique=True)),
+                ('modification_time', models.FloatField()),
+                ('revision', models.IntegerField(blank=True, null=True)),
+                ('size', models.BigIntegerField()),
+            ],
+        ),
+    ]
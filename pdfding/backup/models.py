@@ -0,0 +1,18 @@
+from django.db import models
+
+
+class BackupManifestEntry(models.Model):
+    """
+    The model for the entries of the backup manifest. Every entry describes the state of a file when it was last
+    uploaded to the backup, so that modified files can be detected without listing the bucket.
+    """
+
+    content_hash = models.CharField(max_length=64)
+    # the file names are the names of the backed up files, so they can be as long as the file names of the pdfs
+    file_name = models.CharField(max_length=500, unique=True)
+    modification_time = models.FloatField()
+    revision = models.IntegerField(null=True, blank=True)
+    size = models.BigIntegerField()
+
+    def __str__(self) -> str:  # pragma: no cover
+        return self.file_name
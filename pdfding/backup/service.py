@@ -1,10 +1,36 @@
 import base64
+import hashlib
+import hmac
+import math
+import os
+import struct
 from pathlib import Path
+from typing import BinaryIO
 
 from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives.hashes import SHA256
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
+# encrypted backup files start with a header consisting of the magic bytes, the format version, the chunk size and
+# the nonce prefix. the header is authenticated together with every chunk.
+ENCRYPTION_MAGIC = b'PDFDING'
+ENCRYPTION_VERSION = 1
+ENCRYPTION_CHUNK_SIZE = 64 * 1024
+# the chunk size is read from the header before any chunk is authenticated, so it is capped when decrypting. otherwise
+# a tampered header could make the decryption read arbitrarily large chunks into memory.
+MAX_ENCRYPTION_CHUNK_SIZE = 16 * 1024 * 1024
+NONCE_PREFIX_SIZE = 7
+TAG_SIZE = 16
+HEADER_FORMAT = f'>{len(ENCRYPTION_MAGIC)}sBI{NONCE_PREFIX_SIZE}s'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+# files are stored in the bucket by their content hash, so that identical files are only stored once. the manifest
+# object maps the file names to the content hashes. in encrypted backups the object names are HMACs of the hashes.
+CONTENT_PREFIX = 'content/'
+MANIFEST_OBJECT_NAME = 'manifest.json'
+
 
 def get_encryption_key(encryption_enabled: bool, password: str, salt: str):
     """
@@ -37,41 +63,160 @@ def generate_encryption_key(password: str, salt: str) -> bytes:
     return encryption_key
 
 
-def encrypt_file(encryption_key: bytes, source_path: Path, target_path: Path):
+def get_file_hash(file_path: Path) -> str:
+    """Get the SHA-256 hash of the file's content. The file is read in chunks."""
+
+    with open(file_path, 'rb') as file:
+        return hashlib.file_digest(file, 'sha256').hexdigest()
+
+
+def get_content_object_name(content_hash: str, encryption_key: bytes | None) -> str:
+    """
+    Get the name of the object storing the file content with the specified hash. If the backup is encrypted, the name
+    is derived from the hash with an HMAC, so that the names of the objects do not reveal which files are backed up.
+    """
+
+    if encryption_key:
+        name_key = derive_key(encryption_key, b'pdfding backup object names')
+        content_hash = hmac.new(name_key, content_hash.encode(), hashlib.sha256).hexdigest()
+
+    return f'{CONTENT_PREFIX}{content_hash}'
+
+
+def derive_key(encryption_key: bytes, purpose: bytes) -> bytes:
+    """
+    Derive a key for the specified purpose from the encryption key with HKDF, so that the same key is not used for
+    different purposes, e.g. by both Fernet and AES-GCM.
+    """
+
+    hkdf = HKDF(algorithm=SHA256(), length=32, salt=None, info=purpose)
+
+    return hkdf.derive(base64.urlsafe_b64decode(encryption_key))
+
+
+def get_chunk_cipher(encryption_key: bytes) -> AESGCM:
+    """Get the AES-GCM cipher used for encrypting the chunks."""
+
+    return AESGCM(derive_key(encryption_key, b'pdfding backup chunks'))
+
+
+def get_chunk_nonce(nonce_prefix: bytes, chunk_index: int, last_chunk: bool) -> bytes:
+    """
+    Get the nonce of a chunk. It consists of the random prefix of the file, the index of the chunk and a flag marking
+    the last chunk, so that chunks cannot be reordered and a truncated file cannot be decrypted.
+    """
+
+    return nonce_prefix + struct.pack('>I?', chunk_index, last_chunk)
+
+
+def get_encrypted_size(file_size: int) -> int:
+    """Get the size of a file after encrypting it. An empty file still has a single empty chunk."""
+
+    number_of_chunks = max(math.ceil(file_size / ENCRYPTION_CHUNK_SIZE), 1)
+
+    return HEADER_SIZE + file_size + number_of_chunks * TAG_SIZE
+
+
+class EncryptingReader:
     """
-    Encrypt the specified file using Fernet. Fernet is a symmetric encryption algorithm provided by the cryptography
-    library. The encryption key should be generated using PBKDF2.
+    File-like object returning the encrypted content of the source file. The file is split into chunks which are
+    encrypted with AES-GCM while being read, so that only a few chunks are held in memory at any time.
     """
 
-    with open(source_path, 'rb') as file:
-        unencrypted = file.read()
+    def __init__(self, encryption_key: bytes, source: BinaryIO):
+        self.source = source
+        self.cipher = get_chunk_cipher(encryption_key)
+        self.nonce_prefix = os.urandom(NONCE_PREFIX_SIZE)
+        self.header = struct.pack(
+            HEADER_FORMAT, ENCRYPTION_MAGIC, ENCRYPTION_VERSION, ENCRYPTION_CHUNK_SIZE, self.nonce_prefix
+        )
+        self.buffer = bytearray(self.header)
+        self.chunk_index = 0
+        # the next chunk is read in advance, as the last chunk needs to be known when encrypting it
+        self.next_chunk = source.read(ENCRYPTION_CHUNK_SIZE)
+        self.finished = False
+
+    def read(self, size: int = -1) -> bytes:
+        """Read up to size bytes of the encrypted file. If size is negative, the rest of the file is read."""
+
+        while not self.finished and (size < 0 or len(self.buffer) < size):
+            self.encrypt_next_chunk()
+
+        if size < 0:
+            size = len(self.buffer)
+
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+
+        return data
+
+    def encrypt_next_chunk(self):
+        """Encrypt the next chunk of the source file and add it to the buffer."""
+
+        chunk = self.next_chunk
+        self.next_chunk = self.source.read(ENCRYPTION_CHUNK_SIZE)
+        self.finished = not self.next_chunk
+
+        nonce = get_chunk_nonce(self.nonce_prefix, self.chunk_index, self.finished)
+        self.buffer += self.cipher.encrypt(nonce, chunk, self.header)
+        self.chunk_index += 1
 
-    f = Fernet(encryption_key)
-    encrypted = f.encrypt(unencrypted)
 
-    with open(target_path, 'wb') as encrypted_file:
-        encrypted_file.write(encrypted)
+def read_exactly(source: BinaryIO, size: int) -> bytes:
+    """Read size bytes from the source. Fewer bytes are only returned if the end of the source is reached."""
 
+    data = bytearray()
 
-def decrypt_file(encryption_key: bytes, source_path: Path, target_path: Path):
+    while len(data) < size:
+        read_data = source.read(size - len(data))
+
+        if not read_data:
+            break
+
+        data += read_data
+
+    return bytes(data)
+
+
+def decrypt_stream(encryption_key: bytes, source: BinaryIO, target: BinaryIO):
     """
-    Decrypt the specified file using Fernet. Fernet is a symmetric encryption algorithm provided by the cryptography
-    library. The encryption key should be generated using PBKDF2.
+    Decrypt the source and write the decrypted content to the target. Files encrypted in chunks with AES-GCM are
+    decrypted chunk by chunk. Files of older backups, which were encrypted with Fernet as a whole, are detected by the
+    missing header and decrypted as a whole. Raises cryptography's InvalidTag or InvalidToken if the file was tampered
+    with or was encrypted with another key. Raises a ValueError if the header is incomplete or not supported.
     """
 
-    f = Fernet(encryption_key)
+    magic = read_exactly(source, len(ENCRYPTION_MAGIC))
+
+    if magic != ENCRYPTION_MAGIC:
+        target.write(Fernet(encryption_key).decrypt(magic + source.read()))
+        return
+
+    header = magic + read_exactly(source, HEADER_SIZE - len(ENCRYPTION_MAGIC))
+
+    if len(header) != HEADER_SIZE:
+        raise ValueError('The encryption header is incomplete.')
+
+    _, version, chunk_size, nonce_prefix = struct.unpack(HEADER_FORMAT, header)
+
+    if version != ENCRYPTION_VERSION:
+        raise ValueError(f'Encryption format version {version} is not supported.')
+
+    if not 0 < chunk_size <= MAX_ENCRYPTION_CHUNK_SIZE:
+        raise ValueError(f'Encryption chunk size {chunk_size} is not supported.')
+
+    cipher = get_chunk_cipher(encryption_key)
+    chunk_index = 0
+    chunk = read_exactly(source, chunk_size + TAG_SIZE)
 
-    # opening the encrypted file
-    with open(source_path, 'rb') as enc_file:
-        encrypted = enc_file.read()
+    while True:
+        next_chunk = read_exactly(source, chunk_size + TAG_SIZE)
+        last_chunk = not next_chunk
 
-    # decrypting the file
-    decrypted = f.decrypt(encrypted)
+        target.write(cipher.decrypt(get_chunk_nonce(nonce_prefix, chunk_index, last_chunk), chunk, header))
 
-    # create the directory if missing
-    target_path.parent.mkdir(exist_ok=True, parents=True)
+        if last_chunk:
+            break
 
-    # opening the file in write mode and
-    # writing the decrypted data
-    with open(target_path, 'wb') as dec_file:
-        dec_file.write(decrypted)
+        chunk = next_chunk
+        chunk_index += 1
@@ -1,19 +1,44 @@
+import json
 import logging
 import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from io import BytesIO
 from pathlib import Path
 
-from backup.service import encrypt_file, get_encryption_key
+from backup.models import BackupManifestEntry
+from backup.service import (
+    CONTENT_PREFIX,
+    MANIFEST_OBJECT_NAME,
+    EncryptingReader,
+    get_content_object_name,
+    get_encrypted_size,
+    get_encryption_key,
+    get_file_hash,
+)
 from base.task_helpers import parse_cron_schedule
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Q
 from huey import crontab
 from huey.contrib.djhuey import periodic_task
 from minio import Minio
+from minio.commonconfig import CopySource
 from pdf.models.pdf_models import Pdf
 from pdf.models.shared_pdf_models import SharedPdf
 
 logger = logging.getLogger('huey')
 
+# a failed upload of a file is retried without affecting the uploads of the other files
+UPLOAD_RETRIES = 3
+UPLOAD_RETRY_DELAY = 5
+# the interval in seconds in which the upload progress is logged
+PROGRESS_LOG_INTERVAL = 30
+# the key is set after verifying the manifest and expires after the verification interval
+VERIFICATION_CACHE_KEY = 'backup_manifest_verified'
+
 if settings.BACKUP_ENABLED:
     minio_client = Minio(
         endpoint=settings.BACKUP_ENDPOINT,
@@ -26,7 +51,7 @@ if settings.BACKUP_ENABLED:
 @periodic_task(crontab(**parse_cron_schedule(settings.BACKUP_SCHEDULE)), retries=3, retry_delay=60)
 def backup_task():  # pragma: no cover
     """
-    Periodic huey task for backing up the PDF and QR code files and (if used) the sqlite database.
+    Periodic huey task for backing up the PDF, QR code and other media files and (if used) the sqlite database.
     Backup will only be created if at least one user and one PDF are present in the database.
     """
 
@@ -47,8 +72,8 @@ def check_backup_requirements():
 
 def backup_function():
     """
-    Function for backing up the PDF and QR code files and (if used) the sqlite database. This is a separate function
-    in order to make the unit tests easier.
+    Function for backing up the PDF files, their thumbnails, previews and linearized copies, the QR code files and (if
+    used) the sqlite database. This is a separate function in order to make the unit tests easier.
     """
 
     logger.info('----------------------------------------------------')
@@ -71,22 +96,47 @@ def backup_function():
         add_file_to_minio(backup_path.name, backup_path.parent, encryption_key)
         backup_path.unlink()
 
-    # add new files to minio, delete deleted files from minio
-    to_be_added, to_be_deleted = difference_local_minio()
+    local_files = get_local_files()
+    legacy_objects = set()
+
+    if cache.get(VERIFICATION_CACHE_KEY) is None:
+        logger.info('Verifying the backup manifest')
+        legacy_objects = verify_manifest(local_files, encryption_key)
+        cache.set(VERIFICATION_CACHE_KEY, True, settings.BACKUP_VERIFICATION_INTERVAL * 60 * 60 * 24)
+
+    # add new and modified files to minio, delete deleted files from minio
+    to_be_added, to_be_refreshed, to_be_deleted = difference_local_manifest(local_files)
+    backed_up_hashes = set(BackupManifestEntry.objects.values_list('content_hash', flat=True))
+
+    # the content of identical files is only uploaded once. content that is already backed up is not uploaded again.
+    uploads = {}
+    for file_name, entry in sorted(to_be_added.items()):
+        if entry.content_hash not in backed_up_hashes:
+            uploads.setdefault(get_content_object_name(entry.content_hash, encryption_key), file_name)
 
-    logger.info(f'Need to backup {len(to_be_added)} files.')
+    logger.info(f'Need to backup {len(to_be_added)} files, {len(uploads)} of them need to be uploaded.')
     logger.info(f'Need to remove {len(to_be_deleted)} files from backup.')
 
-    for i, pdf_name in enumerate(to_be_added):
-        add_file_to_minio(pdf_name, settings.MEDIA_ROOT, encryption_key)
+    # files whose content did not change only need a new manifest entry
+    save_manifest_entries(to_be_refreshed)
 
-        if (i + 1) % 10 == 0:  # pragma: no cover
-            logger.info(f'Added {i + 1} / {len(to_be_added)} files')
+    failed_objects = upload_files_to_minio(uploads, settings.MEDIA_ROOT, encryption_key)
+    save_manifest_entries(
+        [
+            entry
+            for entry in to_be_added.values()
+            if get_content_object_name(entry.content_hash, encryption_key) not in failed_objects
+        ]
+    )
+    BackupManifestEntry.objects.filter(file_name__in=to_be_deleted).delete()
 
-    for i, pdf_name in enumerate(to_be_deleted):
-        minio_client.remove_object(settings.BACKUP_BUCKET_NAME, pdf_name)
-        if (i + 1) % 10 == 0:  # pragma: no cover
-            logger.info(f'Removed {i + 1} / {len(to_be_deleted)} files')
+    remove_backed_up_legacy_objects(legacy_objects)
+    remove_unreferenced_content(backed_up_hashes, encryption_key)
+    put_manifest_to_minio(encryption_key)
+
+    if failed_objects:
+        # fail the task, so that huey retries it. only the missing files will be uploaded again.
+        raise RuntimeError(f'Backup failed, {len(failed_objects)} files could not be uploaded.')
 
     logger.info('Backup completed successfully.')
     logger.info('----------------------------------------------------')
@@ -103,43 +153,340 @@ def backup_sqlite(db_path: Path, backup_path: Path):
     conn.close()
 
 
-def difference_local_minio() -> tuple[set[str], set[str]]:
+def get_local_files() -> dict[str, int | None]:
+    """
+    Get the names of the local files that need to be backed up: the PDFs, their thumbnails, previews and linearized
+    copies and the qr codes. The names of the PDF files are mapped to the revisions of the PDFs, the other files
+    have no revision.
+    """
+
+    local_files = {}
+
+    for file_name, revision, *artifact_names in Pdf.objects.values_list(
+        'file', 'revision', 'thumbnail', 'preview', 'linearized_file'
+    ):
+        local_files.update({artifact_name: None for artifact_name in artifact_names if artifact_name})
+
+        if file_name:
+            local_files[file_name] = revision
+
+    qr_codes = SharedPdf.objects.filter(
+        Q(deletion_date__isnull=True) | Q(deletion_date__gt=datetime.now(timezone.utc))
+    ).values_list('file', flat=True)
+    local_files.update({file_name: None for file_name in qr_codes if file_name})
+
+    return local_files
+
+
+def get_manifest_entry(file_name: str, revision: int | None) -> BackupManifestEntry:
+    """Get a new, unsaved manifest entry describing the current state of the local file."""
+
+    file_path = settings.MEDIA_ROOT / file_name
+    file_stat = file_path.stat()
+
+    return BackupManifestEntry(
+        content_hash=get_file_hash(file_path),
+        file_name=file_name,
+        modification_time=file_stat.st_mtime,
+        revision=revision,
+        size=file_stat.st_size,
+    )
+
+
+def difference_local_manifest(
+    local_files: dict[str, int | None],
+) -> tuple[dict[str, BackupManifestEntry], list[BackupManifestEntry], set[str]]:
+    """
+    Compare the local files to the backup manifest. Only files whose size, modification time or revision changed are
+    hashed.
+
+    Returns: - the new manifest entries of the files that need to be added to the minio bucket, as they are new or
+               their content was modified, e.g. a PDF was edited in the viewer.
+             - the new manifest entries of the files whose content did not change, e.g. the file was only touched.
+             - the names of the files that need to be removed from the bucket as they are no longer present on the
+               local system, e.g. a user has deleted a file.
+    """
+
+    manifest = {entry.file_name: entry for entry in BackupManifestEntry.objects.all()}
+    to_be_added = {}
+    to_be_refreshed = []
+
+    for file_name, revision in local_files.items():
+        entry = manifest.get(file_name)
+
+        try:
+            file_stat = (settings.MEDIA_ROOT / file_name).stat()
+        except FileNotFoundError:
+            logger.warning(f'{file_name} does not exist and cannot be backed up.')
+            continue
+
+        if entry and (entry.size, entry.modification_time, entry.revision) == (
+            file_stat.st_size,
+            file_stat.st_mtime,
+            revision,
+        ):
+            continue
+
+        new_entry = get_manifest_entry(file_name, revision)
+
+        if entry and entry.content_hash == new_entry.content_hash:
+            to_be_refreshed.append(new_entry)
+        else:
+            to_be_added[file_name] = new_entry
+
+    to_be_deleted = set(manifest).difference(local_files)
+
+    return to_be_added, to_be_refreshed, to_be_deleted
+
+
+def remove_unreferenced_content(previous_hashes: set[str], encryption_key: bytes):
+    """
+    Remove the content objects of the previously backed up hashes that are no longer referenced by any manifest entry,
+    e.g. because the files were deleted or modified.
     """
-    Compare the local PDF and qr code files to the files in the minio bucket.
 
-    Returns two sets: - one with the file names that need to be added to the minio bucket as they were recently uploaded
-                        by users.
-                    - and one with the names of the files that need to be removed from the bucket as they are no longer
-                      present on the local system, e.g. a user has deleted a file.
+    unreferenced_hashes = previous_hashes.difference(BackupManifestEntry.objects.values_list('content_hash', flat=True))
+
+    for i, content_hash in enumerate(sorted(unreferenced_hashes)):
+        minio_client.remove_object(settings.BACKUP_BUCKET_NAME, get_content_object_name(content_hash, encryption_key))
+        if (i + 1) % 10 == 0:  # pragma: no cover
+            logger.info(f'Removed {i + 1} / {len(unreferenced_hashes)} files')
+
+
+def remove_backed_up_legacy_objects(legacy_objects: set[str]) -> set[str]:
+    """
+    Remove the objects named like the files of backups created before the files were stored by their content hash.
+    An object is only removed once its file is backed up by a manifest entry, so that the backup never loses a file.
+    Returns the objects that were kept.
+    """
+
+    backed_up_objects = set(
+        BackupManifestEntry.objects.filter(file_name__in=legacy_objects).values_list('file_name', flat=True)
+    )
+
+    for object_name in sorted(backed_up_objects):
+        minio_client.remove_object(settings.BACKUP_BUCKET_NAME, object_name)
+
+    return legacy_objects.difference(backed_up_objects)
+
+
+def put_manifest_to_minio(encryption_key: bytes):
     """
+    Put the manifest mapping the names of the backed up files to their content hashes into the bucket, so that the files
+    can be recovered without the database, e.g. when using postgres.
+    """
+
+    manifest = dict(BackupManifestEntry.objects.values_list('file_name', 'content_hash'))
+    manifest_content = json.dumps({'version': 1, 'files': manifest}).encode()
 
-    set_of_local_pdf_files = {pdf.file.name for pdf in Pdf.objects.all()}
-    set_of_local_qr_codes = {shared_pdf.file.name for shared_pdf in SharedPdf.objects.all() if not shared_pdf.deleted}
-    set_of_local_files = set_of_local_pdf_files.union(set_of_local_qr_codes)
+    data, length = BytesIO(manifest_content), len(manifest_content)
 
-    set_of_minio_files = {
-        minio_object.object_name
+    if encryption_key:
+        data, length = EncryptingReader(encryption_key, data), get_encrypted_size(length)
+
+    minio_client.put_object(settings.BACKUP_BUCKET_NAME, MANIFEST_OBJECT_NAME, data, length)
+
+
+def save_manifest_entries(entries: list[BackupManifestEntry]):
+    """Save the manifest entries. Existing entries of the same files are replaced."""
+
+    BackupManifestEntry.objects.bulk_create(
+        entries,
+        update_conflicts=True,
+        unique_fields=['file_name'],
+        update_fields=['content_hash', 'modification_time', 'revision', 'size'],
+    )
+
+
+def verify_manifest(local_files: dict[str, int | None], encryption_key: bytes) -> set[str]:
+    """
+    Verify the backup manifest against the objects in the minio bucket. Entries whose content object is missing or does
+    not have the expected size are removed, so that their files are uploaded again. Content objects not referenced by
+    any entry are removed.
+
+    Backups created before the files were stored by their content hash contain objects named like the files. These
+    objects are copied to their content object, if the size of the local file matches, and are removed afterwards.
+    Objects that could not be copied are kept until their file is uploaded. Objects of missing local files are kept,
+    as they are the only remaining copy. Returns the kept objects.
+    """
+
+    def get_expected_object_size(file_size: int) -> int:
+        return get_encrypted_size(file_size) if encryption_key else file_size
+
+    def get_object_name(content_hash: str) -> str:
+        return get_content_object_name(content_hash, encryption_key)
+
+    manifest = {entry.file_name: entry for entry in BackupManifestEntry.objects.all()}
+    object_sizes = {
+        minio_object.object_name: minio_object.size
         for minio_object in minio_client.list_objects(settings.BACKUP_BUCKET_NAME, recursive=True)
-        if minio_object.object_name != settings.DATABASES['default']['BACKUP_NAME'].name
+        if minio_object.object_name not in [settings.DATABASES['default']['BACKUP_NAME'].name, MANIFEST_OBJECT_NAME]
     }
 
-    to_be_deleted = set_of_minio_files.difference(set_of_local_files)
-    to_be_added = set_of_local_files.difference(set_of_minio_files)
+    invalid_entries = [
+        file_name
+        for file_name, entry in manifest.items()
+        if object_sizes.get(get_object_name(entry.content_hash)) != get_expected_object_size(entry.size)
+    ]
+    BackupManifestEntry.objects.filter(file_name__in=invalid_entries).delete()
+
+    for file_name in invalid_entries:
+        del manifest[file_name]
+
+    new_entries = []
+    legacy_objects = set()
+
+    # the copied content objects are added to the object sizes while iterating
+    for object_name, object_size in list(object_sizes.items()):
+        if object_name.startswith(CONTENT_PREFIX):
+            continue
+
+        legacy_objects.add(object_name)
+
+        if object_name in local_files and object_name not in manifest and (settings.MEDIA_ROOT / object_name).is_file():
+            entry = get_manifest_entry(object_name, local_files[object_name])
+            content_object_name = get_object_name(entry.content_hash)
+
+            if get_expected_object_size(entry.size) == object_size:
+                if content_object_name not in object_sizes:
+                    minio_client.copy_object(
+                        settings.BACKUP_BUCKET_NAME,
+                        content_object_name,
+                        CopySource(settings.BACKUP_BUCKET_NAME, object_name),
+                    )
+                    object_sizes[content_object_name] = object_size
+
+                new_entries.append(entry)
+
+    save_manifest_entries(new_entries)
+    legacy_objects = remove_backed_up_legacy_objects(legacy_objects)
+
+    referenced_content = {
+        get_object_name(content_hash)
+        for content_hash in BackupManifestEntry.objects.values_list('content_hash', flat=True)
+    }
+
+    for object_name in object_sizes:
+        if object_name.startswith(CONTENT_PREFIX) and object_name not in referenced_content:
+            minio_client.remove_object(settings.BACKUP_BUCKET_NAME, object_name)
+
+    logger.info(
+        f'Verified the backup manifest: {len(invalid_entries)} invalid entries removed, {len(new_entries)} entries '
+        f'added, {len(legacy_objects)} legacy objects kept.'
+    )
 
-    return to_be_added, to_be_deleted
+    return legacy_objects
 
 
-def add_file_to_minio(file_name: str, parent_path: Path, encryption_key: bytes):
+class UploadProgress:
+    """Track the progress of the backup uploads and periodically log it together with the throughput."""
+
+    def __init__(self, number_of_files: int):
+        self.number_of_files = number_of_files
+        self.uploaded_files = 0
+        self.uploaded_bytes = 0
+        self.start_time = time.monotonic()
+        self.last_log_time = self.start_time
+
+    def add(self, file_size: int):
+        """Add an uploaded file. The progress is logged, if the log interval has passed since the last log."""
+
+        self.uploaded_files += 1
+        self.uploaded_bytes += file_size
+
+        if time.monotonic() - self.last_log_time >= PROGRESS_LOG_INTERVAL:
+            self.log()
+
+    def log(self):
+        """Log the number of uploaded files and the throughput in files/s and MB/s."""
+
+        self.last_log_time = time.monotonic()
+        # avoid a division by zero, if nothing needed to be uploaded
+        elapsed_time = max(self.last_log_time - self.start_time, 1e-6)
+        uploaded_mb = self.uploaded_bytes / 1e6
+
+        logger.info(
+            f'Added {self.uploaded_files} / {self.number_of_files} files ({uploaded_mb:.1f} MB) '
+            f'in {elapsed_time:.0f} s: {self.uploaded_files / elapsed_time:.2f} files/s, '
+            f'{uploaded_mb / elapsed_time:.2f} MB/s'
+        )
+
+
+def upload_files_to_minio(uploads: dict[str, str], parent_path: Path, encryption_key: bytes) -> list[str]:
+    """
+    Upload the files to minio using a bounded thread pool. All threads share the minio client. The uploads map the
+    object names to the file names. Returns the names of the objects that could not be uploaded.
+    """
+
+    progress = UploadProgress(len(uploads))
+    failed_objects = []
+
+    with ThreadPoolExecutor(max_workers=settings.BACKUP_UPLOAD_WORKERS) as executor:
+        futures = {
+            executor.submit(add_file_to_minio_with_retries, file_name, parent_path, encryption_key, object_name): (
+                object_name
+            )
+            for object_name, file_name in uploads.items()
+        }
+
+        for future in as_completed(futures):
+            try:
+                progress.add(future.result())
+            except Exception as e:  # nosec # noqa
+                logger.error(f'Could not add {uploads[futures[future]]} to the backup: {e}')
+                failed_objects.append(futures[future])
+
+    progress.log()
+
+    return failed_objects
+
+
+def add_file_to_minio_with_retries(
+    file_name: str, parent_path: Path, encryption_key: bytes, object_name: str = ''
+) -> int:
+    """Add a file to minio. Failed uploads are retried with an increasing delay. Returns the size of the file."""
+
+    for attempt in range(1, UPLOAD_RETRIES + 1):
+        try:
+            add_file_to_minio(file_name, parent_path, encryption_key, object_name)
+            break
+        except Exception as e:
+            if attempt == UPLOAD_RETRIES:
+                raise
+
+            logger.warning(f'Adding {file_name} failed ({e}), retrying in {UPLOAD_RETRY_DELAY * attempt} s')
+            time.sleep(UPLOAD_RETRY_DELAY * attempt)
+
+    return (parent_path / file_name).stat().st_size
+
+
+def add_file_to_minio(file_name: str, parent_path: Path, encryption_key: bytes, object_name: str = ''):
     """
-    Add a file to minio. If an encryption key is provided the file will be encrypted beforehand using cryptography's
-    fernet algorithm. Otherwise, the unchanged file will be added.
+    Add a file to minio. If an encryption key is provided the file will be encrypted in chunks with AES-GCM while it is
+    uploaded. Otherwise, the unchanged file will be added. Files larger than the part size are uploaded in multiple
+    parts. If no object name is provided, the file name is used.
     """
 
+    file_path = parent_path / file_name
+    object_name = object_name or file_name
+
+    # the parts of a file are uploaded one after another, as minio would otherwise read the whole file into memory if
+    # reading is faster than uploading. the files themselves are uploaded in parallel.
     if encryption_key:
-        # encrypt the file, add it to minio, delete the local tmp file
-        encrypted_file_path = Path(__file__).parent / 'tmp_encrypted'
-        encrypt_file(encryption_key, parent_path / file_name, encrypted_file_path)
-        minio_client.fput_object(settings.BACKUP_BUCKET_NAME, file_name, str(encrypted_file_path))
-        encrypted_file_path.unlink()
+        with open(file_path, 'rb') as file:
+            minio_client.put_object(
+                settings.BACKUP_BUCKET_NAME,
+                object_name,
+                EncryptingReader(encryption_key, file),
+                get_encrypted_size(file_path.stat().st_size),
+                part_size=settings.BACKUP_PART_SIZE,
+                num_parallel_uploads=1,
+            )
     else:
-        minio_client.fput_object(settings.BACKUP_BUCKET_NAME, file_name, str(parent_path / file_name))
+        minio_client.fput_object(
+            settings.BACKUP_BUCKET_NAME,
+            object_name,
+            str(file_path),
+            part_size=settings.BACKUP_PART_SIZE,
+            num_parallel_uploads=1,
+        )
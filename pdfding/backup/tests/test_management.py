@@ -1,29 +1,72 @@
+import hashlib
+from io import BytesIO
 from pathlib import Path
+from shutil import rmtree
 from unittest import mock
 
-from backup.management.commands.recover_data import Command
+from backup.management.commands.recover_data import RECOVERY_JOURNAL_NAME, Command, Recovery, RecoveryJournal
+from backup.service import EncryptingReader, get_content_object_name
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet
 from django.conf import settings
 from django.core.management import call_command
-from django.test import TestCase
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from minio.error import S3Error
 
 
+data_path = Path(__file__).parent / 'data'
+
+
+def write_object_name(obj_name: str, target_path: Path, encryption_key: bytes):
+    """
+    Side effect of the mocked get_file_from_minio, which writes the object name into the target file. The database
+    backup is skipped, so that the database used by the tests stays untouched.
+    """
+
+    if target_path != settings.DATABASES['default']['BACKUP_NAME']:
+        target_path.parent.mkdir(parents=True, exist_ok=True)
+        target_path.write_bytes(obj_name.encode())
+
+
+@override_settings(DATA_DIR=data_path, MEDIA_ROOT=data_path / 'media')
 class TestRecoverData(
     TestCase,
 ):
-    mock_object_1 = mock.Mock()
+    mock_object_1 = mock.Mock(etag='etag_1', size=11)
     mock_object_1.object_name = 'pdf_1.pdf'
-    mock_object_2 = mock.Mock()
+    mock_object_2 = mock.Mock(etag='etag_2', size=22)
     mock_object_2.object_name = 'backup.sqlite3'
 
     mock_objects = [mock_object_1, mock_object_2]
 
+    def setUp(self):
+        data_path.mkdir()
+
+    @staticmethod
+    def get_mock_object(object_name: str, size: int = 1) -> mock.Mock:
+        mock_object = mock.Mock(etag=f'etag_{object_name}', size=size)
+        mock_object.object_name = object_name
+
+        return mock_object
+
+    def tearDown(self):
+        rmtree(data_path, ignore_errors=True)
+
+    @mock.patch('backup.management.commands.recover_data.Command.get_manifest_from_minio', return_value=None)
     @mock.patch('backup.management.commands.recover_data.Minio.list_objects', return_value=mock_objects)
     @mock.patch('backup.management.commands.recover_data.Path.rename')
     @mock.patch('backup.management.commands.recover_data.Command.get_file_from_minio')
     @mock.patch('backup.management.commands.recover_data.get_encryption_key', return_value=b'key')
     @mock.patch('builtins.input', return_value='y')
     def test_recover_data(
-        self, mock_input, mock_get_encryption_key, mock_get_file_from_minio, mock_rename, mock_list_objects
+        self,
+        mock_input,
+        mock_get_encryption_key,
+        mock_get_file_from_minio,
+        mock_rename,
+        mock_list_objects,
+        mock_get_manifest_from_minio,
     ):
         call_command('recover_data')
 
@@ -33,25 +76,312 @@ class TestRecoverData(
         self.assertEqual(mock_get_file_from_minio.call_count, 2)
         mock_get_file_from_minio.assert_has_calls(
             [
-                mock.call('backup.sqlite3', Path(__file__).parents[2] / 'db', b'key'),
-                mock.call('pdf_1.pdf', Path(__file__).parents[2] / 'media', b'key'),
+                mock.call('backup.sqlite3', Path(__file__).parents[2] / 'db' / 'backup.sqlite3', b'key'),
+                mock.call('pdf_1.pdf', data_path / 'media' / 'pdf_1.pdf', b'key'),
+            ],
+        )
+        # the journal is removed after a successful recovery
+        self.assertFalse((data_path / RECOVERY_JOURNAL_NAME).exists())
+
+    @mock.patch('backup.management.commands.recover_data.Command.get_manifest_from_minio')
+    @mock.patch('backup.management.commands.recover_data.Minio.list_objects')
+    @mock.patch('backup.management.commands.recover_data.Path.rename')
+    @mock.patch('backup.management.commands.recover_data.Command.get_file_from_minio')
+    @mock.patch('backup.management.commands.recover_data.get_encryption_key', return_value=b'key')
+    @mock.patch('builtins.input', return_value='y')
+    def test_recover_data_manifest(
+        self,
+        mock_input,
+        mock_get_encryption_key,
+        mock_get_file_from_minio,
+        mock_rename,
+        mock_list_objects,
+        mock_get_manifest_from_minio,
+    ):
+        mock_get_file_from_minio.side_effect = write_object_name
+        mock_get_manifest_from_minio.return_value = {
+            '1/pdf_1.pdf': get_hash(b'content/hash_1'),
+            '2/pdf_2.pdf': get_hash(b'content/hash_1'),
+        }
+
+        mock_list_objects.return_value = [
+            self.get_mock_object(object_name)
+            for object_name in ['content/hash_1', 'manifest.json', 'backup.sqlite3', '1/pdf_1.pdf', '3/orphan.pdf']
+        ]
+
+        with mock.patch(
+            'backup.management.commands.recover_data.get_content_object_name', return_value='content/hash_1'
+        ):
+            call_command('recover_data', workers=2)
+
+        # the database, the content shared by both pdfs and the legacy object without manifest entry are downloaded
+        self.assertEqual(mock_get_file_from_minio.call_count, 3)
+        self.assertEqual((data_path / 'media' / '2' / 'pdf_2.pdf').read_bytes(), b'content/hash_1')
+        self.assertEqual((data_path / 'media' / '3' / 'orphan.pdf').read_bytes(), b'3/orphan.pdf')
+        self.assertFalse((data_path / RECOVERY_JOURNAL_NAME).exists())
+
+    @mock.patch('backup.management.commands.recover_data.Minio.list_objects', return_value=[])
+    @mock.patch('backup.management.commands.recover_data.Command.get_manifest_from_minio')
+    @mock.patch('backup.management.commands.recover_data.Path.rename')
+    @mock.patch('backup.management.commands.recover_data.Command.get_file_from_minio')
+    @mock.patch('backup.management.commands.recover_data.get_encryption_key', return_value=None)
+    @mock.patch('builtins.input', return_value='y')
+    def test_recover_data_failure(
+        self,
+        mock_input,
+        mock_get_encryption_key,
+        mock_get_file_from_minio,
+        mock_rename,
+        mock_get_manifest_from_minio,
+        mock_list_objects,
+    ):
+        mock_get_file_from_minio.side_effect = write_object_name
+        # the content of pdf 2 does not match its hash
+        mock_get_manifest_from_minio.return_value = {
+            '1/pdf_1.pdf': get_hash(b'content/hash_1'),
+            '2/pdf_2.pdf': 'hash_2',
+        }
+
+        with mock.patch(
+            'backup.management.commands.recover_data.get_content_object_name',
+            side_effect=lambda content_hash, encryption_key: 'content/hash_1',
+        ):
+            with self.assertRaisesMessage(CommandError, '1 files could not be recovered.'):
+                call_command('recover_data')
+
+            self.assertFalse((data_path / 'media' / '2' / 'pdf_2.pdf').exists())
+            # the journal is kept, so that the next run only recovers the failed file
+            self.assertEqual(
+                RecoveryJournal(data_path / RECOVERY_JOURNAL_NAME).load(),
+                {'1/pdf_1.pdf': get_hash(b'content/hash_1')},
+            )
+
+            mock_get_file_from_minio.reset_mock()
+            mock_get_manifest_from_minio.return_value['2/pdf_2.pdf'] = get_hash(b'content/hash_1')
+            call_command('recover_data')
+
+        # the already recovered pdf is copied instead of downloading the content again
+        self.assertEqual(mock_get_file_from_minio.call_count, 1)
+        self.assertEqual((data_path / 'media' / '2' / 'pdf_2.pdf').read_bytes(), b'content/hash_1')
+
+    def test_recover_data_invalid_workers(self):
+        with self.assertRaisesMessage(CommandError, 'The number of workers needs to be at least 1.'):
+            call_command('recover_data', workers=0)
+
+    @mock.patch('backup.management.commands.recover_data.Minio.list_objects', return_value=[])
+    @mock.patch('backup.management.commands.recover_data.Command.get_manifest_from_minio')
+    @mock.patch('backup.management.commands.recover_data.Command.get_file_from_minio')
+    @mock.patch('backup.management.commands.recover_data.get_encryption_key', return_value=None)
+    @mock.patch('builtins.input')
+    def test_recover_data_dry_run(
+        self,
+        mock_input,
+        mock_get_encryption_key,
+        mock_get_file_from_minio,
+        mock_get_manifest_from_minio,
+        mock_list_objects,
+    ):
+        mock_get_manifest_from_minio.return_value = {
+            '1/pdf_1.pdf': 'hash_1',
+            '2/pdf_2.pdf': 'hash_1',
+            '3/pdf_3.pdf': 'hash_2',
+            '4/pdf_4.pdf': 'hash_3',
+        }
+        # pdf 1 and pdf 4 were recovered by an interrupted recovery
+        for file_name, content_hash in [('1/pdf_1.pdf', 'hash_1'), ('4/pdf_4.pdf', 'hash_3')]:
+            write_object_name(content_hash, data_path / 'media' / file_name, None)
+            RecoveryJournal(data_path / RECOVERY_JOURNAL_NAME).add(file_name, content_hash)
+
+        with self.assertLogs('management', level='INFO') as cm:
+            call_command('recover_data', dry_run=True)
+
+        self.assertEqual(
+            cm.output,
+            [
+                'INFO:management:Would recover the database from backup.sqlite3',
+                'INFO:management:Would copy 1/pdf_1.pdf to 2/pdf_2.pdf',
+                'INFO:management:Would download content/hash_2 to 3/pdf_3.pdf',
+                'INFO:management:Would recover 2 of 4 files with 1 downloads, 2 files are already recovered.',
             ],
         )
+        mock_input.assert_not_called()
+        mock_get_file_from_minio.assert_not_called()
+
+    @mock.patch('backup.management.commands.recover_data.Minio.list_objects', return_value=mock_objects)
+    @mock.patch('backup.management.commands.recover_data.Command.get_manifest_from_minio', return_value=None)
+    def test_get_recoveries_legacy(self, mock_get_manifest_from_minio, mock_list_objects):
+        # unencrypted objects are verified by their size
+        self.assertEqual(Command.get_recoveries(None), [Recovery('pdf_1.pdf', ['pdf_1.pdf'], 'etag_1', size=11)])
+        self.assertEqual(Command.get_recoveries(b'key'), [Recovery('pdf_1.pdf', ['pdf_1.pdf'], 'etag_1')])
+
+    @mock.patch('backup.management.commands.recover_data.Minio.list_objects', return_value=[])
+    @mock.patch(
+        'backup.management.commands.recover_data.Command.get_manifest_from_minio',
+        return_value={'2/pdf_2.pdf': 'hash_1', '1/pdf_1.pdf': 'hash_1', '3/pdf_3.pdf': 'hash_2'},
+    )
+    def test_get_recoveries_manifest(self, mock_get_manifest_from_minio, mock_list_objects):
+        for encryption_key in [None, Fernet.generate_key()]:
+            self.assertEqual(
+                Command.get_recoveries(encryption_key),
+                [
+                    Recovery(
+                        get_content_object_name('hash_1', encryption_key),
+                        ['1/pdf_1.pdf', '2/pdf_2.pdf'],
+                        'hash_1',
+                        content_hash='hash_1',
+                    ),
+                    Recovery(
+                        get_content_object_name('hash_2', encryption_key),
+                        ['3/pdf_3.pdf'],
+                        'hash_2',
+                        content_hash='hash_2',
+                    ),
+                ],
+            )
+
+    @mock.patch('backup.management.commands.recover_data.Minio.list_objects')
+    @mock.patch(
+        'backup.management.commands.recover_data.Command.get_manifest_from_minio',
+        return_value={'1/pdf_1.pdf': 'hash_1', '2/pdf_2.pdf': 'hash_2'},
+    )
+    def test_get_recoveries_manifest_and_legacy_objects(self, mock_get_manifest_from_minio, mock_list_objects):
+        mock_list_objects.return_value = [
+            self.get_mock_object(object_name, size)
+            for object_name, size in [
+                ('content/hash_1', 1),
+                ('content/unreferenced', 2),
+                ('manifest.json', 3),
+                ('backup.sqlite3', 4),
+                # the legacy object of pdf 1 is not needed, as pdf 1 is backed up by its content
+                ('1/pdf_1.pdf', 5),
+                # the legacy object of a pdf whose local file was lost is its only copy
+                ('3/pdf_3.pdf', 6),
+                ('3/thumbnails/pdf_3.png', 7),
+            ]
+        ]
+
+        self.assertEqual(
+            Command.get_recoveries(None),
+            [
+                Recovery('content/hash_1', ['1/pdf_1.pdf'], 'hash_1', content_hash='hash_1'),
+                Recovery('content/hash_2', ['2/pdf_2.pdf'], 'hash_2', content_hash='hash_2'),
+                Recovery('3/pdf_3.pdf', ['3/pdf_3.pdf'], 'etag_3/pdf_3.pdf', size=6),
+                Recovery('3/thumbnails/pdf_3.png', ['3/thumbnails/pdf_3.png'], 'etag_3/thumbnails/pdf_3.png', size=7),
+            ],
+        )
+
+    def test_verify_file(self):
+        file_path = data_path / 'pdf_1.pdf'
+
+        for recovery in [
+            Recovery('content/hash', ['pdf_1.pdf'], 'version', content_hash=get_hash(b'content')),
+            Recovery('pdf_1.pdf', ['pdf_1.pdf'], 'version', size=7),
+        ]:
+            write_object_name('content', file_path, None)
+            Command.verify_file(file_path, recovery)
+
+        for recovery, message in [
+            (
+                Recovery('content/hash', ['pdf_1.pdf'], 'version', content_hash='hash'),
+                'does not match its content hash',
+            ),
+            (Recovery('pdf_1.pdf', ['pdf_1.pdf'], 'version', size=8), 'does not match the size'),
+        ]:
+            write_object_name('content', file_path, None)
+
+            with self.assertRaisesMessage(ValueError, message):
+                Command.verify_file(file_path, recovery)
+
+            # invalid files are removed
+            self.assertFalse(file_path.exists())
+
+    def test_recovery_journal(self):
+        journal = RecoveryJournal(data_path / RECOVERY_JOURNAL_NAME)
+        self.assertEqual(journal.load(), {})
+
+        journal.add('1/pdf_1.pdf', 'hash_1')
+        journal.add('2/pdf_2.pdf', 'hash_2')
+        journal.add('1/pdf_1.pdf', 'hash_3')
+
+        # simulate a recovery that was interrupted while writing to the journal
+        with open(journal.path, 'a') as journal_file:
+            journal_file.write('{"file_name": "3/pdf')
+
+        self.assertEqual(journal.load(), {'1/pdf_1.pdf': 'hash_3', '2/pdf_2.pdf': 'hash_2'})
+
+        journal.remove()
+        self.assertFalse(journal.path.exists())
+
+    @mock.patch('backup.management.commands.recover_data.Minio.get_object')
+    def test_get_manifest_from_minio(self, mock_get_object):
+        encryption_key = Fernet.generate_key()
+        manifest_content = b'{"version": 1, "files": {"1/pdf_1.pdf": "hash_1"}}'
+
+        for key, content in [
+            (None, manifest_content),
+            (encryption_key, EncryptingReader(encryption_key, BytesIO(manifest_content)).read()),
+        ]:
+            mock_get_object.return_value = self.get_mock_response(content)
+
+            self.assertEqual(Command.get_manifest_from_minio(key), {'1/pdf_1.pdf': 'hash_1'})
+            mock_get_object.assert_called_with('pdfding', 'manifest.json')
+            mock_get_object.return_value.release_conn.assert_called_once_with()
+
+    @mock.patch('backup.management.commands.recover_data.Minio.get_object')
+    def test_get_manifest_from_minio_missing(self, mock_get_object):
+        mock_get_object.side_effect = S3Error(mock.Mock(), 'NoSuchKey', 'missing', 'manifest.json', '1', '1')
+
+        self.assertIsNone(Command.get_manifest_from_minio(None))
+
+        mock_get_object.side_effect = S3Error(mock.Mock(), 'AccessDenied', 'denied', 'manifest.json', '1', '1')
+
+        with self.assertRaises(S3Error):
+            Command.get_manifest_from_minio(None)
 
     @mock.patch('backup.management.commands.recover_data.Minio.fget_object')
     def test_get_file_from_minio_no_encryption(self, mock_fget_object):
-        Command.get_file_from_minio('file_name', Path('path'), None)
+        Command.get_file_from_minio('file_name', Path('path/file_name'), None)
 
         mock_fget_object.assert_called_with('pdfding', 'file_name', 'path/file_name')
 
-    @mock.patch('backup.tasks.Path.unlink')
-    @mock.patch('backup.management.commands.recover_data.decrypt_file')
-    @mock.patch('backup.management.commands.recover_data.Minio.fget_object')
-    def test_get_file_from_minio_with_encryption(self, mock_fput_object, mock_decrypt_file, mock_unlink):
-        Command.get_file_from_minio('file_name', Path('path'), b'key')
+    @mock.patch('backup.management.commands.recover_data.Minio.get_object')
+    def test_get_file_from_minio_with_encryption(self, mock_get_object):
+        encryption_key = Fernet.generate_key()
+        mock_get_object.return_value = self.get_mock_response(
+            EncryptingReader(encryption_key, BytesIO(b'pdf content')).read()
+        )
+        target_parent_path = data_path
+
+        Command.get_file_from_minio('1/pdf_1.pdf', target_parent_path / '1' / 'pdf_1.pdf', encryption_key)
+
+        self.assertEqual((target_parent_path / '1' / 'pdf_1.pdf').read_bytes(), b'pdf content')
+
+        mock_get_object.assert_called_with('pdfding', '1/pdf_1.pdf')
+        mock_get_object.return_value.close.assert_called_once_with()
+        mock_get_object.return_value.release_conn.assert_called_once_with()
+
+    @mock.patch('backup.management.commands.recover_data.Minio.get_object')
+    def test_get_file_from_minio_with_encryption_failure(self, mock_get_object):
+        encrypted = EncryptingReader(Fernet.generate_key(), BytesIO(b'pdf content')).read()
+        mock_get_object.return_value = self.get_mock_response(encrypted)
+        target_parent_path = data_path
+
+        # decrypting with another key fails
+        with self.assertRaises(InvalidTag):
+            Command.get_file_from_minio('pdf_1.pdf', target_parent_path / 'pdf_1.pdf', Fernet.generate_key())
+
+        # no partially decrypted file is left behind
+        self.assertFalse((target_parent_path / 'pdf_1.pdf').exists())
+
+        mock_get_object.return_value.release_conn.assert_called_once_with()
+
+    @staticmethod
+    def get_mock_response(content: bytes) -> mock.Mock:
+        response = mock.Mock()
+        response.read = BytesIO(content).read
+
+        return response
 
-        tmp_file_path = Path(__file__).parents[1] / 'management' / 'commands' / 'tmp_encrypted'
 
-        mock_fput_object.assert_called_with('pdfding', 'file_name', str(tmp_file_path))
-        mock_decrypt_file.assert_called_with(b'key', tmp_file_path, Path('path/file_name'))
-        mock_unlink.assert_called_with()
+def get_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
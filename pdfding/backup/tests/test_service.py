@@ -1,8 +1,13 @@
 import base64
+import hashlib
+import struct
+from io import BytesIO
 from pathlib import Path
 from unittest import mock
 
 from backup import service
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet
 from django.test import TestCase
 
 
@@ -10,10 +15,6 @@ class TestEncryption(TestCase):
     mock_pbk_object = mock.Mock()
     mock_pbk_object.derive = lambda x: b'generated_key'
 
-    mock_fernet_object = mock.Mock()
-    mock_fernet_object.encrypt = lambda x: x + b'encrypted'
-    mock_fernet_object.decrypt = lambda x: x + b'decrypted'
-
     def test_get_encryption_key_disabled(self):
         self.assertEqual(service.get_encryption_key(False, 'pw', 'salt'), None)
 
@@ -35,32 +36,122 @@ class TestEncryption(TestCase):
 
         self.assertEqual(generated_key, base64.urlsafe_b64encode(b'generated_key'))
 
-    @mock.patch('backup.service.Fernet', return_value=mock_fernet_object)
-    def test_encrypt_file(self, mock_fernet):
-        parent_path = Path(__file__).parent
-        tmp_file_path = parent_path / 'tmp'
+    def test_get_file_hash(self):
+        file_path = Path(__file__).parent / '__init__.py'
+
+        self.assertEqual(service.get_file_hash(file_path), hashlib.sha256(file_path.read_bytes()).hexdigest())
+
+
+class TestChunkedEncryption(TestCase):
+    encryption_key = Fernet.generate_key()
+
+    def test_get_content_object_name(self):
+        self.assertEqual(service.get_content_object_name('hash', None), 'content/hash')
+
+    def test_get_content_object_name_encrypted(self):
+        object_name = service.get_content_object_name('hash', self.encryption_key)
+
+        # the name does not reveal the content hash, but is the same for the same hash and key
+        self.assertTrue(object_name.startswith('content/'))
+        self.assertNotIn('hash', object_name)
+        self.assertEqual(object_name, service.get_content_object_name('hash', self.encryption_key))
+        self.assertNotEqual(object_name, service.get_content_object_name('other', self.encryption_key))
+        self.assertNotEqual(object_name, service.get_content_object_name('hash', Fernet.generate_key()))
+
+    def test_encrypt_and_decrypt(self):
+        chunk_size = service.ENCRYPTION_CHUNK_SIZE
+
+        for file_size in [0, 1, chunk_size - 1, chunk_size, chunk_size + 1, 3 * chunk_size + 5]:
+            content = bytes(i % 256 for i in range(file_size))
+            encrypted = self.encrypt(content)
+
+            self.assertEqual(len(encrypted), service.get_encrypted_size(file_size))
+            self.assertTrue(encrypted.startswith(service.ENCRYPTION_MAGIC))
+            self.assertEqual(self.decrypt(encrypted), content)
+
+    def test_encrypting_reader_read_in_parts(self):
+        content = 200_000 * b'a'
+        reader = service.EncryptingReader(self.encryption_key, BytesIO(content))
+
+        # read in parts of sizes not matching the chunk size, like minio reading the parts of a multipart upload
+        parts = []
+        while part := reader.read(70_000):
+            parts.append(part)
+
+        self.assertTrue(all(len(part) == 70_000 for part in parts[:-1]))
+        self.assertEqual(self.decrypt(b''.join(parts)), content)
+
+    def test_encrypting_reader_random_nonce(self):
+        self.assertNotEqual(self.encrypt(b'content'), self.encrypt(b'content'))
+
+    def test_decrypt_legacy_fernet(self):
+        encrypted = Fernet(self.encryption_key).encrypt(b'legacy content')
+
+        self.assertEqual(self.decrypt(encrypted), b'legacy content')
+
+    def test_decrypt_tampered(self):
+        encrypted = bytearray(self.encrypt(3 * service.ENCRYPTION_CHUNK_SIZE * b'a'))
+        encrypted[service.HEADER_SIZE + 10] ^= 1
+
+        with self.assertRaises(InvalidTag):
+            self.decrypt(bytes(encrypted))
+
+    def test_decrypt_truncated(self):
+        chunk_size = service.ENCRYPTION_CHUNK_SIZE
+        encrypted = self.encrypt(3 * chunk_size * b'a')
+
+        # remove the last chunk, the new last chunk was not encrypted as last chunk
+        for truncated in [encrypted[: service.HEADER_SIZE + 2 * (chunk_size + service.TAG_SIZE)], encrypted[:-1]]:
+            with self.assertRaises(InvalidTag):
+                self.decrypt(truncated)
+
+    def test_decrypt_wrong_key(self):
+        encrypted = self.encrypt(b'content')
+
+        with self.assertRaises(InvalidTag):
+            service.decrypt_stream(Fernet.generate_key(), BytesIO(encrypted), BytesIO())
+
+    def test_decrypt_unsupported_version(self):
+        encrypted = bytearray(self.encrypt(b'content'))
+        encrypted[len(service.ENCRYPTION_MAGIC)] = 2
+
+        with self.assertRaisesMessage(ValueError, 'Encryption format version 2 is not supported.'):
+            self.decrypt(bytes(encrypted))
+
+    @mock.patch('backup.service.read_exactly', wraps=service.read_exactly)
+    def test_decrypt_unsupported_chunk_size(self, mock_read_exactly):
+        encrypted = self.encrypt(b'content')
+        chunk_size_offset = len(service.ENCRYPTION_MAGIC) + 1
+
+        for chunk_size in [0, service.MAX_ENCRYPTION_CHUNK_SIZE + 1, 2**32 - 1]:
+            mock_read_exactly.reset_mock()
+            tampered = bytearray(encrypted)
+            struct.pack_into('>I', tampered, chunk_size_offset, chunk_size)
 
-        service.encrypt_file(b'key', parent_path / '__init__.py', tmp_file_path)
+            with self.assertRaisesMessage(ValueError, f'Encryption chunk size {chunk_size} is not supported.'):
+                self.decrypt(bytes(tampered))
 
-        with open(tmp_file_path, 'rb') as file:
-            tmp_file_contents = file.read()
+            # only the header was read, no chunk
+            self.assertEqual(mock_read_exactly.call_count, 2)
 
-        # delete the tmp file
-        tmp_file_path.unlink()
+    def test_decrypt_incomplete_header(self):
+        encrypted = self.encrypt(b'content')
 
-        self.assertEqual(tmp_file_contents, b'"""some content for encryption test"""\nencrypted')
+        with self.assertRaisesMessage(ValueError, 'The encryption header is incomplete.'):
+            self.decrypt(encrypted[: service.HEADER_SIZE - 1])
 
-    @mock.patch('backup.service.Fernet', return_value=mock_fernet_object)
-    def test_decrypt_file(self, mock_fernet):
-        parent_path = Path(__file__).parent
-        tmp_file_path = parent_path / 'tmp'
+    def test_read_exactly(self):
+        source = mock.Mock()
+        source.read.side_effect = [b'ab', b'cd', b'e', b'']
 
-        service.decrypt_file(b'key', parent_path / '__init__.py', tmp_file_path)
+        self.assertEqual(service.read_exactly(source, 4), b'abcd')
+        self.assertEqual(service.read_exactly(source, 4), b'e')
 
-        with open(tmp_file_path, 'rb') as file:
-            tmp_file_contents = file.read()
+    def encrypt(self, content: bytes) -> bytes:
+        return service.EncryptingReader(self.encryption_key, BytesIO(content)).read()
 
-        # delete the tmp file
-        tmp_file_path.unlink()
+    def decrypt(self, encrypted: bytes) -> bytes:
+        target = BytesIO()
+        service.decrypt_stream(self.encryption_key, BytesIO(encrypted), target)
 
-        self.assertEqual(tmp_file_contents, b'"""some content for encryption test"""\ndecrypted')
+        return target.getvalue()
@@ -1,35 +1,34 @@
+import json
 import sqlite3
 from datetime import datetime, timedelta, timezone
+from io import BytesIO
 from pathlib import Path
+from shutil import rmtree
 from unittest import mock
 
 from allauth.account.models import EmailAddress
 from backup import tasks
+from backup.models import BackupManifestEntry
+from backup.service import decrypt_stream, get_content_object_name, get_encrypted_size, get_file_hash
+from cryptography.fernet import Fernet
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 from pdf.models.pdf_models import Pdf, Tag
 from pdf.models.shared_pdf_models import SharedPdf
 
 
-class TestPeriodicBackup(TestCase):
-    mock_objects = []
-    for i in range(4, 9):
-        mock_object = mock.Mock()
-        mock_object.object_name = f'1/pdf_{i}.pdf'
-        mock_objects.append(mock_object)
-    for i in range(3):
-        mock_object = mock.Mock()
-        mock_object.object_name = f'2/pdf_{i}{i}.pdf'
-        mock_objects.append(mock_object)
+ENCRYPTION_KEY = Fernet.generate_key()
+
+
+def get_dummy_manifest_entry(file_name: str, content_hash: str = 'hash') -> BackupManifestEntry:
+    return BackupManifestEntry(file_name=file_name, content_hash=content_hash, modification_time=1, size=1)
 
-    for i in range(1, 3):
-        mock_object = mock.Mock()
-        mock_object.object_name = f'{i}/qr/qr_{i}.svg'
-        mock_objects.append(mock_object)
 
-    mock_object = mock.Mock()
-    mock_object.object_name = 'backup.sqlite3'
+class TestPeriodicBackup(TestCase):
+    def setUp(self):
+        cache.clear()
 
     def test_check_backup_requirements_empty_db(self):
         self.assertFalse(tasks.check_backup_requirements())
@@ -45,10 +44,14 @@ class TestPeriodicBackup(TestCase):
 
         self.assertTrue(tasks.check_backup_requirements())
 
+    @mock.patch('backup.tasks.put_manifest_to_minio')
     @mock.patch('backup.tasks.Minio.remove_object')
-    @mock.patch('backup.tasks.difference_local_minio', return_value=({'add_1.pdf', 'add_2.pdf'}, {'remove.pdf'}))
+    @mock.patch('backup.tasks.difference_local_manifest')
+    @mock.patch('backup.tasks.verify_manifest', return_value={'add_1.pdf', 'orphan.pdf'})
+    @mock.patch('backup.tasks.get_local_files', return_value={'add_1.pdf': 1})
+    @mock.patch('backup.tasks.upload_files_to_minio', return_value=[])
     @mock.patch('backup.tasks.add_file_to_minio')
-    @mock.patch('backup.tasks.get_encryption_key', return_value=b'key')
+    @mock.patch('backup.tasks.get_encryption_key', return_value=ENCRYPTION_KEY)
     @mock.patch('backup.tasks.Minio.make_bucket')
     @mock.patch('backup.tasks.Minio.bucket_exists', return_value=False)
     def test_backup_function(
@@ -57,58 +60,359 @@ class TestPeriodicBackup(TestCase):
         mock_make_bucket,
         mock_get_encryption_key,
         mock_add_file_to_minio,
-        mock_difference_local_minio,
+        mock_upload_files_to_minio,
+        mock_get_local_files,
+        mock_verify_manifest,
+        mock_difference_local_manifest,
         mock_remove_object,
+        mock_put_manifest_to_minio,
     ):
+        for file_name, content_hash in [('remove.pdf', 'removed'), ('existing.pdf', 'existing')]:
+            BackupManifestEntry.objects.create(
+                file_name=file_name, content_hash=content_hash, modification_time=1, size=1
+            )
+        mock_difference_local_manifest.return_value = (
+            {
+                'add_1.pdf': get_dummy_manifest_entry('add_1.pdf', 'new'),
+                # identical to add_1.pdf
+                'add_2.pdf': get_dummy_manifest_entry('add_2.pdf', 'new'),
+                # identical to an already backed up file
+                'add_3.pdf': get_dummy_manifest_entry('add_3.pdf', 'existing'),
+            },
+            [get_dummy_manifest_entry('touched.pdf', 'touched')],
+            {'remove.pdf'},
+        )
+
         tasks.backup_function()
 
         mock_make_bucket.assert_called_with('pdfding')
         mock_bucket_exists.assert_called_with('pdfding')
         mock_get_encryption_key.assert_called_with(True, 'password', 'pdfding')
-        self.assertEqual(mock_add_file_to_minio.call_count, 3)
-        mock_add_file_to_minio.assert_has_calls(
+        mock_add_file_to_minio.assert_called_once_with(
+            'backup.sqlite3', Path(__file__).parents[2] / 'db', ENCRYPTION_KEY
+        )
+        mock_verify_manifest.assert_called_once_with({'add_1.pdf': 1}, ENCRYPTION_KEY)
+        mock_difference_local_manifest.assert_called_once_with({'add_1.pdf': 1})
+        # the identical files are uploaded once
+        mock_upload_files_to_minio.assert_called_once_with(
+            {get_content_object_name('new', ENCRYPTION_KEY): 'add_1.pdf'},
+            Path(__file__).parents[2] / 'media',
+            ENCRYPTION_KEY,
+        )
+
+        # the legacy object of the uploaded file and the content of the removed file are no longer needed. the legacy
+        # object without a manifest entry is kept.
+        self.assertEqual(
+            mock_remove_object.call_args_list,
             [
-                mock.call('backup.sqlite3', Path(__file__).parents[2] / 'db', b'key'),
-                mock.call('add_1.pdf', Path(__file__).parents[2] / 'media', b'key'),
-                mock.call('add_2.pdf', Path(__file__).parents[2] / 'media', b'key'),
+                mock.call('pdfding', 'add_1.pdf'),
+                mock.call('pdfding', get_content_object_name('removed', ENCRYPTION_KEY)),
             ],
-            any_order=True,
         )
+        mock_put_manifest_to_minio.assert_called_once_with(ENCRYPTION_KEY)
 
-        self.assertEqual(mock_remove_object.call_count, 1)
-        mock_remove_object.assert_called_with('pdfding', 'remove.pdf')
+        self.assertEqual(
+            sorted(BackupManifestEntry.objects.values_list('file_name', 'content_hash')),
+            [
+                ('add_1.pdf', 'new'),
+                ('add_2.pdf', 'new'),
+                ('add_3.pdf', 'existing'),
+                ('existing.pdf', 'existing'),
+                ('touched.pdf', 'touched'),
+            ],
+        )
 
-    @mock.patch('backup.tasks.Minio.list_objects', return_value=mock_objects)
-    def test_difference_local_minio(self, mock_list_objects):
-        user_1 = User.objects.create_user(username='user_1', password='password', email='a@a.com')
-        user_2 = User.objects.create_user(username='user_2', password='password', email='b@a.com')
+        # the manifest is only verified once per verification interval
+        mock_difference_local_manifest.return_value = ({}, [], set())
+        tasks.backup_function()
+        mock_verify_manifest.assert_called_once()
 
-        for i in range(1, 7):
-            pdf = Pdf.objects.create(owner=user_1.profile, name=f'pdf_{i}.pdf')
-            pdf.file.name = f'{pdf.owner.id}/{pdf.name}'
-            pdf.save()
-        for i in range(2, 4):
-            pdf = Pdf.objects.create(owner=user_2.profile, name=f'pdf_{i}{i}.pdf')
-            pdf.file.name = f'{pdf.owner.id}/{pdf.name}'
+    @mock.patch('backup.tasks.put_manifest_to_minio')
+    @mock.patch('backup.tasks.Minio.remove_object')
+    @mock.patch(
+        'backup.tasks.difference_local_manifest',
+        return_value=(
+            {
+                'add_1.pdf': get_dummy_manifest_entry('add_1.pdf', 'hash_1'),
+                'add_2.pdf': get_dummy_manifest_entry('add_2.pdf', 'hash_2'),
+            },
+            [],
+            {'remove.pdf'},
+        ),
+    )
+    @mock.patch('backup.tasks.verify_manifest', return_value={'add_1.pdf'})
+    @mock.patch('backup.tasks.upload_files_to_minio', return_value=['content/hash_1'])
+    @mock.patch('backup.tasks.add_file_to_minio')
+    @mock.patch('backup.tasks.get_encryption_key', return_value=None)
+    @mock.patch('backup.tasks.Minio.bucket_exists', return_value=True)
+    def test_backup_function_failed_uploads(
+        self,
+        mock_bucket_exists,
+        mock_get_encryption_key,
+        mock_add_file_to_minio,
+        mock_upload_files_to_minio,
+        mock_verify_manifest,
+        mock_difference_local_manifest,
+        mock_remove_object,
+        mock_put_manifest_to_minio,
+    ):
+        BackupManifestEntry.objects.create(file_name='remove.pdf', content_hash='removed', modification_time=1, size=1)
+
+        with self.assertRaisesMessage(RuntimeError, 'Backup failed, 1 files could not be uploaded.'):
+            tasks.backup_function()
+
+        # the deleted files are still removed from the backup and the manifest is updated. the legacy object of the
+        # failed file is kept.
+        mock_remove_object.assert_called_once_with('pdfding', 'content/removed')
+        mock_put_manifest_to_minio.assert_called_once()
+        # the failed file has no manifest entry, so that it is uploaded again
+        self.assertEqual(list(BackupManifestEntry.objects.values_list('file_name', flat=True)), ['add_2.pdf'])
+
+    @mock.patch('backup.tasks.Minio.put_object')
+    def test_put_manifest_to_minio(self, mock_put_object):
+        BackupManifestEntry.objects.create(file_name='1/pdf_1.pdf', content_hash='hash_1', modification_time=1, size=1)
+        encryption_key = Fernet.generate_key()
+
+        for key in [None, encryption_key]:
+            tasks.put_manifest_to_minio(key)
+
+            bucket_name, object_name, data, length = mock_put_object.call_args.args
+            content = data.read()
+
+            self.assertEqual((bucket_name, object_name), ('pdfding', 'manifest.json'))
+            self.assertEqual(length, len(content))
+
+            if key:
+                content = self.decrypt(key, content)
+
+            self.assertEqual(json.loads(content), {'version': 1, 'files': {'1/pdf_1.pdf': 'hash_1'}})
+
+    @staticmethod
+    def decrypt(encryption_key: bytes, content: bytes) -> bytes:
+        decrypted = BytesIO()
+        decrypt_stream(encryption_key, BytesIO(content), decrypted)
+
+        return decrypted.getvalue()
+
+
+class TestBackupManifest(TestCase):
+    def setUp(self):
+        self.media_root = Path(__file__).parent / 'media'
+        self.media_root.mkdir(exist_ok=True)
+        self.user = User.objects.create_user(username='user_1', password='password', email='a@a.com')
+
+    def tearDown(self):
+        rmtree(self.media_root)
+
+    def test_manifest_file_name_length(self):
+        # every backed up file name needs to fit into the manifest
+        max_length = BackupManifestEntry._meta.get_field('file_name').max_length
+
+        for field_name in ['file', 'linearized_file', 'thumbnail', 'preview']:
+            self.assertLessEqual(Pdf._meta.get_field(field_name).max_length, max_length)
+
+        self.assertLessEqual(SharedPdf._meta.get_field('file').max_length, max_length)
+
+    def test_get_local_files(self):
+        for i in range(1, 3):
+            pdf = Pdf.objects.create(owner=self.user.profile, name=f'pdf_{i}.pdf', revision=i)
+            pdf.file.name = f'1/pdf_{i}.pdf'
             pdf.save()
-        for i in range(1, 4):
-            pdf = user_1.profile.pdfs.get(name='pdf_1.pdf')
-            shared_pdf = SharedPdf.objects.create(owner=user_1.profile, name=f'shared_pdf_{i}', pdf=pdf)
-            shared_pdf.file.name = f'{pdf.owner.id}/qr/qr_{i}.svg'
 
-            # also add shared pdf with deletion date in the past
-            # the qr code of this shared pdf should not be added
-            if i == 3:
+        # the thumbnails, previews and linearized copies are backed up as well
+        Pdf.objects.filter(name='pdf_1.pdf').update(
+            thumbnail='1/thumbnails/pdf_1.png', preview='1/previews/pdf_1.png', linearized_file='1/linearized/pdf_1.pdf'
+        )
+        # pdfs without file are skipped
+        Pdf.objects.create(owner=self.user.profile, name='no_file.pdf')
+
+        pdf = Pdf.objects.get(name='pdf_1.pdf')
+        for i in range(1, 3):
+            shared_pdf = SharedPdf.objects.create(owner=self.user.profile, name=f'shared_pdf_{i}', pdf=pdf)
+            shared_pdf.file.name = f'1/qr/qr_{i}.svg'
+
+            # the qr code of a shared pdf with deletion date in the past should not be added
+            if i == 2:
                 shared_pdf.deletion_date = datetime.now(timezone.utc) - timedelta(days=3, hours=2)
 
             shared_pdf.save()
 
-        generated_to_be_added, generated_to_be_deleted = tasks.difference_local_minio()
-        expected_to_be_added = {'1/pdf_1.pdf', '1/pdf_2.pdf', '1/pdf_3.pdf', '2/pdf_33.pdf', '1/qr/qr_2.svg'}
-        expected_to_be_deleted = {'1/pdf_7.pdf', '1/pdf_8.pdf', '2/pdf_00.pdf', '2/pdf_11.pdf', '2/qr/qr_2.svg'}
+        self.assertEqual(
+            tasks.get_local_files(),
+            {
+                '1/pdf_1.pdf': 1,
+                '1/thumbnails/pdf_1.png': None,
+                '1/previews/pdf_1.png': None,
+                '1/linearized/pdf_1.pdf': None,
+                '1/pdf_2.pdf': 2,
+                '1/qr/qr_1.svg': None,
+            },
+        )
+
+    def test_difference_local_manifest(self):
+        for file_name in ['new', 'unchanged', 'modified', 'touched', 'new_revision']:
+            (self.media_root / f'{file_name}.pdf').write_bytes(f'{file_name} content'.encode())
+
+        unchanged_stat = (self.media_root / 'unchanged.pdf').stat()
+        touched_stat = (self.media_root / 'touched.pdf').stat()
+        new_revision_stat = (self.media_root / 'new_revision.pdf').stat()
+        for file_name, content_hash, modification_time, revision, size in [
+            ('unchanged.pdf', 'unchanged', unchanged_stat.st_mtime, 1, unchanged_stat.st_size),
+            ('modified.pdf', 'outdated', 1, 1, 1),
+            ('touched.pdf', get_file_hash(self.media_root / 'touched.pdf'), 1, None, touched_stat.st_size),
+            ('new_revision.pdf', 'outdated', new_revision_stat.st_mtime, 1, new_revision_stat.st_size),
+            ('deleted.pdf', 'deleted', 1, 1, 1),
+        ]:
+            BackupManifestEntry.objects.create(
+                file_name=file_name,
+                content_hash=content_hash,
+                modification_time=modification_time,
+                revision=revision,
+                size=size,
+            )
+
+        local_files = {
+            'new.pdf': 1,
+            'unchanged.pdf': 1,
+            'modified.pdf': 1,
+            'touched.pdf': None,
+            'new_revision.pdf': 2,
+            'missing.pdf': 1,
+        }
+
+        with override_settings(MEDIA_ROOT=self.media_root), self.assertLogs('huey', level='WARNING') as logs:
+            to_be_added, to_be_refreshed, to_be_deleted = tasks.difference_local_manifest(local_files)
+
+        self.assertEqual(sorted(to_be_added), ['modified.pdf', 'new.pdf', 'new_revision.pdf'])
+        self.assertEqual(to_be_added['new.pdf'].content_hash, get_file_hash(self.media_root / 'new.pdf'))
+        self.assertEqual(to_be_added['new.pdf'].size, len(b'new content'))
+        self.assertEqual(to_be_added['new_revision.pdf'].revision, 2)
+        self.assertEqual([entry.file_name for entry in to_be_refreshed], ['touched.pdf'])
+        self.assertEqual(to_be_refreshed[0].modification_time, touched_stat.st_mtime)
+        self.assertEqual(to_be_deleted, {'deleted.pdf'})
+        self.assertEqual(logs.output, ['WARNING:huey:missing.pdf does not exist and cannot be backed up.'])
+
+    @mock.patch('backup.tasks.Minio.copy_object')
+    @mock.patch('backup.tasks.Minio.remove_object')
+    @mock.patch('backup.tasks.Minio.list_objects')
+    def test_verify_manifest(self, mock_list_objects, mock_remove_object, mock_copy_object):
+        for file_name in ['valid', 'wrong_size', 'missing', 'legacy', 'legacy_identical', 'legacy_wrong_size']:
+            (self.media_root / f'{file_name}.pdf').write_bytes(b'content')
+
+        content_hash = get_file_hash(self.media_root / 'valid.pdf')
+        for file_name, entry_hash in [
+            ('valid.pdf', content_hash),
+            ('wrong_size.pdf', 'other'),
+            ('missing.pdf', 'missing'),
+        ]:
+            BackupManifestEntry.objects.create(
+                file_name=file_name, content_hash=entry_hash, modification_time=1, size=7
+            )
+
+        mock_list_objects.return_value = [
+            self.get_mock_object(object_name, size)
+            for object_name, size in [
+                (get_content_object_name(content_hash, ENCRYPTION_KEY), get_encrypted_size(7)),
+                (get_content_object_name('other', ENCRYPTION_KEY), 7),
+                ('content/unreferenced', 7),
+                # objects of backups created before the files were stored by their content hash
+                ('legacy.pdf', get_encrypted_size(7)),
+                ('legacy_identical.pdf', get_encrypted_size(7)),
+                ('legacy_wrong_size.pdf', 7),
+                ('orphan.pdf', 7),
+                ('backup.sqlite3', 7),
+                ('manifest.json', 7),
+            ]
+        ]
+        local_files = {
+            f'{file_name}.pdf': 1
+            for file_name in ['valid', 'wrong_size', 'missing', 'legacy', 'legacy_identical', 'legacy_wrong_size']
+        }
+
+        with override_settings(MEDIA_ROOT=self.media_root):
+            legacy_objects = tasks.verify_manifest(local_files, ENCRYPTION_KEY)
+
+        # the legacy objects with matching size are adopted
+        self.assertEqual(
+            sorted(BackupManifestEntry.objects.values_list('file_name', 'content_hash')),
+            [('legacy.pdf', content_hash), ('legacy_identical.pdf', content_hash), ('valid.pdf', content_hash)],
+        )
+        mock_copy_object.assert_not_called()
+        self.assertEqual(
+            sorted(call.args[1] for call in mock_remove_object.call_args_list),
+            sorted(
+                [
+                    get_content_object_name('other', ENCRYPTION_KEY),
+                    'content/unreferenced',
+                    'legacy.pdf',
+                    'legacy_identical.pdf',
+                ]
+            ),
+        )
+        # the legacy object with a different size is kept until its file is uploaded again. the legacy object without
+        # a local file is the only remaining copy of the file.
+        self.assertEqual(legacy_objects, {'legacy_wrong_size.pdf', 'orphan.pdf'})
+
+    @mock.patch('backup.tasks.Minio.copy_object')
+    @mock.patch('backup.tasks.Minio.remove_object')
+    @mock.patch('backup.tasks.Minio.list_objects')
+    def test_verify_manifest_no_encryption(self, mock_list_objects, mock_remove_object, mock_copy_object):
+        for file_name in ['legacy_1', 'legacy_2']:
+            (self.media_root / f'{file_name}.pdf').write_bytes(b'content')
+        mock_list_objects.return_value = [
+            self.get_mock_object('legacy_1.pdf', 7),
+            self.get_mock_object('legacy_2.pdf', 7),
+            self.get_mock_object('missing_locally.pdf', 7),
+        ]
+
+        with override_settings(MEDIA_ROOT=self.media_root):
+            legacy_objects = tasks.verify_manifest(
+                {'legacy_1.pdf': 1, 'legacy_2.pdf': None, 'missing_locally.pdf': 1}, None
+            )
+
+        # the identical legacy objects are copied to their content object once
+        content_hash = get_file_hash(self.media_root / 'legacy_1.pdf')
+        mock_copy_object.assert_called_once()
+        self.assertEqual(mock_copy_object.call_args.args[:2], ('pdfding', f'content/{content_hash}'))
+        self.assertEqual(mock_copy_object.call_args.args[2].object_name, 'legacy_1.pdf')
+        self.assertEqual(
+            sorted(BackupManifestEntry.objects.values_list('file_name', flat=True)), ['legacy_1.pdf', 'legacy_2.pdf']
+        )
+        self.assertEqual(
+            sorted(call.args[1] for call in mock_remove_object.call_args_list), ['legacy_1.pdf', 'legacy_2.pdf']
+        )
+        self.assertEqual(legacy_objects, {'missing_locally.pdf'})
+
+    @mock.patch('backup.tasks.Minio.copy_object')
+    @mock.patch('backup.tasks.Minio.remove_object')
+    @mock.patch('backup.tasks.Minio.list_objects')
+    def test_verify_manifest_missing_local_file(self, mock_list_objects, mock_remove_object, mock_copy_object):
+        # the pdf still exists in the database, but its file was lost
+        mock_list_objects.return_value = [self.get_mock_object('missing.pdf', 7)]
+
+        with override_settings(MEDIA_ROOT=self.media_root):
+            legacy_objects = tasks.verify_manifest({'missing.pdf': 1}, None)
+
+        # the object is the only remaining copy of the file and is kept
+        mock_copy_object.assert_not_called()
+        mock_remove_object.assert_not_called()
+        self.assertEqual(legacy_objects, {'missing.pdf'})
+        self.assertFalse(BackupManifestEntry.objects.exists())
+
+    @mock.patch('backup.tasks.Minio.remove_object')
+    def test_remove_backed_up_legacy_objects(self, mock_remove_object):
+        BackupManifestEntry.objects.create(file_name='backed_up.pdf', content_hash='hash', modification_time=1, size=1)
+
+        self.assertEqual(tasks.remove_backed_up_legacy_objects({'backed_up.pdf', 'pending.pdf'}), {'pending.pdf'})
+        mock_remove_object.assert_called_once_with('pdfding', 'backed_up.pdf')
+
+    @staticmethod
+    def get_mock_object(object_name: str, size: int) -> mock.Mock:
+        mock_object = mock.Mock()
+        mock_object.object_name = object_name
+        mock_object.size = size
 
-        self.assertEqual(expected_to_be_added, generated_to_be_added)
-        self.assertEqual(expected_to_be_deleted, generated_to_be_deleted)
+        return mock_object
 
 
 class TestSqliteBackup(TestCase):
@@ -156,16 +460,103 @@ class TestSqliteBackup(TestCase):
     def test_add_file_to_minio_no_encryption(self, mock_fput_object):
         tasks.add_file_to_minio('file_name', Path('path'), None)
 
-        mock_fput_object.assert_called_with('pdfding', 'file_name', 'path/file_name')
+        mock_fput_object.assert_called_with(
+            'pdfding', 'file_name', 'path/file_name', part_size=16 * 1024 * 1024, num_parallel_uploads=1
+        )
 
-    @mock.patch('backup.tasks.Path.unlink')
-    @mock.patch('backup.tasks.encrypt_file')
-    @mock.patch('backup.tasks.Minio.fput_object')
-    def test_add_file_to_minio_with_encryption(self, mock_fput_object, mock_encrypt_file, mock_unlink):
-        tasks.add_file_to_minio('file_name', Path('path'), b'key')
+    @mock.patch('backup.tasks.Minio.put_object')
+    def test_add_file_to_minio_with_encryption(self, mock_put_object):
+        encryption_key = Fernet.generate_key()
+        uploaded = {}
+
+        def put_object(bucket_name, object_name, data, length, **kwargs):
+            uploaded['data'] = data.read()
+            uploaded['length'] = length
+
+        mock_put_object.side_effect = put_object
+
+        tasks.add_file_to_minio('__init__.py', Path(__file__).parent, encryption_key)
+
+        # the file is encrypted while being uploaded, no encrypted copy is stored locally
+        self.assertEqual(mock_put_object.call_args.args[:2], ('pdfding', '__init__.py'))
+        self.assertEqual(mock_put_object.call_args.kwargs, {'part_size': 16 * 1024 * 1024, 'num_parallel_uploads': 1})
+        self.assertEqual(uploaded['length'], len(uploaded['data']))
+
+        decrypted = BytesIO()
+        decrypt_stream(encryption_key, BytesIO(uploaded['data']), decrypted)
+        self.assertEqual(decrypted.getvalue(), (Path(__file__).parent / '__init__.py').read_bytes())
+
+
+class TestConcurrentUpload(TestCase):
+    def setUp(self):
+        self.parent_path = Path(__file__).parent / 'data' / 'upload'
+        self.parent_path.mkdir(parents=True, exist_ok=True)
+
+        for i in range(1, 6):
+            (self.parent_path / f'pdf_{i}.pdf').write_bytes(i * b'a')
+
+    def tearDown(self):
+        for file_path in self.parent_path.iterdir():
+            file_path.unlink()
+
+        self.parent_path.rmdir()
+        self.parent_path.parent.rmdir()
+
+    @mock.patch('backup.tasks.add_file_to_minio')
+    def test_upload_files_to_minio(self, mock_add_file_to_minio):
+        uploads = {f'content/hash_{i}': f'pdf_{i}.pdf' for i in range(1, 6)}
+
+        with self.assertLogs('huey', level='INFO') as logs:
+            failed_objects = tasks.upload_files_to_minio(uploads, self.parent_path, b'key')
+
+        self.assertEqual(failed_objects, [])
+        self.assertEqual(
+            sorted(call.args for call in mock_add_file_to_minio.call_args_list),
+            [(file_name, self.parent_path, b'key', object_name) for object_name, file_name in uploads.items()],
+        )
+        self.assertIn('Added 5 / 5 files (0.0 MB)', logs.output[-1])
+        self.assertIn('files/s', logs.output[-1])
+        self.assertIn('MB/s', logs.output[-1])
+
+    @mock.patch('backup.tasks.time.sleep')
+    @mock.patch('backup.tasks.add_file_to_minio')
+    def test_upload_files_to_minio_independent_retries(self, mock_add_file_to_minio, mock_sleep):
+        def add_file_to_minio(file_name, parent_path, encryption_key, object_name):
+            if file_name == 'pdf_2.pdf':
+                raise ConnectionError('no connection')
+
+        mock_add_file_to_minio.side_effect = add_file_to_minio
+
+        with self.assertLogs('huey', level='INFO') as logs:
+            failed_objects = tasks.upload_files_to_minio(
+                {f'content/hash_{i}': f'pdf_{i}.pdf' for i in range(1, 6)}, self.parent_path, None
+            )
+
+        # only the failing file is retried, the other files are uploaded once
+        self.assertEqual(failed_objects, ['content/hash_2'])
+        self.assertEqual(mock_add_file_to_minio.call_count, 4 + tasks.UPLOAD_RETRIES)
+        self.assertIn('ERROR:huey:Could not add pdf_2.pdf to the backup: no connection', logs.output)
+        self.assertIn('Added 4 / 5 files (0.0 MB)', logs.output[-1])
+
+    @mock.patch('backup.tasks.time.sleep')
+    @mock.patch('backup.tasks.add_file_to_minio', side_effect=[ConnectionError, ConnectionError, None])
+    def test_add_file_to_minio_with_retries(self, mock_add_file_to_minio, mock_sleep):
+        with self.assertLogs('huey', level='WARNING'):
+            file_size = tasks.add_file_to_minio_with_retries('pdf_3.pdf', self.parent_path, None)
+
+        self.assertEqual(file_size, 3)
+        self.assertEqual(mock_add_file_to_minio.call_count, 3)
+        # the delay increases with every attempt
+        mock_sleep.assert_has_calls([mock.call(5), mock.call(10)])
+
+    @mock.patch('backup.tasks.PROGRESS_LOG_INTERVAL', 0)
+    def test_upload_progress(self):
+        progress = tasks.UploadProgress(2)
 
-        tmp_file_path = Path(__file__).parents[1] / 'tmp_encrypted'
+        with self.assertLogs('huey', level='INFO') as logs:
+            progress.add(2_000_000)
+            progress.add(1_000_000)
 
-        mock_encrypt_file.assert_called_with(b'key', Path('path/file_name'), tmp_file_path)
-        mock_fput_object.assert_called_with('pdfding', 'file_name', str(tmp_file_path))
-        mock_unlink.assert_called_with()
+        # the progress is logged after every file, as the interval is 0
+        self.assertEqual(len(logs.output), 2)
+        self.assertIn('Added 2 / 2 files (3.0 MB)', logs.output[1])
@@ -1,12 +1,18 @@
-from base.service import construct_query_overview_url
+from pathlib import Path
+
+from base.file_serving import offload_file, serve_file, stream_file
+from base.service import construct_query_overview_url, decode_cursor, encode_cursor, get_sort_expression
 from core.settings import ITEMS_PER_PAGE, MEDIA_ROOT
+from django.conf import settings
 from django.contrib import messages
-from django.core.paginator import Paginator
-from django.http import FileResponse, HttpRequest
+from django.core.exceptions import BadRequest, ValidationError
+from django.db.models import F, Q
+from django.http import HttpRequest
 from django.shortcuts import redirect, render
 from django.urls import reverse
+from django.utils._os import safe_join
+from django.utils.http import content_disposition_header
 from django.views import View
-from django.views.static import serve
 from django_htmx.http import HttpResponseClientRedirect, HttpResponseClientRefresh
 
 
@@ -36,21 +42,25 @@ class BaseAdd(View):
 class BaseOverview(View):
     """
     Base view for the overview pages. This view performs the searching and sorting. It's also responsible for
-    paginating the objects.
+    paginating the objects. The pagination is cursor based: the url of the next page contains an opaque cursor
+    specifying the last displayed object, so that the next page can be selected without an offset.
     """
 
-    def get(self, request: HttpRequest, page: int = 1, items_per_page: int = ITEMS_PER_PAGE, **kwargs):
+    def get(
+        self, request: HttpRequest, page: int = 1, items_per_page: int = ITEMS_PER_PAGE, cursor: str = '', **kwargs
+    ):
         """
         Display the overview.
         """
 
         sorting = self.get_sorting(request)
-        page_object, next_page_available = self.get_page_objects(request, sorting, page, items_per_page, **kwargs)
+        page_object, next_page_cursor = self.get_page_objects(request, sorting, cursor, items_per_page, **kwargs)
         context = {
             'page_obj': page_object,
             'sorting': sorting,
             'items_per_page': items_per_page,
-            'next_page_available': next_page_available,
+            'next_page_available': bool(next_page_cursor),
+            'next_page_cursor': next_page_cursor,
             'current_page': page,
         }
 
@@ -63,19 +73,50 @@ class BaseOverview(View):
 
             return render(request, f'{self.obj_name}_overview.html', context)
 
-    def get_page_objects(self, request: HttpRequest, sorting: str, page: int, items_per_page: int, **kwargs):
+    def get_page_objects(self, request: HttpRequest, sorting: str, cursor: str, items_per_page: int, **kwargs):
+        """
+        Get the objects of the page following the object specified by the cursor. Returns the objects and the cursor of
+        the next page, which is empty if there is no next page.
+        """
+
         # filter objects
         objects = self.filter_objects(request, **kwargs)
 
-        # sort objects
-        objects = objects.order_by(sorting)
+        # sort objects. the id is used as tie-breaker, so that every object has a unique position and the objects of
+        # the next page can be selected by comparing with the values of the last displayed object.
+        sort_expression, descending = get_sort_expression(sorting)
+        objects = objects.annotate(sort_value=sort_expression)
 
-        paginator = Paginator(objects, per_page=items_per_page, allow_empty_first_page=True)
-        page_object = paginator.get_page(page)
+        if descending:
+            objects = objects.order_by(F('sort_value').desc(), '-id')
+        else:
+            objects = objects.order_by(F('sort_value').asc(), 'id')
+
+        if cursor:
+            lookup = 'lt' if descending else 'gt'
 
-        next_page_available = page_object.end_index() < objects.count()
+            try:
+                sort_value, object_id = decode_cursor(cursor)
+                # the first condition is redundant, but allows the database to seek in the index of the sorting
+                objects = objects.filter(**{f'sort_value__{lookup}e': sort_value}).filter(
+                    Q(**{f'sort_value__{lookup}': sort_value})
+                    | Q(sort_value=sort_value, **{f'id__{lookup}': object_id})
+                )
+            except (TypeError, ValidationError, ValueError):
+                raise BadRequest('Invalid cursor')
+
+        # fetch one object more than displayed, so that no count queries are needed for checking if there is a next
+        # page
+        items_per_page = int(items_per_page)
+        page_objects = list(objects[: items_per_page + 1])  # noqa
+
+        if len(page_objects) > items_per_page:
+            last_object = page_objects[items_per_page - 1]
+            next_page_cursor = encode_cursor(last_object.sort_value, last_object.id)
+        else:
+            next_page_cursor = ''
 
-        return page_object, next_page_available
+        return page_objects[:items_per_page], next_page_cursor
 
     def do_extra_action(self, request: HttpRequest):
         """Do some action before rendering the overview"""
@@ -101,21 +142,33 @@ class BaseOverviewQuery(View):
 
 
 class BaseServe(View):
-    """Base view used for serving PDF files specified by the PDF id."""
+    """
+    Base view used for serving PDF files specified by the PDF id. The view is asynchronous, so that slow file transfers
+    do not block a worker when PdfDing is served via ASGI.
+    """
 
-    def get(self, request: HttpRequest, identifier: str, revision=None):
+    async def get(self, request: HttpRequest, identifier: str, revision=None):
         """
-        Returns the specified file as a FileResponse
+        Returns the specified file
 
         There is a revision parameter, because of occasional problems related to viewing edited pdfs. When editing pdfs
         in the viewer and saving them, sometimes the old version is still shown in the viewer even though the backend
         has the correct version. This is probably caused by the browser's caching. This commit fixes the problem by
         adding a revision to the serve views so that the browser is forced to refresh the pdf.
+
+        As the revision changes whenever the file is updated, the file of the current revision is cached by the browser
+        as immutable. Files without a revision are revalidated via their ETag.
         """
 
-        serve_object = self.get_object(request, identifier)
+        serve_object = await self.aget_object(request, identifier)
+        file_path = Path(safe_join(MEDIA_ROOT, self.get_file_path(serve_object) or ''))
 
-        return serve(request, document_root=MEDIA_ROOT, path=self.get_file_path(serve_object))
+        if revision is not None and str(revision) == str(serve_object.revision):
+            file_revision = serve_object.revision
+        else:
+            file_revision = None
+
+        return serve_file(request, file_path, file_revision)
 
     @staticmethod
     def get_file_path(serve_object):
@@ -123,7 +176,7 @@ class BaseServe(View):
 
 
 class BaseDownload(View):
-    """Base view for downloading the PDF specified by the ID."""
+    """Base view for downloading the PDF specified by the ID. Like BaseServe, the view is asynchronous."""
 
     @staticmethod
     def get_suffix():  # pragma: no cover
@@ -134,13 +187,17 @@ class BaseDownload(View):
 
         return '.pdf'
 
-    def get(self, request: HttpRequest, identifier: str):
-        """Return the specified file as a FileResponse."""
+    async def get(self, request: HttpRequest, identifier: str):
+        """Return the specified file as an attachment."""
 
-        download_object = self.get_object(request, identifier)
+        download_object = await self.aget_object(request, identifier)
         file_name = f'{download_object.name.replace(" ", "_").lower()}{self.get_suffix()}'
 
-        response = FileResponse(open(download_object.file.path, 'rb'), as_attachment=True, filename=file_name)
+        if settings.FILE_OFFLOAD:
+            response = offload_file(Path(download_object.file.path))
+            response.headers['Content-Disposition'] = content_disposition_header(True, file_name)
+        else:
+            response = stream_file(request, Path(download_object.file.path), as_attachment=True, file_name=file_name)
 
         return response
 
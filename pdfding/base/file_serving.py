@@ -0,0 +1,266 @@
+"""
+Serving of media files with support for conditional requests and byte ranges. Byte ranges allow pdf.js to load large
+pdfs in chunks, so that the first pages can be rendered before the whole file is downloaded. Optionally, sending the
+files can be offloaded to the reverse proxy in front of PdfDing.
+
+When PdfDing is served via ASGI, the files are streamed with asynchronous iterators. Django would otherwise read the
+complete file into memory before sending it, as synchronous iterators cannot be consumed by the event loop.
+"""
+
+import mimetypes
+import os
+import re
+from collections.abc import AsyncIterator, Iterator
+from pathlib import Path
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpRequest, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+# only a single byte range is supported, e.g. "bytes=0-499", "bytes=500-" or "bytes=-500"
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+RANGE_CHUNK_SIZE = 64 * 1024
+# one year, the longest max age that should be used according to RFC 9111
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+
+def serve_file(request: HttpRequest, file_path: Path, revision: int = None) -> HttpResponse:
+    """
+    Serve the file located at the file path. Supports single byte ranges, If-Range and conditional requests via
+    If-None-Match and If-Modified-Since.
+
+    If a revision is provided, the file is served under a url containing the revision, which changes whenever the file
+    is updated. In this case the ETag is derived from the revision and the response is cached as immutable. Otherwise,
+    the browser needs to revalidate the file on every request.
+
+    If file offloading is activated, the file is sent by the reverse proxy, which then also takes care of byte ranges
+    and conditional requests.
+    """
+
+    if not file_path.is_file():
+        raise Http404('The requested file does not exist')
+
+    if revision is None:
+        cache_control = 'private, no-cache'
+    else:
+        cache_control = f'private, max-age={IMMUTABLE_MAX_AGE}, immutable'
+
+    if settings.FILE_OFFLOAD:
+        response = offload_file(file_path)
+        response.headers['Cache-Control'] = cache_control
+
+        return response
+
+    file_stat = file_path.stat()
+    file_size = file_stat.st_size
+    last_modified = int(file_stat.st_mtime)
+    etag = get_etag(file_stat.st_mtime_ns, file_size, revision)
+    content_type = get_content_type(file_path)
+
+    # the headers are set on a response without content, so they can be copied by get_conditional_response
+    headers_response = HttpResponse()
+    headers_response.headers['ETag'] = etag
+    headers_response.headers['Last-Modified'] = http_date(last_modified)
+    headers_response.headers['Accept-Ranges'] = 'bytes'
+    headers_response.headers['Cache-Control'] = cache_control
+
+    conditional_response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified, response=headers_response
+    )
+
+    if conditional_response is not headers_response:
+        return conditional_response
+
+    byte_range = None
+    range_header = request.headers.get('Range')
+
+    if range_header and if_range_matches(request.headers.get('If-Range'), etag, last_modified):
+        try:
+            byte_range = parse_range_header(range_header, file_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response.headers['Content-Range'] = f'bytes */{file_size}'
+
+            return response
+
+    if byte_range:
+        first_byte, last_byte = byte_range
+
+        if isinstance(request, ASGIRequest):
+            file_range_iterator = aiterate_file_range(file_path, first_byte, last_byte)
+        else:
+            file_range_iterator = iterate_file_range(file_path, first_byte, last_byte)
+
+        response = StreamingHttpResponse(file_range_iterator, status=206, content_type=content_type)
+        response.headers['Content-Length'] = last_byte - first_byte + 1
+        response.headers['Content-Range'] = f'bytes {first_byte}-{last_byte}/{file_size}'
+    else:
+        response = stream_file(request, file_path)
+
+    for header in ['ETag', 'Last-Modified', 'Accept-Ranges', 'Cache-Control']:
+        response.headers[header] = headers_response.headers[header]
+
+    return response
+
+
+def stream_file(
+    request: HttpRequest, file_path: Path, as_attachment: bool = False, file_name: str = ''
+) -> HttpResponse:
+    """
+    Stream the whole file. If no file name is provided, the name of the file is used for the Content-Disposition and
+    Content-Type headers.
+    """
+
+    if not isinstance(request, ASGIRequest):
+        return FileResponse(file_path.open('rb'), as_attachment=as_attachment, filename=file_name)
+
+    file_name = file_name or file_path.name
+    file_size = file_path.stat().st_size
+
+    response = StreamingHttpResponse(
+        aiterate_file_range(file_path, 0, file_size - 1), content_type=get_content_type(Path(file_name))
+    )
+    response.headers['Content-Length'] = file_size
+    response.headers['Content-Disposition'] = content_disposition_header(as_attachment, file_name)
+
+    return response
+
+
+def offload_file(file_path: Path) -> HttpResponse:
+    """
+    Offload sending the file to the reverse proxy. The returned response only contains a header pointing to the file.
+    The proxy replaces the response with the file, so that no django worker is blocked while the file is sent.
+    """
+
+    response = HttpResponse(content_type=get_content_type(file_path))
+
+    if settings.FILE_OFFLOAD == 'X_ACCEL_REDIRECT':
+        # nginx expects the uri of an internal location, that serves the media directory
+        relative_path = file_path.relative_to(os.path.abspath(settings.MEDIA_ROOT)).as_posix()
+        response.headers['X-Accel-Redirect'] = quote(f'{settings.FILE_OFFLOAD_LOCATION.rstrip('/')}/{relative_path}')
+    else:
+        response.headers['X-Sendfile'] = str(file_path)
+
+    return response
+
+
+def get_content_type(file_path: Path) -> str:
+    """Get the content type of the file based on its name."""
+
+    return mimetypes.guess_type(file_path.name)[0] or 'application/octet-stream'
+
+
+def get_etag(modification_time_ns: int, file_size: int, revision: int = None) -> str:
+    """
+    Get the strong ETag of a file. The ETag changes if the file is modified. If a revision is provided, it is part of
+    the ETag.
+    """
+
+    etag = f'{modification_time_ns:x}-{file_size:x}'
+
+    if revision is not None:
+        etag = f'{revision}-{etag}'
+
+    return f'"{etag}"'
+
+
+def if_range_matches(if_range_header: str | None, etag: str, last_modified: int) -> bool:
+    """
+    Check if a requested range should be served. This is the case if there is no If-Range header or if it matches the
+    current ETag or modification date of the file. Otherwise, the file changed and needs to be served completely.
+    """
+
+    if if_range_header is None:
+        return True
+
+    if if_range_header.startswith(('"', 'W/')):
+        # If-Range requires a strong comparison
+        return if_range_header == etag
+
+    return parse_http_date_safe(if_range_header) == last_modified
+
+
+def parse_range_header(range_header: str, file_size: int) -> tuple[int, int] | None:
+    """
+    Parse the range header. Returns the first and the last byte of the requested range. Returns None if the header is
+    invalid or contains multiple ranges, in which case the header is ignored and the whole file is served. Raises a
+    ValueError if the range cannot be satisfied.
+    """
+
+    match = RANGE_PATTERN.match(range_header.strip())
+
+    if not match or match.groups() == ('', ''):
+        return None
+
+    start, end = match.groups()
+
+    if start:
+        first_byte = int(start)
+
+        if end and int(end) < first_byte:
+            return None
+        elif first_byte >= file_size:
+            raise ValueError('The range starts after the end of the file')
+
+        last_byte = min(int(end), file_size - 1) if end else file_size - 1
+    else:
+        # suffix range, e.g. "bytes=-500" are the last 500 bytes
+        suffix_length = int(end)
+
+        if suffix_length == 0 or file_size == 0:
+            raise ValueError('The range is empty')
+
+        first_byte = max(file_size - suffix_length, 0)
+        last_byte = file_size - 1
+
+    return first_byte, last_byte
+
+
+def iterate_file_range(file_path: Path, first_byte: int, last_byte: int) -> Iterator[bytes]:
+    """Iterate over the bytes of the file from the first byte to the last byte (inclusive) in chunks."""
+
+    remaining_bytes = last_byte - first_byte + 1
+
+    with file_path.open('rb') as f:
+        f.seek(first_byte)
+
+        while remaining_bytes > 0:
+            chunk = f.read(min(RANGE_CHUNK_SIZE, remaining_bytes))
+
+            if not chunk:
+                break
+
+            remaining_bytes -= len(chunk)
+
+            yield chunk
+
+
+async def aiterate_file_range(file_path: Path, first_byte: int, last_byte: int) -> AsyncIterator[bytes]:
+    """
+    Asynchronously iterate over the bytes of the file from the first byte to the last byte (inclusive) in chunks. The
+    file is read in a thread, so that the event loop is not blocked.
+    """
+
+    # not thread sensitive, so that reading the file does not block the thread shared by the synchronous code
+    read_chunk = sync_to_async(lambda f, size: f.read(size), thread_sensitive=False)
+    remaining_bytes = last_byte - first_byte + 1
+    f = await sync_to_async(file_path.open, thread_sensitive=False)('rb')
+
+    try:
+        f.seek(first_byte)
+
+        while remaining_bytes > 0:
+            chunk = await read_chunk(f, min(RANGE_CHUNK_SIZE, remaining_bytes))
+
+            if not chunk:
+                break
+
+            remaining_bytes -= len(chunk)
+
+            yield chunk
+    finally:
+        f.close()
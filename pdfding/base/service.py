@@ -1,5 +1,8 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from urllib.parse import parse_qs, urlparse
 
+from django.db.models import Expression, F, OrderBy
 from django.urls import reverse
 
 
@@ -101,3 +104,39 @@ def construct_query_overview_url(
         overview_url = f'{overview_url}?{query_string}'
 
     return overview_url
+
+
+def get_sort_expression(sorting: str | Expression) -> tuple[Expression, bool]:
+    """
+    Split the sorting of an overview page into the sorted expression and the sorting direction.
+
+    Example input: '-creation_date', Lower('name').desc()
+    Example output: (F('creation_date'), True), (Lower('name'), True)
+    """
+
+    if isinstance(sorting, str):
+        return F(sorting.removeprefix('-')), sorting.startswith('-')
+    elif isinstance(sorting, OrderBy):
+        return sorting.expression, sorting.descending
+    else:
+        return sorting, False
+
+
+def encode_cursor(sort_value, object_id) -> str:
+    """
+    Encode the position of an object in a sorted overview as an opaque cursor, that can be used in urls. The position
+    is specified by the sort value and the id of the object.
+    """
+
+    return urlsafe_b64encode(json.dumps([sort_value, object_id], default=str).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Decode a cursor created by encode_cursor. Raises a ValueError if the cursor is invalid."""
+
+    try:
+        sort_value, object_id = json.loads(urlsafe_b64decode(cursor.encode()))
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'Invalid cursor "{cursor}"') from e
+
+    return sort_value, object_id
@@ -72,6 +72,14 @@ class ObjectMixin(BaseMixin):
 
         return pdf
 
+    @staticmethod
+    async def aget_object(request: HttpRequest, pdf_id: str):
+        """Get the pdf specified by the ID asynchronously"""
+
+        user = await request.auser()
+
+        return await Pdf.objects.aget(owner__user=user, id=pdf_id)
+
 
 class EditMixin(ObjectMixin):
     obj_class = Pdf
@@ -17,9 +17,14 @@ from users.models import Profile
 test_patterns = [
     path('test/add/<identifier>', base_view_definitions.Add.as_view(), name='test_add'),
     path('test/overview/<items_per_page>', base_view_definitions.Overview.as_view(), name='test_overview'),
-    path('test/overview/<page>/<items_per_page>', base_view_definitions.Overview.as_view(), name='test_get_next_page'),
+    path(
+        'test/overview/<page>/<items_per_page>/<cursor>',
+        base_view_definitions.Overview.as_view(),
+        name='test_get_next_page',
+    ),
     path('test/overview_query', base_view_definitions.OverviewQuery.as_view(), name='test_overview_query'),
     path('test/serve/<identifier>', base_view_definitions.Serve.as_view(), name='test_serve'),
+    path('test/serve/<identifier>/<revision>', base_view_definitions.Serve.as_view(), name='test_serve_revision'),
     path('test/download/<identifier>', base_view_definitions.Download.as_view(), name='test_download'),
     path('test/details/<identifier>', base_view_definitions.Details.as_view(), name='test_details'),
     path('test/delete/<identifier>', base_view_definitions.Delete.as_view(), name='test_delete'),
@@ -114,8 +119,12 @@ class TestViews(TestCase):
         for pdf_name in ['orange', 'banana', 'Apple', 'Raspberry', 'Kaki', 'fig']:
             Pdf.objects.create(owner=self.user.profile, name=pdf_name)
 
+        cursor = self.client.get(f'{reverse('test_overview', kwargs={'items_per_page': 3})}').context[
+            'next_page_cursor'
+        ]
+        mock_do_extra_action.reset_mock()
         response = self.client.get(
-            f'{reverse('test_get_next_page', kwargs={'items_per_page': 3, 'page': 2})}', **headers
+            f'{reverse('test_get_next_page', kwargs={'items_per_page': 3, 'page': 2, 'cursor': cursor})}', **headers
         )
         pdf_names = [pdf.name for pdf in response.context['page_obj']]
 
@@ -123,12 +132,62 @@ class TestViews(TestCase):
         self.assertEqual(pdf_names, ['Apple'])
         self.assertEqual(response.context['other'], 1234)
         self.assertEqual(response.context['next_page_available'], False)
+        self.assertEqual(response.context['next_page_cursor'], '')
         self.assertEqual(response.context['items_per_page'], '3')
         self.assertEqual(response.context['current_page'], '2')
         self.assertEqual(str(response.context['sorting']), 'OrderBy(Lower(F(name)), descending=True)')
         self.assertTemplateUsed(response, 'includes/pdf_overview/overview_page.html')
         mock_do_extra_action.assert_not_called()
 
+    @override_settings(ROOT_URLCONF=__name__)
+    def test_overview_get_new_pdf_does_not_shift_next_page(self):
+        for i in range(5):
+            Pdf.objects.create(owner=self.user.profile, name=f'pdf_{i}')
+
+        response = self.client.get(f'{reverse('test_overview', kwargs={'items_per_page': 2})}')
+        self.assertEqual([pdf.name for pdf in response.context['page_obj']], ['pdf_4', 'pdf_3'])
+
+        # with offset pagination the new pdf would cause pdf_3 to be displayed again on the next page
+        Pdf.objects.create(owner=self.user.profile, name='new')
+        cursor = response.context['next_page_cursor']
+        response = self.client.get(
+            f'{reverse('test_get_next_page', kwargs={'items_per_page': 2, 'page': 2, 'cursor': cursor})}'
+        )
+
+        self.assertEqual([pdf.name for pdf in response.context['page_obj']], ['pdf_2', 'pdf_1'])
+
+    @override_settings(ROOT_URLCONF=__name__)
+    def test_overview_get_same_sort_value(self):
+        # pdfs with the same sort value are ordered by their id, so that no pdf is skipped or displayed twice
+        self.user.profile.pdf_sorting = Profile.PdfSortingChoice.NAME_DESC
+        self.user.profile.save()
+        pdfs = [Pdf.objects.create(owner=self.user.profile, name=name) for name in ['same', 'Same', 'SAME', 'other']]
+
+        pdf_ids = []
+        cursor = ''
+
+        for page in range(1, 5):
+            if cursor:
+                url = reverse('test_get_next_page', kwargs={'items_per_page': 1, 'page': page, 'cursor': cursor})
+            else:
+                url = reverse('test_overview', kwargs={'items_per_page': 1})
+
+            response = self.client.get(url)
+            pdf_ids += [pdf.id for pdf in response.context['page_obj']]
+            cursor = response.context['next_page_cursor']
+
+        self.assertEqual(pdf_ids, sorted([pdf.id for pdf in pdfs[:3]], reverse=True) + [pdfs[3].id])
+        self.assertEqual(cursor, '')
+
+    @override_settings(ROOT_URLCONF=__name__)
+    def test_overview_get_invalid_cursor(self):
+        for cursor in ['invalid', 'WyJhIiwgImIiXQ==', 'WzFd']:
+            response = self.client.get(
+                f'{reverse('test_get_next_page', kwargs={'items_per_page': 2, 'page': 2, 'cursor': cursor})}'
+            )
+
+            self.assertEqual(response.status_code, 400)
+
     @override_settings(ROOT_URLCONF=__name__)
     @patch('base.base_views.construct_query_overview_url')
     def test_overview_query_get(self, mock_construct_query_overview_url):
@@ -154,16 +213,43 @@ class TestViews(TestCase):
         self.assertRedirects(response, mock_return_value, status_code=302)
 
     @override_settings(ROOT_URLCONF=__name__)
-    @patch('base.base_views.serve')
-    def test_serve_get(self, mock_serve):
+    @patch('base.base_views.serve_file')
+    def test_serve_get(self, mock_serve_file):
         pdf = Pdf.objects.create(owner=self.user.profile, name='pdf')
         pdf.file.name = f'{self.user}/pdf_name'
         pdf.save()
-        mock_serve.return_value = HttpResponse('some response')
+        mock_serve_file.return_value = HttpResponse('some response')
 
         response = self.client.get(reverse('test_serve', kwargs={'identifier': pdf.id}))
 
-        mock_serve.assert_called_with(response.wsgi_request, document_root=MEDIA_ROOT, path=f'{self.user}/pdf_name')
+        mock_serve_file.assert_called_with(response.wsgi_request, MEDIA_ROOT / str(self.user) / 'pdf_name', None)
+
+    @override_settings(ROOT_URLCONF=__name__)
+    @patch('base.base_views.serve_file', return_value=HttpResponse('some response'))
+    def test_serve_get_revision(self, mock_serve_file):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf', revision=3)
+        pdf.file.name = f'{self.user}/pdf_name'
+        pdf.save()
+
+        for url_revision, expected_revision in [(3, 3), (2, None)]:
+            response = self.client.get(
+                reverse('test_serve_revision', kwargs={'identifier': pdf.id, 'revision': url_revision})
+            )
+
+            # only the current revision is served as revisioned file
+            mock_serve_file.assert_called_with(
+                response.wsgi_request, MEDIA_ROOT / str(self.user) / 'pdf_name', expected_revision
+            )
+
+    @override_settings(ROOT_URLCONF=__name__)
+    def test_serve_get_path_traversal(self):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf')
+        pdf.file.name = '../../etc/passwd'
+        pdf.save()
+
+        response = self.client.get(reverse('test_serve', kwargs={'identifier': pdf.id}))
+
+        self.assertEqual(response.status_code, 400)
 
     @override_settings(ROOT_URLCONF=__name__)
     def test_download_get(self):
@@ -178,6 +264,46 @@ class TestViews(TestCase):
         self.assertEqual(response.filename, f'{pdf.name}.pdf')
         self.assertTrue(response.as_attachment)
 
+    @override_settings(ROOT_URLCONF=__name__)
+    async def test_serve_and_download_get_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        simple_file = SimpleUploadedFile("simple.pdf", b"these are the file contents!")
+        pdf = await Pdf.objects.acreate(owner=await Profile.objects.aget(user=self.user), name='name', file=simple_file)
+        pdf_path = Path(pdf.file.path)
+
+        try:
+            serve_response = await self.async_client.get(reverse('test_serve', kwargs={'identifier': pdf.id}))
+            serve_content = b''.join([chunk async for chunk in serve_response.streaming_content])
+
+            download_response = await self.async_client.get(reverse('test_download', kwargs={'identifier': pdf.id}))
+            download_content = b''.join([chunk async for chunk in download_response.streaming_content])
+        finally:
+            pdf_path.unlink()
+
+        # the files are streamed asynchronously
+        self.assertTrue(serve_response.is_async)
+        self.assertEqual(serve_content, b'these are the file contents!')
+        self.assertEqual(serve_response.headers['Content-Length'], '28')
+        self.assertEqual(serve_response.headers['Content-Disposition'], f'inline; filename="{pdf_path.name}"')
+        self.assertTrue(download_response.is_async)
+        self.assertEqual(download_content, b'these are the file contents!')
+        self.assertEqual(download_response.headers['Content-Disposition'], 'attachment; filename="name.pdf"')
+        self.assertEqual(download_response.headers['Content-Type'], 'application/pdf')
+
+    @override_settings(ROOT_URLCONF=__name__, FILE_OFFLOAD='X_SENDFILE')
+    def test_download_get_offload(self):
+        simple_file = SimpleUploadedFile("simple.pdf", b"these are the file contents!")
+        pdf = Pdf.objects.create(owner=self.user.profile, name='Some Name', file=simple_file)
+        pdf_path = Path(pdf.file.path)
+
+        response = self.client.get(reverse('test_download', kwargs={'identifier': pdf.id}))
+
+        pdf_path.unlink()
+
+        self.assertEqual(response.headers['X-Sendfile'], str(pdf_path))
+        self.assertEqual(response.headers['Content-Disposition'], 'attachment; filename="some_name.pdf"')
+        self.assertEqual(response.content, b'')
+
     @override_settings(ROOT_URLCONF=__name__)
     def test_details_get(self):
         pdf = Pdf.objects.create(owner=self.user.profile, name='pdf')
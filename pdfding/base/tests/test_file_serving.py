@@ -0,0 +1,208 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from base import file_serving
+from django.http import Http404
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, override_settings
+from django.utils.http import http_date
+
+
+class TestFileServing(TestCase):
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.file_path = Path(self.temp_dir.name) / 'file.pdf'
+        self.content = bytes(range(256)) * 4
+        self.file_path.write_bytes(self.content)
+        self.factory = RequestFactory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def get_etag(self, revision: int = None):
+        file_stat = self.file_path.stat()
+
+        return file_serving.get_etag(file_stat.st_mtime_ns, file_stat.st_size, revision)
+
+    def test_serve_file(self):
+        response = file_serving.serve_file(self.factory.get('/'), self.file_path)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response.headers['Content-Type'], 'application/pdf')
+        self.assertEqual(response.headers['Content-Length'], '1024')
+        self.assertEqual(response.headers['Accept-Ranges'], 'bytes')
+        self.assertEqual(response.headers['ETag'], self.get_etag())
+        self.assertEqual(response.headers['Last-Modified'], http_date(int(self.file_path.stat().st_mtime)))
+        self.assertEqual(response.headers['Cache-Control'], 'private, no-cache')
+
+    def test_serve_file_revision(self):
+        response = file_serving.serve_file(self.factory.get('/'), self.file_path, 2)
+
+        self.assertEqual(response.headers['ETag'], self.get_etag(2))
+        self.assertEqual(response.headers['Cache-Control'], 'private, max-age=31536000, immutable')
+
+    def test_serve_file_not_existing(self):
+        for file_path in [self.file_path.parent / 'other.pdf', self.file_path.parent]:
+            with self.assertRaises(Http404):
+                file_serving.serve_file(self.factory.get('/'), file_path)
+
+    def test_serve_file_if_none_match(self):
+        request = self.factory.get('/', headers={'If-None-Match': self.get_etag(2)})
+        response = file_serving.serve_file(request, self.file_path, 2)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], self.get_etag(2))
+        self.assertEqual(response.content, b'')
+
+        # the etag of a different revision does not match
+        request = self.factory.get('/', headers={'If-None-Match': self.get_etag(1)})
+        self.assertEqual(file_serving.serve_file(request, self.file_path, 2).status_code, 200)
+
+    def test_serve_file_if_modified_since(self):
+        last_modified = int(self.file_path.stat().st_mtime)
+
+        request = self.factory.get('/', headers={'If-Modified-Since': http_date(last_modified)})
+        self.assertEqual(file_serving.serve_file(request, self.file_path).status_code, 304)
+
+        request = self.factory.get('/', headers={'If-Modified-Since': http_date(last_modified - 10)})
+        self.assertEqual(file_serving.serve_file(request, self.file_path).status_code, 200)
+
+    def test_serve_file_range(self):
+        request = self.factory.get('/', headers={'Range': 'bytes=100-199'})
+        response = file_serving.serve_file(request, self.file_path)
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.content[100:200])
+        self.assertEqual(response.headers['Content-Length'], '100')
+        self.assertEqual(response.headers['Content-Range'], 'bytes 100-199/1024')
+        self.assertEqual(response.headers['Content-Type'], 'application/pdf')
+        self.assertEqual(response.headers['ETag'], self.get_etag())
+
+    @patch('base.file_serving.RANGE_CHUNK_SIZE', 7)
+    def test_serve_file_range_chunked(self):
+        request = self.factory.get('/', headers={'Range': 'bytes=-500'})
+        response = file_serving.serve_file(request, self.file_path)
+
+        self.assertEqual(b''.join(response.streaming_content), self.content[-500:])
+        self.assertEqual(response.headers['Content-Range'], 'bytes 524-1023/1024')
+
+    def test_serve_file_range_not_satisfiable(self):
+        request = self.factory.get('/', headers={'Range': 'bytes=1024-'})
+        response = file_serving.serve_file(request, self.file_path)
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response.headers['Content-Range'], 'bytes */1024')
+
+    async def test_serve_file_asgi(self):
+        request_factory = AsyncRequestFactory()
+
+        response = file_serving.serve_file(request_factory.get('/'), self.file_path)
+
+        self.assertTrue(response.is_async)
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), self.content)
+        self.assertEqual(response.headers['Content-Length'], '1024')
+        self.assertEqual(response.headers['Content-Type'], 'application/pdf')
+        self.assertEqual(response.headers['Content-Disposition'], 'inline; filename="file.pdf"')
+        self.assertEqual(response.headers['ETag'], self.get_etag())
+
+        response = file_serving.serve_file(request_factory.get('/', headers={'Range': 'bytes=-500'}), self.file_path)
+
+        self.assertTrue(response.is_async)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), self.content[-500:])
+
+    def test_stream_file(self):
+        response = file_serving.stream_file(self.factory.get('/'), self.file_path, True, 'other.pdf')
+
+        self.assertFalse(response.is_async)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response.headers['Content-Disposition'], 'attachment; filename="other.pdf"')
+
+    async def test_stream_file_asgi(self):
+        response = file_serving.stream_file(AsyncRequestFactory().get('/'), self.file_path, True, 'other.txt')
+
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), self.content)
+        self.assertEqual(response.headers['Content-Disposition'], 'attachment; filename="other.txt"')
+        self.assertEqual(response.headers['Content-Type'], 'text/plain')
+
+    @patch('base.file_serving.RANGE_CHUNK_SIZE', 7)
+    async def test_aiterate_file_range(self):
+        chunks = [chunk async for chunk in file_serving.aiterate_file_range(self.file_path, 100, 199)]
+
+        self.assertEqual(b''.join(chunks), self.content[100:200])
+        self.assertEqual(len(chunks), 15)
+
+        # the file was truncated after its size was determined
+        chunks = [chunk async for chunk in file_serving.aiterate_file_range(self.file_path, 1000, 2000)]
+        self.assertEqual(b''.join(chunks), self.content[1000:])
+
+    def test_serve_file_if_range(self):
+        last_modified = int(self.file_path.stat().st_mtime)
+
+        for if_range, expected_status in [
+            (self.get_etag(), 206),
+            (http_date(last_modified), 206),
+            ('"outdated"', 200),
+            (f'W/{self.get_etag()}', 200),
+            (http_date(last_modified - 10), 200),
+        ]:
+            request = self.factory.get('/', headers={'Range': 'bytes=0-9', 'If-Range': if_range})
+            response = file_serving.serve_file(request, self.file_path)
+
+            self.assertEqual(response.status_code, expected_status)
+
+    def test_serve_file_x_accel_redirect(self):
+        file_path = self.file_path.parent / 'user 1' / 'ä.pdf'
+        file_path.parent.mkdir()
+        file_path.write_bytes(self.content)
+
+        with override_settings(
+            FILE_OFFLOAD='X_ACCEL_REDIRECT', FILE_OFFLOAD_LOCATION='/internal/', MEDIA_ROOT=self.temp_dir.name
+        ):
+            request = self.factory.get('/', headers={'Range': 'bytes=0-9'})
+            response = file_serving.serve_file(request, file_path, 1)
+
+        # the proxy takes care of the range
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response.headers['X-Accel-Redirect'], '/internal/user%201/%C3%A4.pdf')
+        self.assertEqual(response.headers['Content-Type'], 'application/pdf')
+        self.assertEqual(response.headers['Cache-Control'], 'private, max-age=31536000, immutable')
+
+    @override_settings(FILE_OFFLOAD='X_SENDFILE')
+    def test_serve_file_x_sendfile(self):
+        response = file_serving.serve_file(self.factory.get('/'), self.file_path)
+
+        self.assertEqual(response.headers['X-Sendfile'], str(self.file_path))
+        self.assertEqual(response.headers['Cache-Control'], 'private, no-cache')
+        self.assertNotIn('X-Accel-Redirect', response.headers)
+
+    @override_settings(FILE_OFFLOAD='X_SENDFILE')
+    def test_serve_file_offload_not_existing(self):
+        with self.assertRaises(Http404):
+            file_serving.serve_file(self.factory.get('/'), self.file_path.parent / 'other.pdf')
+
+    def test_parse_range_header(self):
+        for range_header, expected_range in [
+            ('bytes=0-99', (0, 99)),
+            ('bytes=100-', (100, 1023)),
+            ('bytes=1000-2000', (1000, 1023)),
+            ('bytes=-100', (924, 1023)),
+            ('bytes=-2000', (0, 1023)),
+            # invalid or unsupported headers are ignored
+            ('bytes=-', None),
+            ('bytes=100-99', None),
+            ('bytes=0-9, 20-29', None),
+            ('items=0-9', None),
+        ]:
+            self.assertEqual(file_serving.parse_range_header(range_header, 1024), expected_range)
+
+    def test_parse_range_header_not_satisfiable(self):
+        for range_header, file_size in [('bytes=1024-', 1024), ('bytes=-0', 1024), ('bytes=-10', 0)]:
+            with self.assertRaises(ValueError):
+                file_serving.parse_range_header(range_header, file_size)
+
+    def test_iterate_file_range_file_shorter(self):
+        # the file was truncated after its size was determined
+        self.assertEqual(b''.join(file_serving.iterate_file_range(self.file_path, 1000, 2000)), self.content[1000:])
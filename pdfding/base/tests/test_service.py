@@ -1,6 +1,17 @@
+from datetime import datetime, timezone
 from unittest.mock import patch
-
-from base.service import construct_query_overview_url, construct_search_and_tag_queries, process_raw_search_query
+from uuid import uuid4
+
+from base.service import (
+    construct_query_overview_url,
+    construct_search_and_tag_queries,
+    decode_cursor,
+    encode_cursor,
+    get_sort_expression,
+    process_raw_search_query,
+)
+from django.db.models import F
+from django.db.models.functions import Lower
 from django.test import TestCase
 from django.urls import reverse
 
@@ -62,3 +73,24 @@ class TestService(TestCase):
         generated_url = construct_query_overview_url(referer_url, '', 'starred', '', 'pdf')
 
         self.assertEqual(generated_url, f'{reverse('pdf_overview')}?search=searching&tags=asd&selection=starred')
+
+    def test_get_sort_expression(self):
+        self.assertEqual(get_sort_expression('-creation_date'), (F('creation_date'), True))
+        self.assertEqual(get_sort_expression('views'), (F('views'), False))
+        self.assertEqual(get_sort_expression(Lower('name')), (Lower('name'), False))
+        self.assertEqual(get_sort_expression(Lower('name').desc()), (Lower('name'), True))
+
+    def test_encode_decode_cursor(self):
+        creation_date = datetime(2025, 3, 11, 8, 16, 49, 123456, tzinfo=timezone.utc)
+        object_id = uuid4()
+
+        cursor = encode_cursor(creation_date, object_id)
+
+        self.assertNotIn('/', cursor)
+        self.assertEqual(decode_cursor(cursor), (str(creation_date), str(object_id)))
+        self.assertEqual(decode_cursor(encode_cursor('name', 3)), ('name', 3))
+
+    def test_decode_cursor_invalid(self):
+        for cursor in ['invalid', 'WzFd', 'MQ==', '_w==']:
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
@@ -1,4 +1,5 @@
 import pytest
+from django.core.cache import cache
 
 
 @pytest.fixture(autouse=True)
@@ -12,3 +13,12 @@ def whitenoise_autorefresh(settings):
         - https://github.com/evansd/whitenoise/commit/4204494d44213f7a51229de8bc224cf6d84c01eb
     """
     settings.WHITENOISE_AUTOREFRESH = True
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """
+    Clear the cache before each test. As the ids of the objects are reused across tests, cached values of previous
+    tests could otherwise be returned.
+    """
+    cache.clear()
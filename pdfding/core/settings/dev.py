@@ -49,12 +49,25 @@ BACKUP_BUCKET_NAME = 'pdfding'
 BACKUP_SCHEDULE = '*/1 * * * *'
 BACKUP_ENCRYPTION_ENABLED = True
 BACKUP_ENCRYPTION_SALT = 'pdfding'
+BACKUP_UPLOAD_WORKERS = 4
+BACKUP_PART_SIZE = 16 * 1024 * 1024
+BACKUP_VERIFICATION_INTERVAL = 7
 
 CONSUME_ENABLED = True
 CONSUME_TAG_STRING = 'consumed file'
 CONSUME_SCHEDULE = '*/1 * * * *'
 CONSUME_SKIP_EXISTING = True
 
+DEFERRED_PROCESSING_ENABLED = False
+PDF_PROCESSING_WORKERS = 1
+PDF_PROCESSING_BATCH_SIZE = 25
+PDF_LINEARIZATION_ENABLED = False
+
+FILE_OFFLOAD = None
+FILE_OFFLOAD_LOCATION = '/protected_media/'
+
+READING_PROGRESS_BUFFER_ENABLED = False
+
 ALLOW_PDF_SUB_DIRECTORIES = True
 
 # check if minio access and secret keys are set in dev_secrets
@@ -1,4 +1,6 @@
-from os import environ
+from os import cpu_count, environ
+from pathlib import Path
+from tempfile import gettempdir
 
 from django.contrib.auth.hashers import check_password
 
@@ -51,6 +53,15 @@ if environ.get('SECURE_SSL_REDIRECT') == 'TRUE':
 if environ.get('SECURE_HSTS_SECONDS'):
     SECURE_HSTS_SECONDS = environ.get('SECURE_HSTS_SECONDS')
 
+# the cache is file based, so that it is shared by the gunicorn workers and invalidating a cached value in one
+# worker also affects the other workers
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': Path(gettempdir()) / 'pdfding_cache',
+    }
+}
+
 # backup settings
 if environ.get('BACKUP_ENABLE') == 'TRUE':
     # without a dummy value, huey will not start
@@ -64,6 +75,11 @@ if environ.get('BACKUP_ENABLE') == 'TRUE':
         BACKUP_SECURE = True
     else:
         BACKUP_SECURE = False
+    # the number of files uploaded in parallel and the part size in MiB of files uploaded in multiple parts
+    BACKUP_UPLOAD_WORKERS = int(environ.get('BACKUP_UPLOAD_WORKERS', 4))
+    BACKUP_PART_SIZE = int(environ.get('BACKUP_PART_SIZE', 16)) * 1024 * 1024
+    # the interval in days in which the backup manifest is verified against the objects in the bucket
+    BACKUP_VERIFICATION_INTERVAL = int(environ.get('BACKUP_VERIFICATION_INTERVAL', 7))
 
     if environ.get('BACKUP_ENCRYPTION_ENABLE') == 'TRUE':
         BACKUP_ENCRYPTION_ENABLED = True
@@ -92,6 +108,40 @@ else:
     CONSUME_SKIP_EXISTING = False
     CONSUME_SCHEDULE = '*/5 * * * *'
 
+# deferred processing settings. if enabled, pdfs will be processed by the huey worker after being uploaded.
+if environ.get('DEFERRED_PROCESSING_ENABLE') == 'TRUE':
+    DEFERRED_PROCESSING_ENABLED = True
+else:
+    DEFERRED_PROCESSING_ENABLED = False
+
+# bulk processing settings. the number of worker processes used for processing pdfs added in bulk and the number of
+# pdfs committed to the database in one transaction.
+PDF_PROCESSING_WORKERS = int(environ.get('PDF_PROCESSING_WORKERS', cpu_count() or 1))
+PDF_PROCESSING_BATCH_SIZE = int(environ.get('PDF_PROCESSING_BATCH_SIZE', 25))
+
+# linearization settings. if enabled, a linearized copy of each pdf is created with qpdf by the huey worker. the copy
+# is used in the viewer, so that the first page can be displayed before the whole pdf is downloaded.
+if environ.get('PDF_LINEARIZATION_ENABLE') == 'TRUE':
+    PDF_LINEARIZATION_ENABLED = True
+else:
+    PDF_LINEARIZATION_ENABLED = False
+
+# file offload settings. if set, files are not sent by django, but by the reverse proxy in front of PdfDing. django
+# only checks the access and points the proxy to the file via the X-Accel-Redirect (nginx) or X-Sendfile header.
+if environ.get('FILE_OFFLOAD') in ['X_ACCEL_REDIRECT', 'X_SENDFILE']:
+    FILE_OFFLOAD = environ.get('FILE_OFFLOAD')
+else:
+    FILE_OFFLOAD = None
+# the internal location of the reverse proxy that serves the media directory, only needed for X-Accel-Redirect
+FILE_OFFLOAD_LOCATION = environ.get('FILE_OFFLOAD_LOCATION', '/protected_media/')
+
+# reading progress settings. if enabled, the current pages of the viewed pdfs are buffered in the cache and written to
+# the database by the huey worker every minute.
+if environ.get('READING_PROGRESS_BUFFER_ENABLE') == 'TRUE':
+    READING_PROGRESS_BUFFER_ENABLED = True
+else:
+    READING_PROGRESS_BUFFER_ENABLED = False
+
 # mail settings
 if environ.get('EMAIL_BACKEND') == 'SMTP':
     EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
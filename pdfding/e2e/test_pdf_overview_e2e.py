@@ -399,7 +399,7 @@ class PdfOverviewE2ETestCase(PdfDingE2ETestCase):
             expect(self.page.locator("#star-1")).to_contain_text("Star")
 
     @staticmethod
-    def new_fuzzy_filter_pdfs(pdfs, search):
+    def new_fuzzy_filter_pdfs(pdfs, search, profile):
         filtered_pdfs = pdfs.filter(name__icontains=search)
 
         return filtered_pdfs
@@ -0,0 +1,113 @@
+from io import BytesIO
+from tempfile import NamedTemporaryFile
+from time import perf_counter
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from pdf.models.pdf_models import Pdf
+from pdf.service import PdfProcessingServices
+from pdf.services.pdf_analysis import analyse_pdf_file, extract_highlights_and_comments
+from pypdf import PdfWriter
+from pypdf.annotations import FreeText, Highlight
+from pypdf.generic import ArrayObject, DecodedStreamObject, DictionaryObject, FloatObject, NameObject, TextStringObject
+
+# the creation date of the synthetic annotations
+CREATION_DATE = TextStringObject('D:20250311081649')
+
+
+def create_annotated_pdf(number_of_pages: int, highlights_per_page: int, comments_per_page: int) -> bytes:
+    """
+    Create a synthetic pdf. Every page contains one line of text per highlight and each line is highlighted.
+    Additionally, each page contains the specified number of comments.
+    """
+
+    writer = PdfWriter()
+    font = DictionaryObject(
+        {
+            NameObject('/Type'): NameObject('/Font'),
+            NameObject('/Subtype'): NameObject('/Type1'),
+            NameObject('/BaseFont'): NameObject('/Helvetica'),
+        }
+    )
+
+    for page_number in range(number_of_pages):
+        page = writer.add_blank_page(width=612, height=792)
+        page[NameObject('/Resources')] = DictionaryObject(
+            {NameObject('/Font'): DictionaryObject({NameObject('/F1'): font})}
+        )
+
+        line_positions = [770 - 15 * i for i in range(highlights_per_page)]
+        content = DecodedStreamObject()
+        content.set_data(
+            ''.join(
+                f'BT /F1 10 Tf 50 {y} Td (Line {i} of page {page_number}) Tj ET\n' for i, y in enumerate(line_positions)
+            ).encode()
+        )
+        page.replace_contents(content)
+
+        for y in line_positions:
+            # quad points: top left, top right, bottom left, bottom right
+            quad_points = ArrayObject(FloatObject(value) for value in [48, y + 10, 200, y + 10, 48, y - 2, 200, y - 2])
+            highlight = Highlight(rect=(48, y - 2, 200, y + 10), quad_points=quad_points)
+            highlight[NameObject('/CreationDate')] = CREATION_DATE
+            writer.add_annotation(page_number=page_number, annotation=highlight)
+
+        for i in range(comments_per_page):
+            comment = FreeText(text=f'Comment {i} of page {page_number}', rect=(300, 700 - 20 * i, 500, 715 - 20 * i))
+            comment[NameObject('/CreationDate')] = CREATION_DATE
+            writer.add_annotation(page_number=page_number, annotation=comment)
+
+    pdf_io = BytesIO()
+    writer.write(pdf_io)
+
+    return pdf_io.getvalue()
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark extracting and importing the highlights and comments of a synthetic, heavily annotated pdf. The "
+        "import is executed in a separate test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('-p', '--pages', type=int, default=50, help='The number of pages of the pdf')
+        parser.add_argument('--highlights', type=int, default=40, help='The number of highlights per page')
+        parser.add_argument('--comments', type=int, default=10, help='The number of comments per page')
+
+    def handle(self, *args, **kwargs):
+        number_of_pages = kwargs['pages']
+        pdf_bytes = create_annotated_pdf(number_of_pages, kwargs['highlights'], kwargs['comments'])
+
+        with NamedTemporaryFile(suffix='.pdf') as pdf_file:
+            pdf_file.write(pdf_bytes)
+            pdf_file.flush()
+
+            start = perf_counter()
+            comments, highlights = extract_highlights_and_comments(pdf_file.name)
+            extraction_duration = perf_counter() - start
+
+            start = perf_counter()
+            analyse_pdf_file(pdf_file.name)
+            analysis_duration = perf_counter() - start
+
+        old_database_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+
+        try:
+            # the user only owns the seeded data, so it is created without a usable password
+            user = User.objects.create_user(username='benchmark', email='benchmark@pdfding.com')
+            pdf = Pdf.objects.create(owner=user.profile, name='annotated', file='annotated.pdf')
+
+            with CaptureQueriesContext(connection) as queries:
+                start = perf_counter()
+                PdfProcessingServices.save_highlights_and_comments(pdf, comments, highlights)
+                import_duration = perf_counter() - start
+        finally:
+            connection.creation.destroy_test_db(old_database_name, verbosity=0)
+
+        self.stdout.write(
+            f'Extracted {len(highlights)} highlights and {len(comments)} comments in {extraction_duration:.3f}s'
+        )
+        self.stdout.write(f'Imported them in {import_duration:.3f}s with {len(queries)} queries')
+        self.stdout.write(f'Analysed the pdf with {number_of_pages} annotated pages in {analysis_duration:.3f}s')
@@ -0,0 +1,161 @@
+import ctypes
+from pathlib import Path
+
+import pypdfium2.raw as pdfium_c
+from django.core.management.base import BaseCommand, CommandError
+from pdf.services.pdf_analysis import linearize_pdf_file
+
+# the default chunk size of the range requests of pdf.js
+PDF_JS_RANGE_CHUNK_SIZE = 65536
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the time to the first page of pdfs and their linearized copies, when they are loaded via range "
+        "requests like pdf.js does. The loading is simulated with the availability api of pdfium, so that the "
+        "benchmark does not depend on the network. Requires qpdf for linearizing the pdfs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', type=Path, help='The pdf files to benchmark')
+        parser.add_argument(
+            '-c', '--chunk-size', type=int, default=PDF_JS_RANGE_CHUNK_SIZE, help='The size of a range request in bytes'
+        )
+        parser.add_argument('-l', '--latency', type=float, default=100, help='The round trip time in ms')
+        parser.add_argument('-b', '--bandwidth', type=float, default=10, help='The bandwidth in Mbit/s')
+
+    def handle(self, *args, **kwargs):
+        # the loading times are displayed as "time to first page (requests, loaded bytes)"
+        self.stdout.write(f'{"File":<30}{"Size":>12}{"original":>30}{"linearized":>30}{"full download":>18}')
+
+        for file_path in kwargs['files']:
+            try:
+                linearized_file_path = linearize_pdf_file(str(file_path))
+            except FileNotFoundError as e:
+                raise CommandError(str(e))
+
+            pdf_bytes = file_path.read_bytes()
+
+            if linearized_file_path:
+                try:
+                    linearized_pdf_bytes = Path(linearized_file_path).read_bytes()
+                finally:
+                    Path(linearized_file_path).unlink(missing_ok=True)
+            else:
+                # the pdf is already linearized
+                linearized_pdf_bytes = pdf_bytes
+
+            formatted_times = []
+
+            for current_pdf_bytes in [pdf_bytes, linearized_pdf_bytes]:
+                requests, loaded_bytes = simulate_first_page_loading(current_pdf_bytes, kwargs['chunk_size'])
+                loading_time = get_loading_time(requests, loaded_bytes, kwargs['latency'], kwargs['bandwidth'])
+                formatted_times.append(f'{loading_time:.0f} ms ({requests}, {format_size(loaded_bytes)})')
+
+            full_download_time = get_loading_time(1, len(pdf_bytes), kwargs['latency'], kwargs['bandwidth'])
+
+            self.stdout.write(
+                f'{file_path.name[:29]:<30}{format_size(len(pdf_bytes)):>12}{formatted_times[0]:>30}'
+                f'{formatted_times[1]:>30}{f"{full_download_time:.0f} ms":>18}'
+            )
+
+
+class SimulatedRangeLoader:
+    """
+    Simulates loading a file in chunks via range requests. pdfium reports which data it needs, the missing chunks are
+    then loaded with a single request.
+    """
+
+    def __init__(self, chunk_size: int):
+        self.chunk_size = chunk_size
+        self.loaded_chunks = set()
+        self.missing_chunks = set()
+        self.requests = 0
+
+    def is_available(self, offset: int, size: int) -> bool:
+        """Check if the data is loaded. If not, the missing chunks are loaded by the next request."""
+
+        chunks = range(offset // self.chunk_size, (offset + max(size, 1) - 1) // self.chunk_size + 1)
+        missing_chunks = set(chunks) - self.loaded_chunks
+        self.missing_chunks |= missing_chunks
+
+        return not missing_chunks
+
+    def load_missing_chunks(self):
+        self.requests += 1
+        self.loaded_chunks |= self.missing_chunks
+        self.missing_chunks = set()
+
+    @property
+    def loaded_bytes(self) -> int:
+        return len(self.loaded_chunks) * self.chunk_size
+
+
+def simulate_first_page_loading(pdf_bytes: bytes, chunk_size: int) -> tuple[int, int]:
+    """
+    Simulate loading the pdf via range requests until the first page can be rendered. Returns the number of requests
+    and the number of loaded bytes.
+    """
+
+    loader = SimulatedRangeLoader(chunk_size)
+    # like pdf.js, start by loading the beginning of the file
+    loader.is_available(0, 1)
+    loader.load_missing_chunks()
+
+    pdf_buffer = ctypes.create_string_buffer(pdf_bytes, len(pdf_bytes))
+
+    def get_block(_, position, block_buffer, size):
+        ctypes.memmove(block_buffer, ctypes.addressof(pdf_buffer) + position, size)
+        return 1
+
+    file_access = pdfium_c.FPDF_FILEACCESS()
+    file_access.m_FileLen = len(pdf_bytes)
+    file_access.m_GetBlock = type(file_access.m_GetBlock)(get_block)
+
+    file_availability = pdfium_c.FX_FILEAVAIL(version=1)
+    file_availability.IsDataAvail = type(file_availability.IsDataAvail)(
+        lambda _, offset, size: loader.is_available(offset, size)
+    )
+
+    download_hints = pdfium_c.FX_DOWNLOADHINTS(version=1)
+    download_hints.AddSegment = type(download_hints.AddSegment)(
+        lambda _, offset, size: loader.is_available(offset, size)
+    )
+
+    availability = pdfium_c.FPDFAvail_Create(file_availability, file_access)
+
+    try:
+        while pdfium_c.FPDFAvail_IsDocAvail(availability, download_hints) == pdfium_c.PDF_DATA_NOTAVAIL:
+            loader.load_missing_chunks()
+
+        document = pdfium_c.FPDFAvail_GetDocument(availability, None)
+
+        if not document:
+            raise CommandError('The pdf could not be opened')
+
+        # the first page of a linearized pdf is not necessarily the page with index 0
+        first_page = pdfium_c.FPDFAvail_GetFirstPageNum(document)
+
+        while pdfium_c.FPDFAvail_IsPageAvail(availability, first_page, download_hints) == pdfium_c.PDF_DATA_NOTAVAIL:
+            loader.load_missing_chunks()
+
+        pdfium_c.FPDF_CloseDocument(document)
+    finally:
+        pdfium_c.FPDFAvail_Destroy(availability)
+
+    return loader.requests, min(loader.loaded_bytes, len(pdf_bytes))
+
+
+def get_loading_time(requests: int, loaded_bytes: int, latency: float, bandwidth: float) -> float:
+    """Get the time in ms for loading the bytes with the specified number of sequential requests."""
+
+    return requests * latency + 8 * loaded_bytes / (1000 * bandwidth)
+
+
+def format_size(size: int) -> str:
+    """Format the size in bytes as KB or MB."""
+
+    if size < 1024 * 1024:
+        return f'{size / 1024:.0f} KB'
+
+    return f'{size / 1024 / 1024:.1f} MB'
@@ -0,0 +1,170 @@
+from datetime import datetime, timedelta, timezone
+from statistics import median
+from time import perf_counter
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from pdf.models.pdf_models import Pdf, PdfComment, PdfHighlight
+from pdf.models.shared_pdf_models import SharedPdf
+from users.models import Profile
+
+# the models whose indexes are dropped for the measurement without indexes
+INDEXED_MODELS = [Pdf, PdfComment, PdfHighlight, SharedPdf]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the overview pages with and without the overview indexes. The benchmark is executed in a separate "
+        "test database, that is seeded with the specified number of users and PDFs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('-u', '--users', type=int, default=5, help='The number of seeded users')
+        parser.add_argument('-p', '--pdfs', type=int, default=2000, help='The number of seeded PDFs per user')
+        parser.add_argument('-a', '--annotations', type=int, default=2, help='The number of highlights per PDF')
+        parser.add_argument('-r', '--repetitions', type=int, default=10, help='The number of requests per overview')
+
+    def handle(self, *args, **kwargs):
+        old_database_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+
+        try:
+            self.stdout.write(f'Seeding {kwargs["users"]} users with {kwargs["pdfs"]} PDFs each')
+            user = seed_database(kwargs['users'], kwargs['pdfs'], kwargs['annotations'])
+
+            durations_without_indexes = self.measure_without_indexes(user, kwargs['repetitions'])
+            durations_with_indexes = measure_overviews(user, kwargs['repetitions'])
+        finally:
+            connection.creation.destroy_test_db(old_database_name, verbosity=0)
+
+        # the durations are displayed as "total duration (database duration)"
+        self.stdout.write(f'{"Overview":<25}{"without indexes":>30}{"with indexes":>30}')
+
+        for overview, durations in durations_without_indexes.items():
+            formatted_durations = [
+                f'{total_duration:.1f} ms ({database_duration:.1f} ms)'
+                for total_duration, database_duration in [durations, durations_with_indexes[overview]]
+            ]
+            self.stdout.write(f'{overview:<25}{formatted_durations[0]:>30}{formatted_durations[1]:>30}')
+
+    @staticmethod
+    def measure_without_indexes(user: User, repetitions: int) -> dict[str, tuple[float, float]]:
+        """Measure the overviews after temporarily dropping the indexes of the indexed models."""
+
+        with connection.schema_editor() as schema_editor:
+            for model in INDEXED_MODELS:
+                for index in model._meta.indexes:
+                    schema_editor.remove_index(model, index)
+
+        analyze_database()
+
+        try:
+            return measure_overviews(user, repetitions)
+        finally:
+            with connection.schema_editor() as schema_editor:
+                for model in INDEXED_MODELS:
+                    for index in model._meta.indexes:
+                        schema_editor.add_index(model, index)
+
+            analyze_database()
+
+
+def seed_database(number_of_users: int, pdfs_per_user: int, annotations_per_pdf: int) -> User:
+    """Seed the database with users, PDFs and highlights. Returns the last created user."""
+
+    for user_number in range(number_of_users):
+        # the users are logged in via force_login, so they are created without a usable password
+        user = User.objects.create_user(
+            username=f'benchmark_{user_number}', email=f'benchmark_{user_number}@pdfding.com'
+        )
+
+        # vary the values deterministically, so that the sortings do not match the insertion order
+        pdfs = Pdf.objects.bulk_create(
+            [
+                Pdf(
+                    owner=user.profile,
+                    name=f'PDF {i * 7919 % pdfs_per_user}',
+                    file=f'{user.id}/pdf_{i}.pdf',
+                    archived=i % 10 == 0,
+                    starred=i % 20 == 1,
+                    views=i * 31 % 100,
+                    last_viewed_date=datetime(2025, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=i * 37 % 10000),
+                )
+                for i in range(pdfs_per_user)
+            ],
+            batch_size=500,
+        )
+        PdfHighlight.objects.bulk_create(
+            [
+                PdfHighlight(
+                    owner=user.profile,
+                    pdf=pdf,
+                    text=f'Highlight {i}',
+                    page=i + 1,
+                    creation_date=datetime(2025, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=j * 13 % 10000 + i),
+                )
+                for j, pdf in enumerate(pdfs)
+                for i in range(annotations_per_pdf)
+            ],
+            batch_size=500,
+        )
+
+    analyze_database()
+
+    return user
+
+
+def analyze_database():
+    """Collect the statistics of the tables and indexes, so that the query planner can choose the best indexes."""
+
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def measure_overviews(user: User, repetitions: int) -> dict[str, tuple[float, float]]:
+    """
+    Measure the median durations in milliseconds of loading the overviews of the user. For each overview the total
+    duration and the duration of the database queries are returned.
+    """
+
+    client = Client()
+    client.force_login(user)
+    headers = {'HTTP_HX-Request': 'true'}
+    durations = dict()
+
+    # the overviews are requested via htmx, so that only the overview itself is rendered
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+        for sorting in Profile.PdfSortingChoice.values:
+            Profile.objects.filter(user=user).update(pdf_sorting=sorting)
+            durations[f'PDFs ({sorting})'] = measure_url(client, reverse('pdf_overview'), headers, repetitions)
+
+        Profile.objects.filter(user=user).update(pdf_sorting=Profile.PdfSortingChoice.NEWEST)
+
+        for selection in ['starred', 'archived']:
+            url = f'{reverse('pdf_overview')}?selection={selection}'
+            durations[f'PDFs ({selection})'] = measure_url(client, url, headers, repetitions)
+
+        durations['Highlights'] = measure_url(client, reverse('pdf_highlight_overview'), headers, repetitions)
+
+    return durations
+
+
+def measure_url(client: Client, url: str, headers: dict, repetitions: int) -> tuple[float, float]:
+    """Measure the median total duration and database duration in milliseconds of requesting the url."""
+
+    total_durations = []
+    database_durations = []
+
+    for _ in range(repetitions):
+        with CaptureQueriesContext(connection) as queries:
+            start = perf_counter()
+            client.get(url, secure=True, **headers)
+            total_durations.append(1000 * (perf_counter() - start))
+
+        database_durations.append(1000 * sum(float(query['time']) for query in queries))
+
+    return median(total_durations), median(database_durations)
@@ -0,0 +1,118 @@
+from statistics import median
+from time import perf_counter
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q, QuerySet
+from pdf.models.pdf_models import Pdf, Tag
+from pdf.views.pdf_views import OverviewMixin
+from users.models import Profile
+
+# the number of pdfs displayed on the first page of the overview
+PAGE_SIZE = 13
+# every topic tag has this number of subtopics and the library tag has this number of shelves
+SUBTOPICS_PER_TOPIC = 9
+SHELVES = 9
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark filtering the PDF overview by hierarchical tags with EXISTS subqueries against joining the tags. "
+        "The benchmark is executed in a separate test database, that is seeded with the specified number of PDFs and "
+        "tags."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('-p', '--pdfs', type=int, default=10000, help='The number of seeded PDFs')
+        parser.add_argument('-t', '--topics', type=int, default=100, help='The number of seeded topic tags')
+        parser.add_argument('-r', '--repetitions', type=int, default=3, help='The number of loads per tag filter')
+
+    def handle(self, *args, **kwargs):
+        old_database_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+
+        try:
+            self.stdout.write(f'Seeding {kwargs["pdfs"]} PDFs with {kwargs["topics"]} topics')
+            # the user only owns the seeded data, so it is created without a usable password
+            user = User.objects.create_user(username='benchmark', email='benchmark@pdfding.com')
+            seed_tagged_pdfs(user.profile, kwargs['pdfs'], kwargs['topics'])
+
+            durations = measure_tag_filters(user.profile, kwargs['topics'], kwargs['repetitions'])
+        finally:
+            connection.creation.destroy_test_db(old_database_name, verbosity=0)
+
+        self.stdout.write(f'{"Tags":<40}{"joins":>15}{"subqueries":>15}')
+
+        for tag_names, (join_duration, subquery_duration) in durations.items():
+            self.stdout.write(f'{tag_names:<40}{join_duration:>12.1f} ms{subquery_duration:>12.1f} ms')
+
+
+def seed_tagged_pdfs(profile: Profile, number_of_pdfs: int, number_of_topics: int):
+    """
+    Seed the profile with topic tags, their subtopics and a library tag with shelves. Every PDF is put on a shelf and
+    gets two subtopics of three different topics each.
+    """
+
+    tag_names = ['library'] + [f'library/shelf_{i}' for i in range(SHELVES)]
+    for i in range(number_of_topics):
+        tag_names += [f'topic_{i}'] + [f'topic_{i}/sub_{j}' for j in range(SUBTOPICS_PER_TOPIC)]
+    tags = {tag.name: tag for tag in Tag.objects.bulk_create([Tag(name=name, owner=profile) for name in tag_names])}
+
+    pdfs = Pdf.objects.bulk_create(
+        [Pdf(owner=profile, name=f'pdf_{i}', file=f'pdf_{i}.pdf') for i in range(number_of_pdfs)], batch_size=500
+    )
+
+    pdf_tags = []
+    for i, pdf in enumerate(pdfs):
+        pdf_tag_names = [f'library/shelf_{i % SHELVES}']
+        for k in range(3):
+            topic = (i + 7 * k) % number_of_topics
+            pdf_tag_names += [f'topic_{topic}/sub_{(i + j) % SUBTOPICS_PER_TOPIC}' for j in range(2)]
+
+        pdf_tags += [Pdf.tags.through(pdf_id=pdf.id, tag_id=tags[name].id) for name in set(pdf_tag_names)]
+
+    Pdf.tags.through.objects.bulk_create(pdf_tags, batch_size=1000)
+
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def filter_pdfs_by_joins(pdfs: QuerySet, tag_names: list[str]) -> QuerySet:
+    """Filter the PDFs by tags like the overview did before, by joining the tags once per tag."""
+
+    for tag_name in tag_names:
+        pdfs = pdfs.filter(Q(tags__name=tag_name) | Q(tags__name__startswith=f'{tag_name}/')).distinct()
+
+    return pdfs
+
+
+def measure_tag_filters(profile: Profile, number_of_topics: int, repetitions: int) -> dict[str, tuple[float, float]]:
+    """
+    Measure the median durations in milliseconds of loading the first overview page filtered by different tags. For
+    each tag filter the durations of joining the tags and of using subqueries are returned.
+    """
+
+    pdfs = profile.pdfs.filter(archived=False)
+    topics = [f'topic_{i % number_of_topics}' for i in [1, 8, 15]]
+    durations = dict()
+
+    for tag_names in [topics, ['library', topics[0]], ['library/shelf_1'], ['library']]:
+        durations[' '.join(tag_names)] = (
+            measure_first_page(filter_pdfs_by_joins(pdfs, tag_names), repetitions),
+            measure_first_page(OverviewMixin.filter_pdfs_by_tags(pdfs, tag_names, profile), repetitions),
+        )
+
+    return durations
+
+
+def measure_first_page(pdfs: QuerySet, repetitions: int) -> float:
+    """Measure the median duration in milliseconds of loading the first page of the overview."""
+
+    durations = []
+
+    for _ in range(repetitions):
+        start = perf_counter()
+        list(pdfs.order_by('-creation_date', '-id')[:PAGE_SIZE])
+        durations.append(1000 * (perf_counter() - start))
+
+    return median(durations)
@@ -0,0 +1,44 @@
+import logging
+
+from django.core.management.base import BaseCommand
+from pdf.models.pdf_models import Pdf
+from pdf.service import PdfProcessingServices
+
+logger = logging.getLogger('management')
+
+# the progress is logged after every n pdfs
+PROGRESS_LOG_INTERVAL = 100
+
+
+class Command(BaseCommand):
+    help = (
+        "Extract and index the page texts of pdfs uploaded before the full-text search was added. Every pdf is "
+        "indexed in its own transaction, so that PdfDing stays usable and an interrupted run can simply be restarted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true', help='Index all pdfs instead of only the pdfs without page texts'
+        )
+
+    def handle(self, *args, **kwargs):
+        pdfs = Pdf.objects.select_related('owner__user').order_by('id')
+
+        if not kwargs['all']:
+            pdfs = pdfs.filter(pdfpagetext__isnull=True)
+
+        number_of_pdfs = pdfs.count()
+        number_of_failed_pdfs = 0
+
+        logger.info(f'Indexing the page texts of {number_of_pdfs} pdfs.')
+
+        for i, pdf in enumerate(pdfs.iterator()):
+            if not PdfProcessingServices.set_page_texts(pdf):
+                number_of_failed_pdfs += 1
+
+            if (i + 1) % PROGRESS_LOG_INTERVAL == 0:
+                logger.info(f'Indexed {i + 1} / {number_of_pdfs} pdfs')
+
+        logger.info(
+            f'Indexed the page texts of {number_of_pdfs - number_of_failed_pdfs} pdfs, {number_of_failed_pdfs} failed.'
+        )
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pdf', '0021_adjust_workspace_role_names'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdf',
+            name='processing_status',
+            field=models.CharField(
+                choices=[('Pending', 'Pending'), ('Processing', 'Processing'), ('Done', 'Done'), ('Failed', 'Failed')],
+                default='Done',
+                editable=False,
+                max_length=10,
+            ),
+        ),
+    ]
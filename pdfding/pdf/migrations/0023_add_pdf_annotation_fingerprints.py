@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pdf', '0022_add_pdf_processing_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdf',
+            name='annotation_fingerprints',
+            field=models.JSONField(default=list, editable=False),
+        ),
+    ]
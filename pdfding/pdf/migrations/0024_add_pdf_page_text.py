@@ -0,0 +1,71 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+SQLITE_FTS_STATEMENTS = [
+    # external content table, the texts are only stored once in pdf_pdfpagetext
+    "CREATE VIRTUAL TABLE pdf_pdfpagetext_fts USING fts5("
+    "text, content='pdf_pdfpagetext', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    # keep the index in sync with the page texts
+    "CREATE TRIGGER pdf_pdfpagetext_ai AFTER INSERT ON pdf_pdfpagetext BEGIN "
+    "INSERT INTO pdf_pdfpagetext_fts(rowid, text) VALUES (new.id, new.text); END",
+    "CREATE TRIGGER pdf_pdfpagetext_ad AFTER DELETE ON pdf_pdfpagetext BEGIN "
+    "INSERT INTO pdf_pdfpagetext_fts(pdf_pdfpagetext_fts, rowid, text) VALUES ('delete', old.id, old.text); END",
+    "CREATE TRIGGER pdf_pdfpagetext_au AFTER UPDATE OF text ON pdf_pdfpagetext BEGIN "
+    "INSERT INTO pdf_pdfpagetext_fts(pdf_pdfpagetext_fts, rowid, text) VALUES ('delete', old.id, old.text); "
+    "INSERT INTO pdf_pdfpagetext_fts(rowid, text) VALUES (new.id, new.text); END",
+]
+SQLITE_FTS_REVERSE_STATEMENTS = [
+    "DROP TRIGGER IF EXISTS pdf_pdfpagetext_ai",
+    "DROP TRIGGER IF EXISTS pdf_pdfpagetext_ad",
+    "DROP TRIGGER IF EXISTS pdf_pdfpagetext_au",
+    "DROP TABLE IF EXISTS pdf_pdfpagetext_fts",
+]
+POSTGRES_FTS_STATEMENTS = [
+    "CREATE INDEX pdf_pdfpagetext_text_gin ON pdf_pdfpagetext USING GIN (to_tsvector('simple', text))",
+]
+POSTGRES_FTS_REVERSE_STATEMENTS = ["DROP INDEX IF EXISTS pdf_pdfpagetext_text_gin"]
+
+
+def get_fts_statements(vendor: str, reverse: bool = False) -> list[str]:
+    """Get the statements for creating or dropping the full-text index of the page texts."""
+
+    if vendor == 'postgresql':  # pragma: no cover
+        return POSTGRES_FTS_REVERSE_STATEMENTS if reverse else POSTGRES_FTS_STATEMENTS
+    else:
+        return SQLITE_FTS_REVERSE_STATEMENTS if reverse else SQLITE_FTS_STATEMENTS
+
+
+def create_full_text_index(apps, schema_editor):
+    """Create the full-text index of the page texts depending on the used database."""
+
+    for statement in get_fts_statements(schema_editor.connection.vendor):
+        schema_editor.execute(statement)
+
+
+def drop_full_text_index(apps, schema_editor):  # pragma: no cover
+    for statement in get_fts_statements(schema_editor.connection.vendor, reverse=True):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pdf', '0023_add_pdf_annotation_fingerprints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PdfPageText',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(blank=True, default='', max_length=32)),
+                ('page', models.IntegerField()),
+                ('text', models.TextField(blank=True)),
+                ('pdf', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pdf.pdf')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('pdf', 'page'), name='unique_pdf_page_text')],
+            },
+        ),
+        migrations.RunPython(create_full_text_index, drop_full_text_index),
+    ]
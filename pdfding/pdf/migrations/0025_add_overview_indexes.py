@@ -0,0 +1,76 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:05
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pdf', '0024_add_pdf_page_text'),
+        ('users', '0025_add_pdf_names_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pdf',
+            index=models.Index(
+                condition=models.Q(('archived', False)),
+                fields=['owner', 'creation_date', 'id'],
+                name='pdf_owner_creation_date_idx',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='pdf',
+            index=models.Index(
+                models.F('owner'),
+                django.db.models.functions.text.Lower('name'),
+                models.F('id'),
+                condition=models.Q(('archived', False)),
+                name='pdf_owner_name_idx',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='pdf',
+            index=models.Index(
+                condition=models.Q(('archived', False)), fields=['owner', 'views', 'id'], name='pdf_owner_views_idx'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='pdf',
+            index=models.Index(
+                condition=models.Q(('archived', False)),
+                fields=['owner', 'last_viewed_date', 'id'],
+                name='pdf_owner_last_viewed_idx',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='pdf',
+            index=models.Index(
+                condition=models.Q(('archived', False), ('starred', True)),
+                fields=['owner', 'creation_date', 'id'],
+                name='pdf_owner_starred_idx',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='pdfcomment',
+            index=models.Index(fields=['pdf', 'creation_date', 'id'], name='pdfcomment_creation_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pdfhighlight',
+            index=models.Index(fields=['pdf', 'creation_date', 'id'], name='pdfhighlight_creation_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sharedpdf',
+            index=models.Index(fields=['owner', 'creation_date', 'id'], name='sharedpdf_owner_creation_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sharedpdf',
+            index=models.Index(
+                models.F('owner'),
+                django.db.models.functions.text.Lower('name'),
+                models.F('id'),
+                name='sharedpdf_owner_name_idx',
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:15
+
+import pdf.models.pdf_models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pdf', '0025_add_overview_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdf',
+            name='linearized_file',
+            field=models.FileField(
+                blank=True, max_length=500, null=True, upload_to=pdf.models.pdf_models.get_linearized_file_path
+            ),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_annotation_owners(apps, schema_editor):
+    """Set the owner of the existing annotations to the owner of their pdf."""
+
+    pdf_model = apps.get_model('pdf', 'Pdf')
+
+    for model_name in ['PdfComment', 'PdfHighlight']:
+        annotation_model = apps.get_model('pdf', model_name)
+        annotation_model.objects.update(
+            owner=Subquery(pdf_model.objects.filter(id=OuterRef('pdf_id')).values('owner')[:1])
+        )
+
+
+def reverse_func(apps, schema_editor):  # pragma: no cover
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pdf', '0027_add_linearized_file'),
+        ('users', '0025_add_pdf_names_version'),
+    ]
+
+    # the owner is made non-nullable by the next migration, as postgres does not allow altering a table with pending
+    # foreign key checks of the updated rows in the same transaction
+    operations = [
+        migrations.AddField(
+            model_name='pdfcomment',
+            name='owner',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='users.profile'),
+        ),
+        migrations.AddField(
+            model_name='pdfhighlight',
+            name='owner',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='users.profile'),
+        ),
+        migrations.RunPython(fill_annotation_owners, reverse_func),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pdf', '0028_add_annotation_owner'),
+        ('users', '0025_add_pdf_names_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pdfcomment',
+            name='owner',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='users.profile'),
+        ),
+        migrations.AlterField(
+            model_name='pdfhighlight',
+            name='owner',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='users.profile'),
+        ),
+        migrations.AddIndex(
+            model_name='pdfcomment',
+            index=models.Index(fields=['owner', 'creation_date', 'id'], name='pdfcomment_owner_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pdfhighlight',
+            index=models.Index(fields=['owner', 'creation_date', 'id'], name='pdfhighlight_owner_date_idx'),
+        ),
+    ]
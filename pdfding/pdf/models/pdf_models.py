@@ -7,7 +7,8 @@ import nh3
 from core.settings import MEDIA_ROOT
 from django.contrib.humanize.templatetags.humanize import naturaltime
 from django.db import models
-from django.db.models import DateTimeField
+from django.db.models import DateTimeField, F, Q
+from django.db.models.functions import Lower
 from django.utils.safestring import mark_safe
 from django.utils.text import slugify
 from pdf.models.collection_models import Collection
@@ -108,6 +109,15 @@ def get_thumbnail_path(instance, _) -> str:
     return str(file_path)
 
 
+def get_linearized_file_path(instance, _) -> str:
+    """Get the file path for the linearized copy of a PDF."""
+
+    file_name = f'linearized/{instance.id}.pdf'
+    file_path = '/'.join([str(instance.owner.user.id), file_name])
+
+    return str(file_path)
+
+
 def get_preview_path(instance, _) -> str:
     """Get the file path for the preview of a PDF."""
 
@@ -135,6 +145,14 @@ def convert_to_natural_age(creation_date: DateTimeField) -> str:
 class Pdf(models.Model):
     """Model for the pdf files."""
 
+    class ProcessingStatus(models.TextChoices):
+        PENDING = 'Pending'
+        PROCESSING = 'Processing'
+        DONE = 'Done'
+        FAILED = 'Failed'
+
+    # fingerprints of the comments and highlights of each page, used for only re-extracting changed pages
+    annotation_fingerprints = models.JSONField(default=list, editable=False)
     archived = models.BooleanField(default=False)
     creation_date = models.DateTimeField(blank=False, editable=False, auto_now_add=True)
     collection = models.ForeignKey(Collection, on_delete=models.CASCADE, blank=False, null=True)
@@ -151,20 +169,59 @@ class Pdf(models.Model):
     last_viewed_date = models.DateTimeField(
         blank=False, editable=False, default=datetime(2000, 1, 1, tzinfo=timezone.utc)
     )
+    # a copy of the file that is optimized for loading the first page quickly, served instead of the file if present
+    linearized_file = models.FileField(upload_to=get_linearized_file_path, max_length=500, null=True, blank=True)
     name = models.CharField(max_length=150, blank=False)
     notes = models.TextField(default='', blank=True, help_text='Optional, supports Markdown')
     number_of_pages = models.IntegerField(default=-1)
     owner = models.ForeignKey(Profile, on_delete=models.CASCADE, blank=False)
     preview = models.FileField(upload_to=get_preview_path, null=True, blank=False)
+    processing_status = models.CharField(
+        choices=ProcessingStatus.choices, max_length=10, default=ProcessingStatus.DONE, editable=False
+    )
     revision = models.IntegerField(default=0)
     starred = models.BooleanField(default=False)
     tags = models.ManyToManyField(Tag, blank=True)
     thumbnail = models.FileField(upload_to=get_thumbnail_path, null=True, blank=False)
     views = models.IntegerField(default=0)
 
+    class Meta:
+        # indexes matching the filters and sortings of the overview, the id is the tie-breaker of the cursor
+        # pagination. The indexes are partial, as the overview either shows the archived or the not archived pdfs and
+        # only the latter need to be indexed, since usually only a small part of the pdfs is archived.
+        indexes = [
+            models.Index(
+                fields=['owner', 'creation_date', 'id'],
+                name='pdf_owner_creation_date_idx',
+                condition=Q(archived=False),
+            ),
+            models.Index(F('owner'), Lower('name'), F('id'), name='pdf_owner_name_idx', condition=Q(archived=False)),
+            models.Index(fields=['owner', 'views', 'id'], name='pdf_owner_views_idx', condition=Q(archived=False)),
+            models.Index(
+                fields=['owner', 'last_viewed_date', 'id'],
+                name='pdf_owner_last_viewed_idx',
+                condition=Q(archived=False),
+            ),
+            models.Index(
+                fields=['owner', 'creation_date', 'id'],
+                name='pdf_owner_starred_idx',
+                condition=Q(archived=False, starred=True),
+            ),
+        ]
+
     def __str__(self) -> str:
         return self.name  # pragma: no cover
 
+    # the name the pdf had when it was loaded from the db, used for detecting renames
+    _loaded_name = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_name = instance.__dict__.get('name')
+
+        return instance
+
     def save(self, *args, **kwargs) -> None:
         # only update profile pdf stats if pdf object is created
         profile = self.owner
@@ -179,8 +236,15 @@ class Pdf(models.Model):
 
             profile_needs_saving = True
 
+        # invalidate the cached pdf names of the profile if a pdf is added or renamed
+        if self._state.adding or self.__dict__.get('name') != self._loaded_name:
+            profile.change_pdf_names_version()
+            profile_needs_saving = True
+
         super().save(*args, **kwargs)
 
+        self._loaded_name = self.__dict__.get('name')
+
         if profile_needs_saving:
             profile.save()
 
@@ -188,6 +252,7 @@ class Pdf(models.Model):
         # update profile pdf stats
         profile = self.owner
         profile.number_of_pdfs -= 1
+        profile.change_pdf_names_version()
 
         if not profile.number_of_pdfs:
             profile.pdfs_total_size = 0
@@ -262,16 +327,31 @@ class PdfAnnotation(models.Model):
 
     creation_date = models.DateTimeField(blank=False, editable=False)
     id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    # the owner of the pdf is stored with the annotation, so that the overviews of all annotations of a user do not
+    # need to join the pdfs and can be served by an index
+    owner = models.ForeignKey(Profile, on_delete=models.CASCADE, blank=False)
     page = models.IntegerField(blank=False)
     pdf = models.ForeignKey(Pdf, on_delete=models.CASCADE, blank=False)
     text = models.TextField(blank=False)
 
     class Meta:
         abstract = True
+        # indexes matching the sorting of the overviews of a single pdf and of all pdfs of a user, the id is the
+        # tie-breaker of the cursor pagination
+        indexes = [
+            models.Index(fields=['pdf', 'creation_date', 'id'], name='%(class)s_creation_date_idx'),
+            models.Index(fields=['owner', 'creation_date', 'id'], name='%(class)s_owner_date_idx'),
+        ]
 
     def __str__(self) -> str:
         return self.text  # pragma: no cover
 
+    def save(self, *args, **kwargs):
+        if self.owner_id is None:
+            self.owner_id = self.pdf.owner_id
+
+        super().save(*args, **kwargs)
+
     @property
     def natural_age(self) -> str:  # pragma: no cover
         """
@@ -290,6 +370,25 @@ class PdfHighlight(PdfAnnotation):
     """Model for the pdf highlights."""
 
 
+class PdfPageText(models.Model):
+    """
+    Model for the extracted text of a pdf page. The texts are indexed by a full-text index, which is created in the
+    migrations as it depends on the database: a FTS5 table for SQLite and a GIN index for PostgreSQL.
+    """
+
+    # the hash of the page's content stream, used for only re-indexing changed pages
+    content_hash = models.CharField(max_length=32, blank=True, default='')
+    page = models.IntegerField(blank=False)
+    pdf = models.ForeignKey(Pdf, on_delete=models.CASCADE, blank=False)
+    text = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['pdf', 'page'], name='unique_pdf_page_text')]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f'{self.pdf.name}: page {self.page}'
+
+
 class MarkdownHelper:  # pragma: no cover
     @staticmethod
     def get_allowed_markdown_tags() -> set[str]:
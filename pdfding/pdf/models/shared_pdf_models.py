@@ -3,6 +3,8 @@ from uuid import uuid4
 
 from django.contrib.humanize.templatetags.humanize import naturaltime
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Lower
 from pdf.models.pdf_models import Pdf
 from users.models import Profile
 
@@ -31,6 +33,13 @@ class SharedPdf(models.Model):
     expiration_date = models.DateTimeField(null=True, blank=True)
     deletion_date = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        # indexes matching the sortings of the overview, the id is the tie-breaker of the cursor pagination
+        indexes = [
+            models.Index(fields=['owner', 'creation_date', 'id'], name='sharedpdf_owner_creation_idx'),
+            models.Index(F('owner'), Lower('name'), F('id'), name='sharedpdf_owner_name_idx'),
+        ]
+
     def __str__(self) -> str:
         return self.name  # pragma: no cover
 
@@ -38,9 +47,13 @@ class SharedPdf(models.Model):
     def inactive(self) -> bool:
         """The shared pdf weather is inactive. This will consider the expiration date and max views."""
 
-        return (self.max_views and self.views >= self.max_views) or (
-            self.expiration_date and datetime.now(timezone.utc) >= self.expiration_date
-        )
+        return (self.max_views and self.views >= self.max_views) or self.expired
+
+    @property
+    def expired(self) -> bool:
+        """The shared pdf weather is expired. This will consider the expiration date."""
+
+        return self.expiration_date and datetime.now(timezone.utc) >= self.expiration_date
 
     @property
     def deleted(self) -> bool:
@@ -1,19 +1,26 @@
-import re
 import traceback
 from collections import OrderedDict, defaultdict
+from collections.abc import Iterable
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
+from inspect import iscoroutinefunction
 from io import BytesIO
+from itertools import batched
 from logging import getLogger
-from math import floor
+from multiprocessing import get_context
 from pathlib import Path
 from shutil import copy
 from urllib.parse import parse_qs, urlparse
 from uuid import uuid4
 
 from core.settings import MEDIA_ROOT
+from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.files import File
-from django.db.models import QuerySet
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q, QuerySet
 from django.db.models.functions import Lower
 from django.forms import ValidationError
 from django.http import Http404, HttpRequest
@@ -23,50 +30,118 @@ from pdf.models.pdf_models import (
     PdfAnnotation,
     PdfComment,
     PdfHighlight,
+    PdfPageText,
     Tag,
     delete_empty_dirs_after_rename_or_delete,
     get_file_path,
 )
-from pypdf import PdfReader
+from pdf.services.pdf_analysis import (
+    AnnotationData,
+    PdfAnalysisResult,
+    analyse_pdf_file,
+    extract_highlights_and_comments,
+    extract_page_texts_and_content_hashes,
+    linearize_pdf_file,
+    render_thumbnail_and_preview,
+)
 from pypdfium2 import PdfDocument
 from ruamel.yaml import YAML
 from users.models import Profile
 
 logger = getLogger(__file__)
 
+# the tag info dicts are invalidated when tags are changed, the timeout only limits the size of the cache
+TAG_INFO_DICT_CACHE_TIMEOUT = 60 * 60 * 24
+
 
 class TagServices:
     @staticmethod
-    def process_tag_names(tag_names: list[str], owner_profile: Profile) -> list[Tag]:
+    def process_tag_names(
+        tag_names: list[str], owner_profile: Profile, resolved_tags: dict[str, Tag] = None
+    ) -> list[Tag]:
         """
-        Process the specified tags. If the tag is existing it will simply be added to the return list. If it does not
-        exist it, it will be created and then be added to the return list.
+        Process the specified tags. Existing tags are fetched in a single query, missing tags are created in bulk. The
+        tags are returned in the order of the tag names.
+
+        If a dict of resolved tags is provided, tags already present in it are not fetched again and the resolved tags
+        are added to it. This way tags only need to be resolved once when creating multiple pdfs of the same owner.
         """
 
-        tags = []
-        for tag_name in tag_names:
-            try:
-                tag = Tag.objects.get(owner=owner_profile, name=tag_name)
-            except Tag.DoesNotExist:
-                tag = Tag.objects.create(name=tag_name, owner=owner_profile)
+        if resolved_tags is None:
+            resolved_tags = dict()
+
+        unresolved_tag_names = [tag_name for tag_name in tag_names if tag_name not in resolved_tags]
 
-            tags.append(tag)
+        if unresolved_tag_names:
+            for tag in Tag.objects.filter(owner=owner_profile, name__in=unresolved_tag_names):
+                resolved_tags[tag.name] = tag
 
-        return tags
+            missing_tags = [
+                Tag(name=tag_name, owner=owner_profile)
+                for tag_name in unresolved_tag_names
+                if tag_name not in resolved_tags
+            ]
+
+            if missing_tags:
+                for tag in Tag.objects.bulk_create(missing_tags):
+                    resolved_tags[tag.name] = tag
+
+                TagServices.clear_tag_info_dict_cache(owner_profile.id)
+
+        return [resolved_tags[tag_name] for tag_name in tag_names]
+
+    @staticmethod
+    def delete_orphan_tags(pdf: Pdf, kept_tag_names: list[str] = None):
+        """
+        Delete the tags of the pdf that are not used by any other pdf. Tags whose names are in the kept tag names are
+        not deleted. The orphan tags are detected by a single anti-join on the tags of the pdfs.
+        """
+
+        used_by_other_pdf = Pdf.tags.through.objects.filter(tag_id=OuterRef('id')).exclude(pdf_id=pdf.id)
+        orphan_tags = Tag.objects.filter(pdf=pdf).exclude(Exists(used_by_other_pdf))
+
+        if kept_tag_names:
+            orphan_tags = orphan_tags.exclude(name__in=kept_tag_names)
+
+        number_of_deleted_objects, _ = orphan_tags.delete()
+
+        if number_of_deleted_objects:
+            TagServices.clear_tag_info_dict_cache(pdf.owner_id)
 
     @classmethod
     def get_tag_info_dict(cls, profile: Profile) -> dict[str, dict]:
         """
-        Get the tag info dict used for displaying the tags in the pdf overview.
+        Get the tag info dict used for displaying the tags in the pdf overview. The tag info dict is cached per profile
+        and tag mode until the tags of the profile are changed.
         """
 
-        if profile.tag_tree_mode:
-            tag_info_dict = cls.get_tag_info_dict_tree_mode(profile)
-        else:
-            tag_info_dict = cls.get_tag_info_dict_normal_mode(profile)
+        cache_key = cls.get_tag_info_dict_cache_key(profile.id, profile.tag_tree_mode)
+        tag_info_dict = cache.get(cache_key)
+
+        if tag_info_dict is None:
+            if profile.tag_tree_mode:
+                tag_info_dict = cls.get_tag_info_dict_tree_mode(profile)
+            else:
+                tag_info_dict = cls.get_tag_info_dict_normal_mode(profile)
+
+            cache.set(cache_key, tag_info_dict, TAG_INFO_DICT_CACHE_TIMEOUT)
 
         return tag_info_dict
 
+    @staticmethod
+    def get_tag_info_dict_cache_key(profile_id: int, tag_tree_mode: bool) -> str:
+        """Get the cache key of the tag info dict of the profile."""
+
+        return f'tag_info_dict_{profile_id}_{'tree' if tag_tree_mode else 'normal'}'
+
+    @classmethod
+    def clear_tag_info_dict_cache(cls, profile_id: int):
+        """Remove the cached tag info dicts of the profile. Needs to be called whenever tags are changed."""
+
+        cache.delete_many(
+            [cls.get_tag_info_dict_cache_key(profile_id, tag_tree_mode) for tag_tree_mode in [True, False]]
+        )
+
     @staticmethod
     def get_tag_info_dict_normal_mode(profile: Profile) -> dict[str, dict]:
         """
@@ -158,6 +233,14 @@ class TagServices:
         return overview_url
 
 
+@dataclass
+class BulkIngestionResult:
+    """The names of the files that were added and of the files that failed during a bulk ingestion."""
+
+    added: list[str] = field(default_factory=list)
+    failed: list[str] = field(default_factory=list)
+
+
 class PdfProcessingServices:
     @classmethod
     def create_pdf(
@@ -169,30 +252,88 @@ class PdfProcessingServices:
         notes: str = '',
         tag_string: str = '',
         file_directory: str = '',
+        resolved_tags: dict[str, Tag] = None,
     ):
         pdf = Pdf.objects.create(
             name=name, description=description, notes=notes, file=pdf_file, file_directory=file_directory, owner=owner
         )
 
-        # process with pdf libraries: add number of pages, thumbnail, preview, highlights and comments
-        cls.process_with_pypdfium(pdf)
-        cls.set_highlights_and_comments(pdf)
-
         # get unique tag names
         tag_names = Tag.parse_tag_string(tag_string)
-        tags = TagServices.process_tag_names(tag_names, pdf.owner)
+        tags = TagServices.process_tag_names(tag_names, pdf.owner, resolved_tags)
 
         pdf.tags.set(tags)
 
+        # process with pdf libraries: add number of pages, thumbnail, preview, highlights and comments. In the deferred
+        # mode this is done by the huey worker, so that the request does not need to wait for it.
+        if settings.DEFERRED_PROCESSING_ENABLED:
+            cls.enqueue_processing(pdf)
+        else:
+            cls.process_pdf(pdf)
+
         return pdf
 
+    @classmethod
+    def process_pdf(cls, pdf: Pdf, extract_thumbnail_and_preview: bool = True) -> bool:
+        """
+        Process the pdf with the pdf libraries in a single pass: add number of pages, thumbnail, preview, highlights,
+        comments and page texts. Highlights, comments and page texts are only re-extracted for pages that changed since
+        the last processing. Afterward, the processing status of the pdf is set accordingly. Returns if the processing
+        was successful.
+        """
+
+        previous_content_hashes = list(pdf.pdfpagetext_set.order_by('page').values_list('content_hash', flat=True))
+        analysis_result = analyse_pdf_file(
+            pdf.file.path,
+            extract_thumbnail_and_preview,
+            pdf.annotation_fingerprints,
+            previous_content_hashes,
+        )
+        success = cls.apply_analysis_result(pdf, analysis_result)
+        cls.enqueue_linearization(pdf)
+
+        return success
+
+    @classmethod
+    def enqueue_processing(cls, pdf: Pdf, extract_thumbnail_and_preview: bool = True):
+        """Set the pdf to pending and enqueue its processing stages in the huey task queue."""
+
+        # import here as the tasks module depends on this module
+        from pdf.tasks import enqueue_pdf_processing
+
+        cls.set_processing_status(pdf, Pdf.ProcessingStatus.PENDING)
+        enqueue_pdf_processing(str(pdf.id), extract_thumbnail_and_preview)
+
+    @staticmethod
+    def enqueue_linearization(pdf: Pdf):
+        """
+        Enqueue the creation of the linearized copy of the pdf in the huey task queue, if linearization is enabled.
+        Running qpdf can take a while for large files, so it is never done while processing a request.
+        """
+
+        # import here as the tasks module depends on this module
+        from pdf.tasks import linearize_pdf_task
+
+        if settings.PDF_LINEARIZATION_ENABLED:
+            linearize_pdf_task(str(pdf.id))
+
+    @staticmethod
+    def set_processing_status(pdf: Pdf, processing_status: Pdf.ProcessingStatus):
+        """
+        Set the processing status of the pdf. Only the status column is updated, so that changes made by the user
+        in the meantime, e.g. renaming the pdf, are not overwritten.
+        """
+
+        pdf.processing_status = processing_status
+        Pdf.objects.filter(id=pdf.id).update(processing_status=processing_status)
+
     @classmethod
     def process_with_pypdfium(
         cls, pdf: Pdf, extract_thumbnail_and_preview: bool = True, delete_existing_thumbnail_and_preview: bool = False
-    ):
+    ) -> bool:
         """
         Process the pdf with pypdfium. This will extract the number of pages and optionally the thumbnail + preview of
-        the Pdf.
+        the Pdf. Returns if the processing was successful.
         """
 
         try:
@@ -203,14 +344,21 @@ class PdfProcessingServices:
 
             pdf_document = PdfDocument(pdf.file.path, autoclose=True)
             pdf.number_of_pages = len(pdf_document)
+            update_fields = ['number_of_pages']
             if extract_thumbnail_and_preview:
                 pdf = cls.set_thumbnail_and_preview(pdf, pdf_document)
+                update_fields.extend(['thumbnail', 'preview'])
             pdf_document.close()
-            pdf.save()
+            # only save the processed fields, so that changes made in the meantime are not overwritten
+            pdf.save(update_fields=update_fields)
+
+            return True
         except Exception as e:  # nosec # noqa
             logger.info(f'Could not process "{pdf.name}" of user "{pdf.owner.user.email}" with Pypdfium')
             logger.info(traceback.format_exc())
 
+            return False
+
     @staticmethod
     def set_thumbnail_and_preview(
         pdf: Pdf,
@@ -222,35 +370,9 @@ class PdfProcessingServices:
         """Extract and set the thumbnail and the preview image of the pdf file."""
 
         try:
-            page = pdf_document[0]
-            preview_width_height_ratio = page.get_width() / page.get_height()
-
-            image_files = dict()
-            for image_name, desired_width, desired_ratio in zip(
-                ['thumbnail', 'preview'],
-                [desired_thumbnail_width, desired_preview_width],
-                [desired_thumbnail_width_height_ratio, preview_width_height_ratio],
-            ):
-                # extract image with predefined width
-                scale_factor = desired_width / page.get_width()
-
-                bitmap = page.render(scale=scale_factor)
-                pil_image = bitmap.to_pil()
-
-                desired_height = round(desired_width / desired_ratio)
-                width, height = pil_image.size
-
-                # we crop the image as we want a thumbnail with a ratio of 1.9 x 1. If the image is large enough we also
-                # want the thumbnail not to start at the top but instead with a little offset
-                height_diff = height - desired_height
-                if image_name == 'thumbnail' and height_diff > 0:
-                    offset = floor(0.15 * height_diff)
-                    pil_image = pil_image.crop((0, offset, desired_width, desired_height + offset))
-
-                # convert pillow image to django file
-                image_io = BytesIO()
-                pil_image.save(image_io, format='PNG')
-                image_files[image_name] = image_io
+            image_files = render_thumbnail_and_preview(
+                pdf_document, desired_thumbnail_width, desired_thumbnail_width_height_ratio, desired_preview_width
+            )
 
             pdf.thumbnail = File(file=image_files['thumbnail'], name='thumbnail')
             pdf.preview = File(file=image_files['preview'], name='preview')
@@ -262,9 +384,11 @@ class PdfProcessingServices:
         return pdf
 
     @classmethod
-    def set_highlights_and_comments(cls, pdf: Pdf, pdf_highlight_class=PdfHighlight, pdf_comment_class=PdfComment):
+    def set_highlights_and_comments(
+        cls, pdf: Pdf, pdf_highlight_class=PdfHighlight, pdf_comment_class=PdfComment
+    ) -> bool:
         """
-        Set the highlights and comments of a pdf.
+        Set the highlights and comments of a pdf. Returns if the extraction was successful.
 
         We need to have pdf_highlight_class and pdf_comment_class arguments so that the migration using this function
         can overwrite the classes with the model 'blueprints' we get via
@@ -272,71 +396,294 @@ class PdfProcessingServices:
         """
 
         try:
-            # delete old comments and highlights
-            pdf.pdfhighlight_set.all().delete()
-            pdf.pdfcomment_set.all().delete()
+            comments, highlights = extract_highlights_and_comments(pdf.file.path)
+            cls.save_highlights_and_comments(pdf, comments, highlights, pdf_highlight_class, pdf_comment_class)
+
+            return True
+        except Exception as e:  # nosec # noqa
+            logger.info(f'Could not extract highlights and comments for "{pdf.name}" of user "{pdf.owner.user.email}"')
+            logger.info(traceback.format_exc())
+
+            return False
+
+    @staticmethod
+    def save_highlights_and_comments(
+        pdf: Pdf,
+        comments: list[AnnotationData],
+        highlights: list[AnnotationData],
+        pdf_highlight_class=PdfHighlight,
+        pdf_comment_class=PdfComment,
+        changed_pages: list[int] = None,
+    ):
+        """
+        Replace the existing highlights and comments of the pdf with the extracted ones. If changed pages are provided,
+        only the highlights and comments of these pages are replaced.
+        """
 
-            pypdf_pdf = PdfReader(pdf.file)
-            pyreadium_pdf = PdfDocument(pdf.file, autoclose=True)
+        existing_highlights = pdf.pdfhighlight_set.all()
+        existing_comments = pdf.pdfcomment_set.all()
 
-            for i, pypdf_page in enumerate(pypdf_pdf.pages):
-                pdfium_page = pyreadium_pdf[i]
+        if changed_pages is not None:
+            existing_highlights = existing_highlights.filter(page__in=changed_pages)
+            existing_comments = existing_comments.filter(page__in=changed_pages)
 
-                if "/Annots" in pypdf_page:
-                    for annotation in pypdf_page["/Annots"]:
-                        annotation_object = annotation.get_object()
+        new_comments = [
+            pdf_comment_class(text=text, page=page, creation_date=creation_date, pdf=pdf)
+            for text, page, creation_date in comments
+        ]
+        new_highlights = [
+            pdf_highlight_class(text=text, page=page, creation_date=creation_date, pdf=pdf)
+            for text, page, creation_date in highlights
+        ]
 
-                        annotation_type = annotation_object["/Subtype"]
+        # bulk_create does not call save, so the owner needs to be set here. It is not passed to the constructor, as
+        # the historical models used by the migration creating the first annotations do not have an owner.
+        for annotation in new_comments + new_highlights:
+            annotation.owner_id = pdf.owner_id
 
-                        if annotation_type in ["/FreeText", "/Highlight"]:
-                            date_time_string = f'{annotation_object["/CreationDate"].split(':')[-1]}-+00:00'
-                            creation_date = datetime.strptime(date_time_string, '%Y%m%d%H%M%S-%z')
+        # insert all annotations with a few bulk queries in one transaction, so that the pdf never has a partial set
+        # of annotations.
+        with transaction.atomic():
+            existing_highlights.delete()
+            existing_comments.delete()
 
-                            if annotation_type == "/FreeText":
-                                comment_text = annotation_object["/Contents"]
-                                pdf_comment_class.objects.create(
-                                    text=comment_text, page=i + 1, creation_date=creation_date, pdf=pdf
-                                )
+            pdf_comment_class.objects.bulk_create(new_comments)
+            pdf_highlight_class.objects.bulk_create(new_highlights)
 
-                            elif annotation_type == "/Highlight":
-                                highlight_text = cls.extract_pdf_highlight_text(annotation_object, pdfium_page)
-                                pdf_highlight_class.objects.create(
-                                    text=highlight_text, page=i + 1, creation_date=creation_date, pdf=pdf
-                                )
+    @classmethod
+    def set_page_texts(cls, pdf: Pdf) -> bool:
+        """Extract and index the texts of all pages of a pdf. Returns if the extraction was successful."""
 
-            pyreadium_pdf.close()
+        try:
+            page_texts, content_hashes = extract_page_texts_and_content_hashes(pdf.file.path)
+            cls.save_page_texts(pdf, page_texts, content_hashes)
 
+            return True
         except Exception as e:  # nosec # noqa
-            logger.info(f'Could not extract highlights and comments for "{pdf.name}" of user "{pdf.owner.user.email}"')
+            logger.info(f'Could not extract page texts for "{pdf.name}" of user "{pdf.owner.user.email}"')
             logger.info(traceback.format_exc())
 
-    @staticmethod
-    def extract_pdf_highlight_text(annotation, pdfium_page):
-        """Extract the text from a highlight annotation"""
+            return False
 
-        # every highlighted lines is represented by a rectangle which consists of 4 quad points
-        # the 4 quad points are stored in a list in the following way:
-        # [bot_left_x, bot_left_y, bot_right_x, bot_right_y, top_left_x, top_left_y, top_right_x, top_right_y]
+    @staticmethod
+    def save_page_texts(pdf: Pdf, page_texts: dict[int, str], content_hashes: list[str]):
+        """
+        Replace the indexed texts of the extracted pages. Texts of pages that do not exist anymore are deleted, the
+        texts of all other pages are kept, so that only the changed pages need to be re-indexed.
+        """
 
-        quad_points = annotation["/QuadPoints"]
-        rectangles = [quad_points[8 * i : 8 * (i + 1)] for i in range(len(quad_points) // 8)]  # noqa
+        outdated_page_texts = PdfPageText.objects.filter(pdf=pdf).filter(
+            Q(page__in=page_texts.keys()) | Q(page__gt=len(content_hashes))
+        )
 
-        highlight_lines = []
+        with transaction.atomic():
+            outdated_page_texts.delete()
 
-        for rectangle in rectangles:
-            text_page = pdfium_page.get_textpage()
-            text = text_page.get_text_bounded(
-                left=rectangle[0], bottom=rectangle[5], right=rectangle[2], top=rectangle[1]
+            PdfPageText.objects.bulk_create(
+                [
+                    PdfPageText(text=text, page=page, content_hash=content_hashes[page - 1], pdf=pdf)
+                    for page, text in page_texts.items()
+                ]
             )
 
-            # sometimes the same line is present multiple times, we only want one
-            if not highlight_lines or text != highlight_lines[-1]:
-                highlight_lines.append(text)
+    @classmethod
+    def bulk_create_pdfs(
+        cls,
+        pdf_files: list[File],
+        owner: Profile,
+        description: str = '',
+        notes: str = '',
+        tag_string: str = '',
+        file_directory: str = '',
+    ) -> 'BulkIngestionResult':
+        """
+        Create pdfs from multiple files. The pdf rows are committed in batches. Afterward, the pdfs are processed by
+        a bounded process pool, so that rendering and annotation extraction scale with the number of cores. In the
+        deferred mode the processing is enqueued instead. Returns which files were added and which failed.
+        """
+
+        result = BulkIngestionResult()
+
+        # get unique tag names
+        tag_names = Tag.parse_tag_string(tag_string)
+        # the tags are resolved together with the first created pdf, so that no orphan tags are left behind
+        tags = None
+
+        pdfs = []
+        for batch in batched(pdf_files, settings.PDF_PROCESSING_BATCH_SIZE):
+            with transaction.atomic():
+                for pdf_file in batch:
+                    try:
+                        # use a savepoint, so that a failing file does not roll back the whole batch
+                        with transaction.atomic():
+                            # pdfs created earlier in the batch are visible here, so names stay unique
+                            name = create_unique_name_from_file(pdf_file, owner)
+                            pdf = Pdf.objects.create(
+                                name=name,
+                                description=description,
+                                notes=notes,
+                                file=pdf_file,
+                                file_directory=file_directory,
+                                owner=owner,
+                            )
+                            pdf_tags = TagServices.process_tag_names(tag_names, owner) if tags is None else tags
+                            pdf.tags.set(pdf_tags)
+                        # only keep the tags once the savepoint is committed, as they are rolled back otherwise
+                        tags = pdf_tags
+                        pdfs.append(pdf)
+                    except Exception as e:  # nosec # noqa
+                        logger.info(f'Could not create pdf from "{pdf_file.name}" of user "{owner.user.email}"')
+                        logger.info(traceback.format_exc())
+                        result.failed.append(pdf_file.name)
+
+        if settings.DEFERRED_PROCESSING_ENABLED:
+            for pdf in pdfs:
+                cls.enqueue_processing(pdf)
+            result.added = [pdf.name for pdf in pdfs]
+        else:
+            for pdf, success in cls.process_pdfs_in_parallel(pdfs):
+                cls.enqueue_linearization(pdf)
+
+                if success:
+                    result.added.append(pdf.name)
+                else:
+                    result.failed.append(pdf.name)
+
+        return result
+
+    @classmethod
+    def process_pdfs_in_parallel(cls, pdfs: list[Pdf]) -> list[tuple[Pdf, bool]]:
+        """
+        Analyse the pdfs in a bounded process pool and apply the results to the pdfs in batched transactions. Returns
+        for each pdf if its processing was successful.
+        """
+
+        max_workers = min(settings.PDF_PROCESSING_WORKERS, len(pdfs))
+
+        if max_workers <= 1:
+            # spawning processes is not worth it, analyse in this process instead
+            completed = ((pdf, analyse_pdf_file(pdf.file.path)) for pdf in pdfs)
+
+            return cls.apply_analysis_results_in_batches(completed)
+
+        # use spawn, as forking a process with open db connections and threads is not safe
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=get_context('spawn')) as executor:
+            futures = {executor.submit(analyse_pdf_file, pdf.file.path): pdf for pdf in pdfs}
+            completed = ((futures[future], cls.get_future_result(future)) for future in as_completed(futures))
+
+            return cls.apply_analysis_results_in_batches(completed)
+
+    @staticmethod
+    def get_future_result(future: Future) -> PdfAnalysisResult:
+        """
+        Get the analysis result of a future. If the worker process crashed, e.g. because of a malformed pdf, a failed
+        result is returned.
+        """
+
+        try:
+            return future.result()
+        except Exception as e:  # nosec # noqa
+            return PdfAnalysisResult(errors=[traceback.format_exc()])
+
+    @classmethod
+    def apply_analysis_results_in_batches(
+        cls, completed: Iterable[tuple[Pdf, PdfAnalysisResult]]
+    ) -> list[tuple[Pdf, bool]]:
+        """
+        Apply the completed analysis results. Results are written to the db in one transaction per batch. Returns
+        for each pdf if its processing was successful.
+        """
+
+        processed = []
 
-        highlight_text = ' '.join(highlight_lines).strip()
-        highlight_text = re.sub(r'\s+', ' ', highlight_text)
+        for batch in batched(completed, settings.PDF_PROCESSING_BATCH_SIZE):
+            with transaction.atomic():
+                for pdf, analysis_result in batch:
+                    processed.append((pdf, cls.apply_analysis_result(pdf, analysis_result)))
 
-        return highlight_text
+        return processed
+
+    @classmethod
+    def apply_analysis_result(cls, pdf: Pdf, analysis_result: PdfAnalysisResult) -> bool:
+        """
+        Apply the result of the pdf analysis: set the number of pages, thumbnail, preview, highlights, comments and
+        page texts as well as the processing status. Returns if the processing was successful.
+        """
+
+        update_fields = []
+
+        if analysis_result.number_of_pages is not None:
+            pdf.number_of_pages = analysis_result.number_of_pages
+            update_fields.append('number_of_pages')
+
+        if analysis_result.thumbnail and analysis_result.preview:
+            pdf.thumbnail = File(file=BytesIO(analysis_result.thumbnail), name='thumbnail')
+            pdf.preview = File(file=BytesIO(analysis_result.preview), name='preview')
+            update_fields.extend(['thumbnail', 'preview'])
+
+        # the annotations and their fingerprints need to be saved together, so that they cannot get out of sync
+        with transaction.atomic():
+            if analysis_result.comments is not None and analysis_result.highlights is not None:
+                cls.save_highlights_and_comments(
+                    pdf,
+                    analysis_result.comments,
+                    analysis_result.highlights,
+                    changed_pages=analysis_result.changed_pages,
+                )
+                pdf.annotation_fingerprints = analysis_result.annotation_fingerprints
+                update_fields.append('annotation_fingerprints')
+
+            if analysis_result.page_texts is not None:
+                cls.save_page_texts(pdf, analysis_result.page_texts, analysis_result.content_hashes)
+
+            if update_fields:
+                # only save the processed fields, so that changes made in the meantime are not overwritten
+                pdf.save(update_fields=update_fields)
+
+        if analysis_result.errors:
+            logger.info(f'Could not fully process "{pdf.name}" of user "{pdf.owner.user.email}"')
+            for error in analysis_result.errors:
+                logger.info(error)
+
+            cls.set_processing_status(pdf, Pdf.ProcessingStatus.FAILED)
+
+            return False
+        else:
+            cls.set_processing_status(pdf, Pdf.ProcessingStatus.DONE)
+
+            return True
+
+    @classmethod
+    def set_linearized_file(cls, pdf: Pdf) -> bool:
+        """
+        Create a linearized copy of the pdf, that is served instead of the pdf file. If the pdf file is already
+        linearized, no copy is needed. Returns if the linearization was successful.
+        """
+
+        try:
+            linearized_file_path = linearize_pdf_file(pdf.file.path)
+
+            if linearized_file_path:
+                cls.save_linearized_file(pdf, linearized_file_path)
+
+            return True
+        except Exception as e:  # nosec # noqa
+            logger.info(f'Could not linearize "{pdf.name}" of user "{pdf.owner.user.email}"')
+            logger.info(traceback.format_exc())
+
+            return False
+
+    @staticmethod
+    def save_linearized_file(pdf: Pdf, linearized_file_path: str):
+        """Save the temporary linearized copy as the linearized file of the pdf. The temporary copy is deleted."""
+
+        try:
+            with open(linearized_file_path, 'rb') as f:
+                pdf.linearized_file = File(file=f, name='linearized')
+                # only save the linearized file, so that changes made in the meantime are not overwritten
+                pdf.save(update_fields=['linearized_file'])
+        finally:
+            Path(linearized_file_path).unlink(missing_ok=True)
 
     @classmethod
     def export_annotations(cls, profile: Profile, kind: str, pdf: Pdf = None):
@@ -349,9 +696,9 @@ class PdfProcessingServices:
                 pdf_annotations = pdf.pdfhighlight_set.all()
         else:
             if kind == 'comments':
-                pdf_annotations = PdfComment.objects.filter(pdf__owner=profile).all()
+                pdf_annotations = PdfComment.objects.filter(owner=profile).all()
             else:
-                pdf_annotations = PdfHighlight.objects.filter(pdf__owner=profile).all()
+                pdf_annotations = PdfHighlight.objects.filter(owner=profile).all()
 
         cls.export_annotations_to_yaml(pdf_annotations, str(profile.user.id))
 
@@ -417,9 +764,21 @@ class PdfProcessingServices:
 def check_object_access_allowed(get_object):
     """
     Return a Http404 exception when getting an object (e.g a pdf or shared pdf) that does not exist
-    or access is not allowed.
+    or access is not allowed. Can be used for synchronous and asynchronous functions.
     """
 
+    if iscoroutinefunction(get_object):
+
+        async def async_inner(request: HttpRequest, identifier: str):
+            try:
+                return await get_object(request, identifier)
+            except ValidationError:
+                raise Http404("Given query not found...")
+            except ObjectDoesNotExist:
+                raise Http404("Given query not found...")
+
+        return async_inner
+
     def inner(request: HttpRequest, identifier: str):
         try:
             return get_object(request, identifier)
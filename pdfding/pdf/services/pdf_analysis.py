@@ -0,0 +1,375 @@
+"""
+Analysis of pdf files with pypdfium and pypdf. This module is intentionally free of any django imports, so that its
+functions can be executed in the worker processes of a process pool without having to set up django.
+"""
+
+import os
+import re
+import shutil
+import subprocess  # nosec
+import traceback
+from dataclasses import dataclass, field
+from datetime import datetime
+from hashlib import blake2b
+from io import BytesIO
+from math import floor
+from pathlib import Path
+from tempfile import mkstemp
+
+from pypdf import PdfReader
+from pypdfium2 import PdfDocument, PdfTextPage
+
+# an annotation is represented as (text, page, creation date)
+AnnotationData = tuple[str, int, datetime]
+# the keys of an annotation that are part of its fingerprint
+FINGERPRINT_KEYS = ['/Subtype', '/CreationDate', '/M', '/Contents', '/QuadPoints']
+# the linearization dictionary needs to be the first object of a linearized pdf, so it is within the first bytes
+LINEARIZATION_CHECK_SIZE = 1024
+
+
+@dataclass
+class PdfAnalysisResult:
+    """The result of analysing a pdf file. Parts that could not be extracted are None."""
+
+    number_of_pages: int | None = None
+    thumbnail: bytes | None = None
+    preview: bytes | None = None
+    comments: list[AnnotationData] | None = None
+    highlights: list[AnnotationData] | None = None
+    annotation_fingerprints: list[str] | None = None
+    # the pages whose annotations were extracted. None if all pages were extracted.
+    changed_pages: list[int] | None = None
+    # the texts of the pages whose content changed, key: page number, value: text
+    page_texts: dict[int, str] | None = None
+    content_hashes: list[str] | None = None
+    errors: list[str] = field(default_factory=list)
+
+
+def analyse_pdf_file(
+    file_path: str,
+    extract_thumbnail_and_preview: bool = True,
+    previous_annotation_fingerprints: list[str] = None,
+    previous_content_hashes: list[str] = None,
+) -> PdfAnalysisResult:
+    """Analyse the pdf file located at the specified path. See analyse_pdf for details."""
+
+    return analyse_pdf(
+        file_path, extract_thumbnail_and_preview, previous_annotation_fingerprints, previous_content_hashes
+    )
+
+
+def analyse_pdf(
+    file_path: str,
+    extract_thumbnail_and_preview: bool = True,
+    previous_annotation_fingerprints: list[str] = None,
+    previous_content_hashes: list[str] = None,
+) -> PdfAnalysisResult:
+    """
+    Analyse the pdf in a single pass: the pdf is opened once and the same pypdfium document is used for extracting the
+    number of pages, the thumbnail, the preview, the highlights, the comments and the page texts. If the annotation
+    fingerprints or content hashes of a previous analysis are provided, only the annotations or texts of changed
+    pages are extracted. Exceptions are not raised but stored as formatted tracebacks in the result, so that the
+    caller can log them.
+
+    The pdf is not loaded into memory as a whole: pypdfium opens it by its path and pypdf reads it from an open file,
+    so that analysing large scans in several worker processes at once does not need the whole files in memory.
+    """
+
+    result = PdfAnalysisResult()
+
+    try:
+        pdfium_document = PdfDocument(file_path)
+    except Exception as e:  # nosec # noqa
+        result.errors.append(traceback.format_exc())
+
+        return result
+
+    try:
+        result.number_of_pages = len(pdfium_document)
+
+        if extract_thumbnail_and_preview:
+            image_files = render_thumbnail_and_preview(pdfium_document)
+            result.thumbnail = image_files['thumbnail'].getvalue()
+            result.preview = image_files['preview'].getvalue()
+    except Exception as e:  # nosec # noqa
+        result.errors.append(traceback.format_exc())
+
+    try:
+        # pypdf reads the objects from the file while they are accessed, so the file needs to stay open
+        with open(file_path, 'rb') as pdf_file:
+            pypdf_pdf = PdfReader(pdf_file)
+            annotation_fingerprints = get_annotation_fingerprints(pypdf_pdf)
+            changed_pages = get_changed_pages(previous_annotation_fingerprints, annotation_fingerprints)
+
+            comments, highlights = extract_annotations(pypdf_pdf, pdfium_document, changed_pages)
+
+            content_hashes = get_content_hashes(pypdf_pdf)
+
+        changed_text_pages = get_changed_pages(previous_content_hashes, content_hashes)
+        page_texts = extract_page_texts(pdfium_document, changed_text_pages)
+
+        result.comments, result.highlights = comments, highlights
+        result.annotation_fingerprints = annotation_fingerprints
+        result.changed_pages = changed_pages
+        result.page_texts = page_texts
+        result.content_hashes = content_hashes
+    except Exception as e:  # nosec # noqa
+        result.errors.append(traceback.format_exc())
+
+    pdfium_document.close()
+
+    return result
+
+
+def linearize_pdf_file(file_path: str) -> str | None:
+    """
+    Create a linearized copy of the pdf with qpdf. In a linearized pdf the objects of the first page come first and a
+    hint table describes where the objects of the other pages are, so that a viewer loading the pdf via range requests
+    can display the first page without downloading the whole file. Returns the path of the temporary copy or None if
+    the pdf is already linearized.
+    """
+
+    if is_linearized(file_path):
+        return None
+
+    qpdf_path = shutil.which('qpdf')
+
+    if not qpdf_path:
+        raise FileNotFoundError('qpdf is needed for linearizing pdfs, but it is not installed')
+
+    file_descriptor, linearized_file_path = mkstemp(suffix='.pdf')
+    os.close(file_descriptor)
+
+    completed_process = subprocess.run(  # nosec
+        [qpdf_path, '--linearize', file_path, linearized_file_path], capture_output=True
+    )
+
+    # qpdf exits with 3 if it succeeded with warnings
+    if completed_process.returncode not in [0, 3]:
+        Path(linearized_file_path).unlink(missing_ok=True)
+
+        raise RuntimeError(f'qpdf could not linearize the pdf: {completed_process.stderr.decode(errors="replace")}')
+
+    return linearized_file_path
+
+
+def is_linearized(file_path: str) -> bool:
+    """Check if the pdf is linearized. Only the start of the file is read, as the check happens before any parsing."""
+
+    with open(file_path, 'rb') as f:
+        return b'/Linearized' in f.read(LINEARIZATION_CHECK_SIZE)
+
+
+def render_thumbnail_and_preview(
+    pdf_document: PdfDocument,
+    desired_thumbnail_width: int = 135,
+    desired_thumbnail_width_height_ratio: float = 0.77,
+    desired_preview_width: int = 450,
+) -> dict[str, BytesIO]:
+    """Render the thumbnail and the preview image of the pdf file as PNGs."""
+
+    page = pdf_document[0]
+    preview_width_height_ratio = page.get_width() / page.get_height()
+
+    image_files = dict()
+    for image_name, desired_width, desired_ratio in zip(
+        ['thumbnail', 'preview'],
+        [desired_thumbnail_width, desired_preview_width],
+        [desired_thumbnail_width_height_ratio, preview_width_height_ratio],
+    ):
+        # extract image with predefined width
+        scale_factor = desired_width / page.get_width()
+
+        bitmap = page.render(scale=scale_factor)
+        pil_image = bitmap.to_pil()
+
+        desired_height = round(desired_width / desired_ratio)
+        width, height = pil_image.size
+
+        # we crop the image as we want a thumbnail with a ratio of 1.9 x 1. If the image is large enough we also
+        # want the thumbnail not to start at the top but instead with a little offset
+        height_diff = height - desired_height
+        if image_name == 'thumbnail' and height_diff > 0:
+            offset = floor(0.15 * height_diff)
+            pil_image = pil_image.crop((0, offset, desired_width, desired_height + offset))
+
+        image_io = BytesIO()
+        pil_image.save(image_io, format='PNG')
+        image_files[image_name] = image_io
+
+    return image_files
+
+
+def extract_highlights_and_comments(file_path: str) -> tuple[list[AnnotationData], list[AnnotationData]]:
+    """Extract the comments and the highlights of all pages of the pdf located at the specified path."""
+
+    pdfium_document = PdfDocument(file_path)
+
+    try:
+        with open(file_path, 'rb') as pdf_file:
+            return extract_annotations(PdfReader(pdf_file), pdfium_document)
+    finally:
+        pdfium_document.close()
+
+
+def extract_page_texts_and_content_hashes(file_path: str) -> tuple[dict[int, str], list[str]]:
+    """Extract the texts and the content hashes of all pages of the pdf located at the specified path."""
+
+    pdfium_document = PdfDocument(file_path)
+
+    try:
+        page_texts = extract_page_texts(pdfium_document)
+    finally:
+        pdfium_document.close()
+
+    with open(file_path, 'rb') as pdf_file:
+        return page_texts, get_content_hashes(PdfReader(pdf_file))
+
+
+def extract_annotations(
+    pypdf_pdf: PdfReader, pdfium_document: PdfDocument, page_numbers: list[int] = None
+) -> tuple[list[AnnotationData], list[AnnotationData]]:
+    """
+    Extract the comments and the highlights of the pdf. If page numbers are provided, only these pages are processed.
+    """
+
+    comments = []
+    highlights = []
+    page_numbers = None if page_numbers is None else set(page_numbers)
+
+    for i, pypdf_page in enumerate(pypdf_pdf.pages):
+        if "/Annots" not in pypdf_page or (page_numbers is not None and i + 1 not in page_numbers):
+            continue
+
+        pdfium_page = pdfium_document[i]
+        # the text page is only loaded if the page contains highlights and then shared by all of them
+        text_page = None
+
+        for annotation in pypdf_page["/Annots"]:
+            annotation_object = annotation.get_object()
+
+            annotation_type = annotation_object["/Subtype"]
+
+            if annotation_type in ["/FreeText", "/Highlight"]:
+                date_time_string = f'{annotation_object["/CreationDate"].split(':')[-1]}-+00:00'
+                creation_date = datetime.strptime(date_time_string, '%Y%m%d%H%M%S-%z')
+
+                if annotation_type == "/FreeText":
+                    comments.append((annotation_object["/Contents"], i + 1, creation_date))
+                elif annotation_type == "/Highlight":
+                    if text_page is None:
+                        text_page = pdfium_page.get_textpage()
+
+                    highlight_text = extract_pdf_highlight_text(annotation_object, text_page)
+                    highlights.append((highlight_text, i + 1, creation_date))
+
+        if text_page is not None:
+            text_page.close()
+        pdfium_page.close()
+
+    return comments, highlights
+
+
+def get_annotation_fingerprints(pypdf_pdf: PdfReader) -> list[str]:
+    """
+    Get a fingerprint of the comments and highlights of each page. Pages without comments and highlights have an empty
+    fingerprint. Only the pypdf representation of the annotations is used, so that no text needs to be extracted.
+    """
+
+    fingerprints = []
+
+    for pypdf_page in pypdf_pdf.pages:
+        page_annotations = []
+
+        if "/Annots" in pypdf_page:
+            for annotation in pypdf_page["/Annots"]:
+                annotation_object = annotation.get_object()
+
+                if annotation_object.get("/Subtype") in ["/FreeText", "/Highlight"]:
+                    page_annotations.append(repr([annotation_object.get(key) for key in FINGERPRINT_KEYS]))
+
+        if page_annotations:
+            fingerprints.append(blake2b('\n'.join(page_annotations).encode(), digest_size=16).hexdigest())
+        else:
+            fingerprints.append('')
+
+    return fingerprints
+
+
+def extract_page_texts(pdfium_document: PdfDocument, page_numbers: list[int] = None) -> dict[int, str]:
+    """
+    Extract the texts of the pages. If page numbers are provided, only these pages are processed. Returns a dict with
+    the page numbers as keys and the texts as values.
+    """
+
+    if page_numbers is None:
+        page_numbers = range(1, len(pdfium_document) + 1)
+
+    page_texts = dict()
+
+    for page_number in page_numbers:
+        pdfium_page = pdfium_document[page_number - 1]
+        text_page = pdfium_page.get_textpage()
+        page_texts[page_number] = re.sub(r'\s+', ' ', text_page.get_text_range()).strip()
+
+        text_page.close()
+        pdfium_page.close()
+
+    return page_texts
+
+
+def get_content_hashes(pypdf_pdf: PdfReader) -> list[str]:
+    """
+    Get a hash of the content stream of each page. The text of a page can only change if its content stream changes,
+    so the hashes can be used for only extracting the texts of changed pages.
+    """
+
+    content_hashes = []
+
+    for pypdf_page in pypdf_pdf.pages:
+        contents = pypdf_page.get_contents()
+        content_data = contents.get_data() if contents is not None else b''
+        content_hashes.append(blake2b(content_data, digest_size=16).hexdigest())
+
+    return content_hashes
+
+
+def get_changed_pages(previous_fingerprints: list[str] | None, fingerprints: list[str]) -> list[int] | None:
+    """
+    Get the numbers of the pages whose fingerprints changed. If there are no previous fingerprints or the number of
+    pages changed, the pages cannot be matched and None is returned, meaning that all pages need to be processed.
+    """
+
+    if not previous_fingerprints or len(previous_fingerprints) != len(fingerprints):
+        return None
+
+    return [
+        i + 1
+        for i, (previous_fingerprint, fingerprint) in enumerate(zip(previous_fingerprints, fingerprints))
+        if previous_fingerprint != fingerprint
+    ]
+
+
+def extract_pdf_highlight_text(annotation, text_page: PdfTextPage) -> str:
+    """Extract the text from a highlight annotation"""
+
+    # every highlighted lines is represented by a rectangle which consists of 4 quad points
+    # the 4 quad points are stored in a list in the following way:
+    # [bot_left_x, bot_left_y, bot_right_x, bot_right_y, top_left_x, top_left_y, top_right_x, top_right_y]
+
+    quad_points = annotation["/QuadPoints"]
+    rectangles = [quad_points[8 * i : 8 * (i + 1)] for i in range(len(quad_points) // 8)]  # noqa
+
+    highlight_lines = []
+
+    for rectangle in rectangles:
+        text = text_page.get_text_bounded(left=rectangle[0], bottom=rectangle[5], right=rectangle[2], top=rectangle[1])
+
+        # sometimes the same line is present multiple times, we only want one
+        if not highlight_lines or text != highlight_lines[-1]:
+            highlight_lines.append(text)
+
+    highlight_text = ' '.join(highlight_lines).strip()
+    highlight_text = re.sub(r'\s+', ' ', highlight_text)
+
+    return highlight_text
@@ -0,0 +1,71 @@
+"""
+Buffering of the reading progress. The viewer sends the current page every time the displayed page changes, so flipping
+through a pdf causes a stream of updates. If buffering is enabled, the current pages are stored in the cache and
+written to the database in batches by a periodic huey task. For every pdf only the last buffered page is written.
+"""
+
+from datetime import datetime, timedelta, timezone
+from itertools import batched
+
+from django.core.cache import cache
+from pdf.models.pdf_models import Pdf
+
+# the buffered current pages expire, if they are not updated in the meantime
+BUFFER_TIMEOUT = 60 * 60 * 24
+FLUSH_BATCH_SIZE = 500
+
+
+def get_current_page_cache_key(pdf_id: str) -> str:
+    return f'reading_progress_{pdf_id}'
+
+
+async def abuffer_current_page(pdf: Pdf, current_page: int):
+    """
+    Buffer the current page of the pdf in the cache until it is written to the database by flush_current_pages. Every
+    pdf has its own cache key, so that concurrent requests buffering different pdfs cannot overwrite each other.
+
+    The cache cannot be searched for keys, so flush_current_pages looks up the pages of the pdfs viewed within the
+    buffer timeout. The buffered page therefore expires at the latest when the pdf drops out of this window. Pages
+    of pdfs opened in the viewer before that are written to the database directly.
+    """
+
+    timeout = BUFFER_TIMEOUT - (datetime.now(timezone.utc) - pdf.last_viewed_date).total_seconds()
+
+    if timeout > 0:
+        await cache.aset(get_current_page_cache_key(pdf.id), current_page, timeout)
+    else:
+        await Pdf.objects.filter(id=pdf.id).aupdate(current_page=current_page)
+
+
+def get_current_page(pdf: Pdf) -> int:
+    """Get the current page of the pdf. A buffered current page is newer than the one stored in the database."""
+
+    return cache.get(get_current_page_cache_key(pdf.id), pdf.current_page)
+
+
+def flush_current_pages() -> int:
+    """
+    Write the buffered current pages to the database. The pages are looked up in batches for the pdfs viewed within
+    the buffer timeout, as only these can have a buffered page. Only pdfs whose current page changed are updated. The
+    buffered pages are kept, so that a page buffered during the flush is not lost. Returns the number of updated pdfs.
+    """
+
+    viewed_since = datetime.now(timezone.utc) - timedelta(seconds=BUFFER_TIMEOUT)
+    viewed_pdfs = Pdf.objects.filter(last_viewed_date__gte=viewed_since).values_list('id', 'current_page')
+    number_of_updated_pdfs = 0
+
+    for pdf_batch in batched(viewed_pdfs, FLUSH_BATCH_SIZE):
+        current_page_keys = {get_current_page_cache_key(pdf_id): pdf_id for pdf_id, _ in pdf_batch}
+        buffered_pages = {
+            current_page_keys[key]: current_page for key, current_page in cache.get_many(current_page_keys).items()
+        }
+        changed_pdfs = [
+            Pdf(id=pdf_id, current_page=buffered_pages[pdf_id])
+            for pdf_id, current_page in pdf_batch
+            if pdf_id in buffered_pages and buffered_pages[pdf_id] != current_page
+        ]
+
+        if changed_pdfs:
+            number_of_updated_pdfs += Pdf.objects.bulk_update(changed_pdfs, ['current_page'])
+
+    return number_of_updated_pdfs
@@ -0,0 +1,151 @@
+import re
+from collections import OrderedDict
+from uuid import UUID
+
+import numpy as np
+from django.db import connection
+from django.db.models import prefetch_related_objects
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+from pdf.models.pdf_models import Pdf, PdfPageText
+from rapidfuzz import fuzz, process, utils
+from users.models import Profile
+
+# process local cache of the preprocessed pdf names of the profiles, key: profile id, value: (version, names)
+PDF_NAME_INDEXES: OrderedDict[int, tuple[UUID, dict[str, str]]] = OrderedDict()
+MAX_CACHED_PDF_NAME_INDEXES = 100
+
+# control characters are used for marking the matches in the snippets, as they cannot be part of the extracted texts
+SNIPPET_START = '\x02'
+SNIPPET_STOP = '\x03'
+
+SQLITE_SEARCH_QUERY = '''
+    SELECT pdf_pdfpagetext.id, pdf_pdfpagetext.page, pdf_pdfpagetext.pdf_id,
+        -bm25(pdf_pdfpagetext_fts) AS rank,
+        snippet(pdf_pdfpagetext_fts, 0, %s, %s, '…', 16) AS raw_snippet
+    FROM pdf_pdfpagetext_fts
+    JOIN pdf_pdfpagetext ON pdf_pdfpagetext.id = pdf_pdfpagetext_fts.rowid
+    JOIN pdf_pdf ON pdf_pdf.id = pdf_pdfpagetext.pdf_id
+    WHERE pdf_pdfpagetext_fts MATCH %s AND pdf_pdf.owner_id = %s
+    ORDER BY rank DESC
+    LIMIT %s
+'''
+
+POSTGRES_SEARCH_QUERY = '''
+    SELECT pdf_pdfpagetext.id, pdf_pdfpagetext.page, pdf_pdfpagetext.pdf_id,
+        ts_rank(to_tsvector('simple', pdf_pdfpagetext.text), query) AS rank,
+        ts_headline('simple', pdf_pdfpagetext.text, query, %s) AS raw_snippet
+    FROM pdf_pdfpagetext
+    JOIN pdf_pdf ON pdf_pdf.id = pdf_pdfpagetext.pdf_id,
+        to_tsquery('simple', %s) query
+    WHERE to_tsvector('simple', pdf_pdfpagetext.text) @@ query AND pdf_pdf.owner_id = %s
+    ORDER BY rank DESC
+    LIMIT %s
+'''
+
+
+def search_page_texts(profile: Profile, search: str, limit: int = 50) -> list[PdfPageText]:
+    """
+    Search the indexed page texts of the profile's pdfs. The search is performed by the full-text index of the used
+    database. Every search term is matched as a prefix and all terms need to be present on the page. Returns the
+    matching pages ordered by their rank. Each returned page has a 'snippet' attribute with the highlighted matches.
+    """
+
+    search_terms = re.findall(r'\w+', search)
+
+    if not search_terms:
+        return []
+
+    if connection.vendor == 'postgresql':  # pragma: no cover
+        ts_query = ' & '.join(f'{term}:*' for term in search_terms)
+        headline_options = f'StartSel={SNIPPET_START}, StopSel={SNIPPET_STOP}, MaxWords=30, MinWords=15'
+        page_texts = PdfPageText.objects.raw(POSTGRES_SEARCH_QUERY, [headline_options, ts_query, profile.id, limit])
+    else:
+        fts_query = ' '.join(f'"{term}"*' for term in search_terms)
+        page_texts = PdfPageText.objects.raw(
+            SQLITE_SEARCH_QUERY, [SNIPPET_START, SNIPPET_STOP, fts_query, profile.id, limit]
+        )
+
+    page_texts = list(page_texts)
+    prefetch_related_objects(page_texts, 'pdf')
+
+    for page_text in page_texts:
+        page_text.snippet = format_snippet(page_text.raw_snippet)
+
+    return page_texts
+
+
+def format_snippet(raw_snippet: str) -> str:
+    """Convert the raw snippet of the full-text search to html, where the matches are highlighted."""
+
+    snippet = escape(raw_snippet).replace(SNIPPET_START, '<mark>').replace(SNIPPET_STOP, '</mark>')
+
+    # bandit will report a vulnerability because of the usage of mark_safe of XSS and cross-site scripting
+    # vulnerabilities. since the snippet is escaped before adding the mark tags we can ignore the warning
+    return mark_safe(snippet)  # nosec
+
+
+def fuzzy_search_pdf_names(profile: Profile, search: str) -> list[str]:
+    """
+    Fuzzy search the names of the profile's pdfs. The cached names are scored by rapidfuzz on all cpu cores without
+    creating any model instances. Returns the ids of the matching pdfs.
+    """
+
+    pdf_names = get_pdf_name_index(profile)
+    pdf_ids, names = list(pdf_names), list(pdf_names.values())
+    processed_search = utils.default_process(search)
+
+    # a pdf can only match if its partial ratio is above 70, so only these pdfs need to be scored with WRatio. the
+    # scores are calculated in float64, so that the thresholds are applied like to the scores of the single scorers.
+    partial_ratios = process.cdist(
+        [processed_search],
+        names,
+        scorer=fuzz.partial_ratio,
+        processor=None,
+        score_cutoff=70,
+        dtype=np.float64,
+        workers=-1,
+    )[0]
+    candidates = partial_ratios.nonzero()[0]
+    w_ratios = process.cdist(
+        [processed_search],
+        [names[candidate] for candidate in candidates],
+        scorer=fuzz.WRatio,
+        processor=None,
+        dtype=np.float64,
+        workers=-1,
+    )[0]
+
+    # better to be a bit more strict regarding this so we avoid false positives
+    return [
+        pdf_ids[candidate]
+        for candidate, w_ratio in zip(candidates, w_ratios)
+        if (w_ratio + partial_ratios[candidate]) / 2 > 85 or partial_ratios[candidate] > 95
+    ]
+
+
+def get_pdf_name_index(profile: Profile) -> dict[str, str]:
+    """
+    Get the preprocessed names of the profile's pdfs with the pdf ids as keys. The names are cached per process and
+    only reloaded if a pdf of the profile was added, renamed or deleted in the meantime.
+    """
+
+    cached_index = PDF_NAME_INDEXES.get(profile.id)
+
+    if cached_index and cached_index[0] == profile.pdf_names_version:
+        PDF_NAME_INDEXES.move_to_end(profile.id)
+
+        return cached_index[1]
+
+    pdf_names = {
+        str(pdf_id): utils.default_process(name)
+        for pdf_id, name in Pdf.objects.filter(owner=profile).values_list('id', 'name')
+    }
+
+    PDF_NAME_INDEXES[profile.id] = (profile.pdf_names_version, pdf_names)
+    PDF_NAME_INDEXES.move_to_end(profile.id)
+
+    if len(PDF_NAME_INDEXES) > MAX_CACHED_PDF_NAME_INDEXES:
+        PDF_NAME_INDEXES.popitem(last=False)
+
+    return pdf_names
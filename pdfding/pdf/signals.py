@@ -2,6 +2,7 @@ from django.contrib.auth.models import User
 from django.db.models.signals import post_save, pre_delete
 from django.dispatch import receiver
 from pdf.models.pdf_models import Pdf
+from pdf.service import TagServices
 from pdf.services.workspace_services import create_personal_workspace
 
 
@@ -35,10 +36,4 @@ def delete_orphan_tag(sender, instance, **kwargs):
     be deleted as well.
     """
 
-    pdf = instance
-
-    for tag in pdf.tags.all():
-        # if only one pdf is  associated with the tag it is the one being deleted
-        # in that case the tag should be deleted
-        if tag.pdf_set.count() == 1:
-            tag.delete()
+    TagServices.delete_orphan_tags(instance)
@@ -8,8 +8,11 @@ from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.files import File
 from huey import crontab
-from huey.contrib.djhuey import periodic_task
+from huey.contrib.djhuey import HUEY, db_task, periodic_task
 from pdf import service
+from pdf.models.pdf_models import Pdf
+from pdf.services import reading_progress
+from pdf.services.pdf_analysis import analyse_pdf_file
 
 logger = logging.getLogger('huey')
 
@@ -24,6 +27,14 @@ def consume_task():  # pragma: no cover
         consume_function(settings.CONSUME_SKIP_EXISTING)
 
 
+@periodic_task(crontab(minute='*'), retries=0)
+def flush_reading_progress_task():
+    """Periodic huey task for writing the buffered current pages of the viewed pdfs to the database."""
+
+    if settings.READING_PROGRESS_BUFFER_ENABLED:
+        reading_progress.flush_current_pages()
+
+
 def consume_function(skip_existing: bool):
     """Create pdf instances for pdf files present in the consume folder."""
 
@@ -41,6 +52,9 @@ def consume_function(skip_existing: bool):
         else:
             pdf_info_list = []
 
+        # all files of the user get the same tags, so they only need to be resolved once
+        resolved_tags = dict()
+
         for file_path in user_consume_file_paths:
             try:
                 if passes_consume_condition(file_path, skip_existing, pdf_info_list):
@@ -50,7 +64,11 @@ def consume_function(skip_existing: bool):
                         pdf_file = File(f, name=file_path.name)
 
                         service.PdfProcessingServices.create_pdf(
-                            name=pdf_name, owner=user.profile, pdf_file=pdf_file, tag_string=settings.CONSUME_TAG_STRING
+                            name=pdf_name,
+                            owner=user.profile,
+                            pdf_file=pdf_file,
+                            tag_string=settings.CONSUME_TAG_STRING,
+                            resolved_tags=resolved_tags,
                         )
 
             except Exception as e:  # pragma: no cover # nosec # noqa
@@ -71,3 +89,81 @@ def passes_consume_condition(file_path: Path, skip_existing: bool, pdf_info_list
     return file_type == 'application/pdf' and not (
         skip_existing and (service.create_name_from_file(file_path), file_path.stat().st_size) in pdf_info_list
     )
+
+
+def enqueue_pdf_processing(pdf_id: str, extract_thumbnail_and_preview: bool = True):
+    """
+    Enqueue the processing of a pdf as a huey pipeline. The first stage analyses the pdf file in a single pass and
+    extracts the number of pages, the thumbnail, the preview, the highlights, the comments and the page texts. If
+    linearization is enabled, a second stage creates the linearized copy of the pdf.
+    """
+
+    pipeline = process_pdf_task.s(pdf_id, extract_thumbnail_and_preview)
+
+    if settings.PDF_LINEARIZATION_ENABLED:
+        pipeline = pipeline.then(linearize_pdf_task)
+
+    HUEY.enqueue(pipeline)
+
+
+@db_task(retries=0)
+def process_pdf_task(pdf_id: str, extract_thumbnail_and_preview: bool = True) -> str:
+    """
+    First stage of the deferred pdf processing: analyse the pdf file once and apply the result. Like in process_pdf,
+    only the annotations and texts of pages that changed since the last processing are extracted.
+    """
+
+    pdf = get_pdf_for_processing(pdf_id)
+
+    if pdf:
+        try:
+            service.PdfProcessingServices.set_processing_status(pdf, Pdf.ProcessingStatus.PROCESSING)
+
+            previous_content_hashes = list(pdf.pdfpagetext_set.order_by('page').values_list('content_hash', flat=True))
+            # the linearization is done by its own stage, so that the pdf can be used before it is finished
+            analysis_result = analyse_pdf_file(
+                pdf.file.path,
+                extract_thumbnail_and_preview,
+                previous_annotation_fingerprints=pdf.annotation_fingerprints,
+                previous_content_hashes=previous_content_hashes,
+            )
+            service.PdfProcessingServices.apply_analysis_result(pdf, analysis_result)
+        except Exception as e:  # nosec # noqa
+            set_processing_failed(pdf)
+
+    # the pdf id is passed on to the optional linearization stage
+    return pdf_id
+
+
+@db_task(retries=0)
+def linearize_pdf_task(pdf_id: str):
+    """Optional second stage of the deferred pdf processing: create the linearized copy of the pdf."""
+
+    pdf = get_pdf_for_processing(pdf_id)
+
+    # linearizing is optional, so a failure does not change the processing status
+    if pdf:
+        service.PdfProcessingServices.set_linearized_file(pdf)
+
+
+def set_processing_failed(pdf: Pdf):
+    """
+    Set the processing status of a pdf whose processing stage raised an exception to failed, so that it does not stay
+    in processing forever.
+    """
+
+    logger.info(f'Could not process "{pdf.name}" of user "{pdf.owner.user.email}"')
+    logger.info(traceback.format_exc())
+
+    service.PdfProcessingServices.set_processing_status(pdf, Pdf.ProcessingStatus.FAILED)
+
+
+def get_pdf_for_processing(pdf_id: str) -> Pdf | None:
+    """Get the pdf that should be processed. If the pdf was deleted in the meantime, None is returned."""
+
+    pdf = Pdf.objects.filter(id=pdf_id).first()
+
+    if not pdf:
+        logger.info(f'Skipping processing of pdf "{pdf_id}" as it does not exist anymore')
+
+    return pdf
@@ -0,0 +1,175 @@
+from io import StringIO
+from pathlib import Path
+from shutil import copy
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from pdf.management.commands import benchmark_linearization
+from pdf.models.pdf_models import Pdf, PdfHighlight, PdfPageText
+from users.service import get_demo_pdf
+
+
+class TestBenchmarkOverview(TransactionTestCase):
+    @mock.patch('pdf.management.commands.benchmark_overview.connection.creation.destroy_test_db')
+    @mock.patch('pdf.management.commands.benchmark_overview.connection.creation.create_test_db', return_value='db')
+    def test_benchmark_overview(self, mock_create_test_db, mock_destroy_test_db):
+        output = StringIO()
+
+        call_command('benchmark_overview', users=2, pdfs=30, annotations=3, repetitions=1, stdout=output)
+
+        mock_destroy_test_db.assert_called_once_with('db', verbosity=0)
+        self.assertEqual(Pdf.objects.count(), 60)
+        self.assertEqual(PdfHighlight.objects.count(), 180)
+        self.assertFalse(User.objects.get(username='benchmark_0').has_usable_password())
+
+        output_lines = output.getvalue().splitlines()
+        self.assertEqual(output_lines[0], 'Seeding 2 users with 30 PDFs each')
+        self.assertEqual(len(output_lines), 12)
+        self.assertTrue(output_lines[2].startswith('PDFs (Newest)'))
+        self.assertTrue(output_lines[-1].startswith('Highlights'))
+
+        # the dropped indexes are added again
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, 'pdf_pdf')
+
+        self.assertIn('pdf_owner_name_idx', constraints)
+        self.assertIn('pdf_owner_starred_idx', constraints)
+
+
+class TestBenchmarkAnnotationImport(TestCase):
+    @mock.patch('pdf.management.commands.benchmark_annotation_import.connection.creation.destroy_test_db')
+    @mock.patch(
+        'pdf.management.commands.benchmark_annotation_import.connection.creation.create_test_db', return_value='db'
+    )
+    def test_benchmark_annotation_import(self, mock_create_test_db, mock_destroy_test_db):
+        output = StringIO()
+
+        call_command('benchmark_annotation_import', pages=2, highlights=3, comments=1, stdout=output)
+
+        mock_destroy_test_db.assert_called_once_with('db', verbosity=0)
+        pdf = Pdf.objects.get(name='annotated')
+        self.assertFalse(pdf.owner.user.has_usable_password())
+        self.assertEqual(pdf.pdfhighlight_set.count(), 6)
+        self.assertEqual(pdf.pdfcomment_set.count(), 2)
+        self.assertEqual(pdf.pdfhighlight_set.filter(page=2).order_by('text').first().text, 'Line 0 of page 1')
+
+        output_lines = output.getvalue().splitlines()
+        self.assertEqual(len(output_lines), 3)
+        self.assertTrue(output_lines[0].startswith('Extracted 6 highlights and 2 comments in'))
+        self.assertTrue(output_lines[2].startswith('Analysed the pdf with 2 annotated pages in'))
+
+
+class TestBenchmarkTagFilter(TestCase):
+    @mock.patch('pdf.management.commands.benchmark_tag_filter.connection.creation.destroy_test_db')
+    @mock.patch('pdf.management.commands.benchmark_tag_filter.connection.creation.create_test_db', return_value='db')
+    def test_benchmark_tag_filter(self, mock_create_test_db, mock_destroy_test_db):
+        output = StringIO()
+
+        call_command('benchmark_tag_filter', pdfs=30, topics=10, repetitions=1, stdout=output)
+
+        mock_destroy_test_db.assert_called_once_with('db', verbosity=0)
+        self.assertEqual(Pdf.objects.count(), 30)
+        self.assertFalse(User.objects.get(username='benchmark').has_usable_password())
+        # every pdf is on a shelf and has six subtopics
+        self.assertEqual(Pdf.tags.through.objects.count(), 30 * 7)
+
+        output_lines = output.getvalue().splitlines()
+        self.assertEqual(output_lines[0], 'Seeding 30 PDFs with 10 topics')
+        self.assertEqual(len(output_lines), 6)
+        self.assertTrue(output_lines[2].startswith('topic_1 topic_8 topic_5'))
+        self.assertTrue(output_lines[-1].startswith('library '))
+
+
+class TestBenchmarkLinearization(TestCase):
+    def setUp(self):
+        self.dummy_path = Path(__file__).parent / 'data' / 'dummy.pdf'
+        self.linearized_path = Path(__file__).parent / 'data' / 'tmp_linearized.pdf'
+        copy(self.dummy_path, self.linearized_path)
+
+    def tearDown(self):
+        self.linearized_path.unlink(missing_ok=True)
+
+    @mock.patch('pdf.management.commands.benchmark_linearization.linearize_pdf_file')
+    def test_benchmark_linearization(self, mock_linearize_pdf_file):
+        mock_linearize_pdf_file.return_value = str(self.linearized_path)
+        output = StringIO()
+
+        call_command('benchmark_linearization', str(self.dummy_path), latency=100, bandwidth=8, stdout=output)
+
+        output_lines = output.getvalue().splitlines()
+        self.assertEqual(len(output_lines), 2)
+        # the small pdf is loaded with the first request: 100 ms latency + 8885 bytes at 1 byte per µs = 109 ms
+        self.assertEqual(
+            output_lines[1].split(), ['dummy.pdf', '9', 'KB'] + ['109', 'ms', '(1,', '9', 'KB)'] * 2 + ['109', 'ms']
+        )
+        # the temporary linearized copy is deleted
+        self.assertFalse(self.linearized_path.exists())
+
+    @mock.patch('pdf.management.commands.benchmark_linearization.linearize_pdf_file', return_value=None)
+    def test_benchmark_linearization_already_linearized(self, mock_linearize_pdf_file):
+        output = StringIO()
+
+        call_command('benchmark_linearization', str(self.dummy_path), stdout=output)
+
+        self.assertEqual(len(output.getvalue().splitlines()), 2)
+
+    @mock.patch('pdf.management.commands.benchmark_linearization.linearize_pdf_file', side_effect=FileNotFoundError)
+    def test_benchmark_linearization_qpdf_missing(self, mock_linearize_pdf_file):
+        with self.assertRaises(CommandError):
+            call_command('benchmark_linearization', str(self.dummy_path), stdout=StringIO())
+
+    def test_simulate_first_page_loading(self):
+        pdf_bytes = (settings.BASE_DIR / 'users' / 'demo_data' / 'demo.pdf').read_bytes()
+
+        # with small chunks, the cross-reference table at the end and the first page need separate requests
+        requests, loaded_bytes = benchmark_linearization.simulate_first_page_loading(pdf_bytes, 4096)
+
+        self.assertGreater(requests, 2)
+        self.assertLess(loaded_bytes, len(pdf_bytes))
+        self.assertEqual(benchmark_linearization.simulate_first_page_loading(pdf_bytes, 65536), (1, len(pdf_bytes)))
+
+    def test_simulate_first_page_loading_no_pdf(self):
+        with self.assertRaises(CommandError):
+            benchmark_linearization.simulate_first_page_loading(b'no pdf' * 100, 4096)
+
+    def test_format_size(self):
+        self.assertEqual(benchmark_linearization.format_size(2048), '2 KB')
+        self.assertEqual(benchmark_linearization.format_size(5 * 1024 * 1024), '5.0 MB')
+
+
+class TestIndexPageTexts(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='user', password='12345', email='a@a.com')
+        self.pdf = Pdf.objects.create(owner=user.profile, name='pdf', file=get_demo_pdf())
+        self.indexed_pdf = Pdf.objects.create(owner=user.profile, name='indexed_pdf', file=get_demo_pdf())
+        PdfPageText.objects.create(pdf=self.indexed_pdf, page=1, text='indexed')
+
+    def test_index_page_texts(self):
+        with self.assertLogs('management', level='INFO') as logs:
+            call_command('index_page_texts')
+
+        # only the pdf without page texts is indexed
+        self.assertEqual(self.pdf.pdfpagetext_set.count(), 5)
+        self.assertEqual(list(self.indexed_pdf.pdfpagetext_set.values_list('text', flat=True)), ['indexed'])
+        self.assertEqual(logs.output[-1], 'INFO:management:Indexed the page texts of 1 pdfs, 0 failed.')
+
+    @mock.patch('pdf.management.commands.index_page_texts.PROGRESS_LOG_INTERVAL', 1)
+    @mock.patch('pdf.service.PdfProcessingServices.set_page_texts', side_effect=[True, False])
+    def test_index_page_texts_all(self, mock_set_page_texts):
+        with self.assertLogs('management', level='INFO') as logs:
+            call_command('index_page_texts', all=True)
+
+        self.assertEqual({call.args[0] for call in mock_set_page_texts.call_args_list}, {self.pdf, self.indexed_pdf})
+        self.assertEqual(
+            logs.output,
+            [
+                'INFO:management:Indexing the page texts of 2 pdfs.',
+                'INFO:management:Indexed 1 / 2 pdfs',
+                'INFO:management:Indexed 2 / 2 pdfs',
+                'INFO:management:Indexed the page texts of 1 pdfs, 1 failed.',
+            ],
+        )
@@ -8,7 +8,7 @@ from django.core.files import File
 from django.db import connection
 from django.db.models.functions import Lower
 from django.test import TestCase
-from pdf.models.pdf_models import Pdf, Tag
+from pdf.models.pdf_models import Pdf, PdfComment, PdfHighlight, Tag
 from pdf.models.workspace_models import Workspace
 from pdf.services.workspace_services import create_workspace
 from users.service import get_demo_pdf
@@ -18,6 +18,7 @@ add_pdf_previews = importlib.import_module('pdf.migrations.0013_add_pdf_previews
 add_comments_highlights = importlib.import_module('pdf.migrations.0015_add_comments_highlights')
 rename_pdfs_and_add_file_directory = importlib.import_module('pdf.migrations.0016_rename_pdfs_and_add_file_directory')
 fill_collections_workspaces = importlib.import_module('pdf.migrations.0020_fill_collections_workspaces')
+add_annotation_owner = importlib.import_module('pdf.migrations.0028_add_annotation_owner')
 
 
 class TestMigrations(TestCase):
@@ -164,3 +165,22 @@ class TestMigrations(TestCase):
         self.assertEqual(workspace.owners[0], changed_user)
         self.assertEqual(changed_pdf.collection, profile.collections[0])
         self.assertEqual(changed_tag.workspace, workspace)
+
+    def test_fill_annotation_owners(self):
+        other_user = User.objects.create_user(username='other_user', password='12345')
+        other_pdf = Pdf.objects.create(owner=other_user.profile, name='pdf_2')
+        creation_date = self.pdf.creation_date
+
+        for pdf in [self.pdf, other_pdf]:
+            PdfComment.objects.create(text='comment', page=1, creation_date=creation_date, pdf=pdf)
+            PdfHighlight.objects.create(text='highlight', page=1, creation_date=creation_date, pdf=pdf)
+
+        # simulate annotations created before they had an owner, the column is not nullable anymore
+        PdfComment.objects.update(owner=other_user.profile)
+        PdfHighlight.objects.update(owner=other_user.profile)
+
+        add_annotation_owner.fill_annotation_owners(apps, connection.schema_editor())
+
+        for annotation_model in [PdfComment, PdfHighlight]:
+            self.assertEqual(annotation_model.objects.get(pdf=self.pdf).owner, self.user.profile)
+            self.assertEqual(annotation_model.objects.get(pdf=other_pdf).owner, other_user.profile)
@@ -1,4 +1,4 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from unittest.mock import patch
 
 from core.settings import MEDIA_ROOT
@@ -6,6 +6,7 @@ from django.contrib.auth.models import User
 from django.test import TestCase
 from pdf.models.pdf_models import (
     Pdf,
+    PdfHighlight,
     Tag,
     convert_to_natural_age,
     delete_empty_dirs_after_rename_or_delete,
@@ -13,6 +14,7 @@ from pdf.models.pdf_models import (
     get_preview_path,
     get_thumbnail_path,
 )
+from users.models import Profile
 from users.service import get_demo_pdf
 
 
@@ -41,6 +43,30 @@ class TestPdf(TestCase):
         self.assertEqual(user.profile.number_of_pdfs, 0)
         self.assertEqual(user.profile.pdfs_total_size, 0)
 
+    def test_save_delete_pdf_names_version(self):
+        def get_version():
+            return Profile.objects.get(id=self.user.profile.id).pdf_names_version
+
+        versions = [get_version()]
+
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf_2')
+        versions.append(get_version())
+
+        # saving without renaming does not change the version
+        pdf = Pdf.objects.get(id=pdf.id)
+        pdf.current_page = 3
+        pdf.save()
+        self.assertEqual(get_version(), versions[-1])
+
+        pdf.name = 'renamed'
+        pdf.save()
+        versions.append(get_version())
+
+        pdf.delete()
+        versions.append(get_version())
+
+        self.assertEqual(len(set(versions)), 4)
+
     @patch('pdf.models.pdf_models.delete_empty_dirs_after_rename_or_delete')
     def test_delete(self, mock_delete_empty_dirs_after_rename_or_delete):
         self.pdf.delete()
@@ -205,3 +231,15 @@ class TestPdf(TestCase):
     def test_notes_html_sanitize(self):
         self.pdf.notes = '**Danger:** <script>alert("test")</script>'
         self.assertEqual(self.pdf.notes_html, '<p><strong>Danger:</strong> </p>')
+
+
+class TestPdfAnnotation(TestCase):
+    def test_save_sets_owner(self):
+        user = User.objects.create_user(username='testuser', password='12345')
+        pdf = Pdf.objects.create(owner=user.profile, name='pdf')
+
+        highlight = PdfHighlight.objects.create(
+            text='highlight', page=1, creation_date=datetime.now(timezone.utc), pdf=pdf
+        )
+
+        self.assertEqual(PdfHighlight.objects.get(id=highlight.id).owner, user.profile)
@@ -34,6 +34,16 @@ class TestSharedPdf(TestCase):
 
         self.assertTrue(shared_pdf.inactive)
 
+    def test_expired(self):
+        for minutes, exptected_result in [(5, False), (-5, True)]:
+            expiration_date = datetime.now(timezone.utc) + timedelta(minutes=minutes)
+
+            shared_pdf = SharedPdf.objects.create(
+                owner=self.user.profile, pdf=self.pdf, name='share', expiration_date=expiration_date
+            )
+
+            self.assertEqual(shared_pdf.expired, exptected_result)
+
     def test_deleted(self):
         for minutes, exptected_result in [(5, False), (-5, True)]:
             deletion_date = datetime.now(timezone.utc) + timedelta(minutes=minutes)
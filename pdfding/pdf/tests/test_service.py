@@ -1,6 +1,9 @@
 import filecmp
 from collections import OrderedDict
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta, timezone
+from io import BytesIO
 from pathlib import Path
 from unittest import mock
 from uuid import uuid4
@@ -8,14 +11,18 @@ from uuid import uuid4
 import pdf.service as service
 from core.settings import MEDIA_ROOT
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.files import File
+from django.db import connection
 from django.db.models.functions import Lower
 from django.http.response import Http404
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from pdf.models.pdf_models import Pdf, PdfComment, PdfHighlight, Tag
 from PIL import Image
 from pypdfium2 import PdfDocument
+from users.models import Profile
 from users.service import get_demo_pdf
 
 
@@ -34,13 +41,85 @@ class TestTagServices(TestCase):
 
         # check if new tag was generated with correct owner
         self.assertEqual(tags[1].owner, self.user.profile)
+        self.assertEqual(tags[1], Tag.objects.get(name='generated', owner=self.user.profile))
+
+    def test_process_tag_names_number_of_queries(self):
+        tag_names = [f'tag_{i}' for i in range(10)]
+        for tag_name in tag_names[:5]:
+            Tag.objects.create(name=tag_name, owner=self.user.profile)
+
+        # one query for fetching the existing tags and one for creating the missing ones
+        with self.assertNumQueries(2):
+            service.TagServices.process_tag_names(tag_names, self.user.profile)
+
+        with self.assertNumQueries(1):
+            tags = service.TagServices.process_tag_names(tag_names, self.user.profile)
+
+        self.assertEqual([tag.name for tag in tags], tag_names)
+        self.assertEqual(self.user.profile.tags.count(), 10)
+
+    def test_process_tag_names_resolved_tags(self):
+        other_user = User.objects.create_user(username='other', password='password', email='b@a.com')
+        Tag.objects.create(name='other', owner=other_user.profile)
+        resolved_tags = dict()
+
+        tags = service.TagServices.process_tag_names(['existing', 'other'], self.user.profile, resolved_tags)
+        self.assertEqual(resolved_tags, {tag.name: tag for tag in tags})
+
+        # only the unresolved tag needs to be fetched
+        with self.assertNumQueries(2):
+            tags = service.TagServices.process_tag_names(['existing', 'new'], self.user.profile, resolved_tags)
+
+        with self.assertNumQueries(0):
+            service.TagServices.process_tag_names(['new', 'other'], self.user.profile, resolved_tags)
+
+        self.assertEqual(tags, [resolved_tags['existing'], resolved_tags['new']])
+        self.assertEqual(sorted(tag.name for tag in self.user.profile.tags.all()), ['existing', 'new', 'other'])
+
+    @mock.patch('pdf.service.TagServices.clear_tag_info_dict_cache')
+    def test_process_tag_names_clear_cache(self, mock_clear_tag_info_dict_cache):
+        Tag.objects.create(name='existing', owner=self.user.profile)
+
+        service.TagServices.process_tag_names(['existing'], self.user.profile)
+        mock_clear_tag_info_dict_cache.assert_not_called()
+
+        service.TagServices.process_tag_names(['existing', 'generated'], self.user.profile)
+        mock_clear_tag_info_dict_cache.assert_called_once_with(self.user.profile.id)
 
     def test_process_tag_names_empty(self):
         tags = service.TagServices.process_tag_names([], self.user.profile)
 
         self.assertEqual(tags, [])
 
-    @mock.patch('pdf.service.TagServices.get_tag_info_dict_tree_mode')
+    def test_delete_orphan_tags(self):
+        tags = [Tag.objects.create(name=f'tag_{i}', owner=self.user.profile) for i in range(4)]
+        pdf_1 = Pdf.objects.create(owner=self.user.profile, name='pdf_1')
+        pdf_1.tags.set(tags[:3])
+        pdf_2 = Pdf.objects.create(owner=self.user.profile, name='pdf_2')
+        pdf_2.tags.set(tags[2:])
+
+        service.TagServices.get_tag_info_dict(self.user.profile)
+
+        # tag 1 is kept, tag 2 is used by pdf 2
+        service.TagServices.delete_orphan_tags(pdf_1, ['tag_1'])
+
+        self.assertEqual(sorted(self.user.profile.tags.values_list('name', flat=True)), ['tag_1', 'tag_2', 'tag_3'])
+        self.assertEqual(sorted(pdf_1.tags.values_list('name', flat=True)), ['tag_1', 'tag_2'])
+        self.assertIsNone(cache.get(service.TagServices.get_tag_info_dict_cache_key(self.user.profile.id, False)))
+
+    @mock.patch('pdf.service.TagServices.clear_tag_info_dict_cache')
+    def test_delete_orphan_tags_nothing_deleted(self, mock_clear_tag_info_dict_cache):
+        tag = Tag.objects.create(name='tag', owner=self.user.profile)
+        for i in range(2):
+            pdf = Pdf.objects.create(owner=self.user.profile, name=f'pdf_{i}')
+            pdf.tags.set([tag])
+
+        service.TagServices.delete_orphan_tags(pdf)
+
+        self.assertTrue(Tag.objects.filter(id=tag.id).exists())
+        mock_clear_tag_info_dict_cache.assert_not_called()
+
+    @mock.patch('pdf.service.TagServices.get_tag_info_dict_tree_mode', return_value={})
     def test_get_tag_info_dict_tree_mode_enabled(self, mock_get_tag_info_dict_tree_mode):
         profile = self.user.profile
         profile.tag_tree_mode = True
@@ -49,7 +128,7 @@ class TestTagServices(TestCase):
         service.TagServices.get_tag_info_dict(profile)
         mock_get_tag_info_dict_tree_mode.assert_called_once_with(profile)
 
-    @mock.patch('pdf.service.TagServices.get_tag_info_dict_normal_mode')
+    @mock.patch('pdf.service.TagServices.get_tag_info_dict_normal_mode', return_value={})
     def test_get_tag_info_dict_tree_mode_disabled(self, mock_get_tag_info_dict_normal_mode):
         profile = self.user.profile
         profile.tag_tree_mode = False
@@ -58,6 +137,29 @@ class TestTagServices(TestCase):
         service.TagServices.get_tag_info_dict(profile)
         mock_get_tag_info_dict_normal_mode.assert_called_once_with(profile)
 
+    def test_get_tag_info_dict_cached(self):
+        Tag.objects.create(name='programming/python', owner=self.user.profile)
+        profile = self.user.profile
+
+        tag_info_dict = service.TagServices.get_tag_info_dict(profile)
+        self.assertEqual(list(tag_info_dict), ['programming', 'programming/python'])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(service.TagServices.get_tag_info_dict(profile), tag_info_dict)
+
+        # the tag info dicts of the modes are cached separately
+        profile.tag_tree_mode = False
+        self.assertEqual(list(service.TagServices.get_tag_info_dict(profile)), ['programming/python'])
+
+    def test_clear_tag_info_dict_cache(self):
+        profile = self.user.profile
+        service.TagServices.get_tag_info_dict(profile)
+        Tag.objects.create(name='tag', owner=profile)
+
+        service.TagServices.clear_tag_info_dict_cache(profile.id)
+
+        self.assertEqual(list(service.TagServices.get_tag_info_dict(profile)), ['tag'])
+
     def test_get_tag_info_dict_normal_mode(self):
         pdf = Pdf.objects.create(owner=self.user.profile, name='pdf_1')
 
@@ -267,6 +369,103 @@ class TestPdfProcessingServices(TestCase):
         for tag, expected_tag_name in zip(pdf.tags.all().order_by('name'), tag_string.split(' ')):
             self.assertEqual(tag.name, expected_tag_name)
 
+    @override_settings(DEFERRED_PROCESSING_ENABLED=True)
+    @mock.patch('pdf.service.PdfProcessingServices.process_pdf')
+    @mock.patch('pdf.service.PdfProcessingServices.enqueue_processing')
+    def test_create_pdf_deferred(self, mock_enqueue_processing, mock_process_pdf):
+        pdf = service.PdfProcessingServices.create_pdf(
+            name='some_pdf', owner=self.user.profile, pdf_file=get_demo_pdf(), tag_string='some tags'
+        )
+
+        mock_enqueue_processing.assert_called_once_with(pdf)
+        mock_process_pdf.assert_not_called()
+        self.assertEqual(sorted(tag.name for tag in pdf.tags.all()), ['some', 'tags'])
+
+    def test_process_pdf_success(self):
+        pdf = Pdf.objects.create(
+            owner=self.user.profile,
+            name='pdf_1',
+            file=get_demo_pdf(),
+            processing_status=Pdf.ProcessingStatus.PROCESSING,
+        )
+
+        self.assertTrue(service.PdfProcessingServices.process_pdf(pdf))
+
+        pdf = Pdf.objects.get(id=pdf.id)
+        self.assertEqual(pdf.number_of_pages, 5)
+        self.assertTrue(pdf.thumbnail)
+        self.assertTrue(pdf.preview)
+        self.assertEqual(pdf.pdfcomment_set.count(), 2)
+        self.assertEqual(pdf.pdfhighlight_set.count(), 2)
+        self.assertEqual(pdf.pdfpagetext_set.count(), 5)
+        self.assertEqual(pdf.processing_status, Pdf.ProcessingStatus.DONE)
+
+    def test_process_pdf_only_changed_pages(self):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf_1', file=get_demo_pdf())
+        service.PdfProcessingServices.process_pdf(pdf, extract_thumbnail_and_preview=False)
+        self.assertEqual(len(pdf.annotation_fingerprints), 5)
+
+        # mark the annotations of page 2 as changed and remove the highlight of page 3. As the annotations of page 3
+        # did not change, the highlight will not be re-extracted.
+        pdf.annotation_fingerprints[1] = 'outdated'
+        pdf.pdfcomment_set.filter(page=2).update(text='outdated')
+        pdf.pdfhighlight_set.filter(page=3).delete()
+
+        self.assertTrue(service.PdfProcessingServices.process_pdf(pdf, extract_thumbnail_and_preview=False))
+
+        pdf = Pdf.objects.get(id=pdf.id)
+        self.assertNotEqual(pdf.annotation_fingerprints[1], 'outdated')
+        self.assertEqual(pdf.pdfcomment_set.get(page=2).text, 'demo comment page 2')
+        self.assertEqual(pdf.pdfcomment_set.count(), 2)
+        self.assertEqual(list(pdf.pdfhighlight_set.values_list('page', flat=True)), [2])
+
+    def test_process_pdf_only_changed_page_texts(self):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf_1', file=get_demo_pdf())
+        service.PdfProcessingServices.process_pdf(pdf, extract_thumbnail_and_preview=False)
+        page_text_ids = dict(pdf.pdfpagetext_set.values_list('page', 'id'))
+
+        # mark the content of page 4 as changed, only this page is re-indexed
+        pdf.pdfpagetext_set.filter(page=4).update(content_hash='outdated', text='outdated')
+
+        self.assertTrue(service.PdfProcessingServices.process_pdf(pdf, extract_thumbnail_and_preview=False))
+
+        new_page_text_ids = dict(pdf.pdfpagetext_set.values_list('page', 'id'))
+        self.assertEqual(sorted(new_page_text_ids), [1, 2, 3, 4, 5])
+        self.assertNotEqual(new_page_text_ids.pop(4), page_text_ids.pop(4))
+        self.assertEqual(new_page_text_ids, page_text_ids)
+        self.assertNotEqual(pdf.pdfpagetext_set.get(page=4).text, 'outdated')
+        self.assertNotIn('outdated', pdf.pdfpagetext_set.values_list('content_hash', flat=True))
+
+    @mock.patch('pdf.service.analyse_pdf_file', return_value=service.PdfAnalysisResult(errors=['error']))
+    def test_process_pdf_failure(self, mock_analyse_pdf_file):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf_1', file=get_demo_pdf())
+
+        self.assertFalse(service.PdfProcessingServices.process_pdf(pdf, extract_thumbnail_and_preview=False))
+
+        mock_analyse_pdf_file.assert_called_once_with(pdf.file.path, False, [], [])
+        self.assertEqual(pdf.processing_status, Pdf.ProcessingStatus.FAILED)
+        self.assertEqual(Pdf.objects.get(id=pdf.id).processing_status, Pdf.ProcessingStatus.FAILED)
+
+    @mock.patch('pdf.tasks.enqueue_pdf_processing')
+    def test_enqueue_processing(self, mock_enqueue_pdf_processing):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf_1')
+
+        service.PdfProcessingServices.enqueue_processing(pdf)
+
+        mock_enqueue_pdf_processing.assert_called_once_with(str(pdf.id), True)
+        self.assertEqual(Pdf.objects.get(id=pdf.id).processing_status, Pdf.ProcessingStatus.PENDING)
+
+    def test_set_processing_status_keeps_other_changes(self):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf_1')
+        # simulate the user renaming the pdf while it is being processed
+        Pdf.objects.filter(id=pdf.id).update(name='renamed')
+
+        service.PdfProcessingServices.set_processing_status(pdf, Pdf.ProcessingStatus.FAILED)
+
+        changed_pdf = Pdf.objects.get(id=pdf.id)
+        self.assertEqual(changed_pdf.name, 'renamed')
+        self.assertEqual(changed_pdf.processing_status, Pdf.ProcessingStatus.FAILED)
+
     @mock.patch('pdf.service.PdfProcessingServices.set_thumbnail_and_preview')
     def test_set_process_with_pypdfium_no_images(self, mock_set_thumbnail_and_preview):
         pdf = Pdf.objects.create(owner=self.user.profile, name='pdf_1')
@@ -277,7 +476,7 @@ class TestPdfProcessingServices(TestCase):
             pdf.file = File(f, name=dummy_path.name)
             pdf.save()
 
-        service.PdfProcessingServices.process_with_pypdfium(pdf, False)
+        self.assertTrue(service.PdfProcessingServices.process_with_pypdfium(pdf, False))
 
         pdf = self.user.profile.pdfs.get(name=pdf.name)
         self.assertEqual(pdf.number_of_pages, 2)
@@ -309,7 +508,7 @@ class TestPdfProcessingServices(TestCase):
         pdf.file = file_mock
         pdf.save()
 
-        service.PdfProcessingServices.process_with_pypdfium(pdf, False)
+        self.assertFalse(service.PdfProcessingServices.process_with_pypdfium(pdf, False))
         pdf = self.user.profile.pdfs.get(name=pdf.name)
         self.assertEqual(pdf.number_of_pages, -1)
 
@@ -403,6 +602,238 @@ class TestPdfProcessingServices(TestCase):
         self.assertFalse(pdf.pdfcomment_set.count())
         self.assertFalse(pdf.pdfhighlight_set.count())
 
+    def test_save_highlights_and_comments(self):
+        creation_date = datetime(2025, 3, 11, tzinfo=timezone.utc)
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf')
+        PdfHighlight.objects.create(text='old highlight', page=1, creation_date=creation_date, pdf=pdf)
+        PdfComment.objects.create(text='old comment', page=2, creation_date=creation_date, pdf=pdf)
+        highlights = [(f'highlight {i}', i % 5 + 1, creation_date) for i in range(100)]
+        comments = [(f'comment {i}', i % 5 + 1, creation_date) for i in range(50)]
+
+        # the annotations are inserted in bulk instead of one query per annotation
+        with CaptureQueriesContext(connection) as queries:
+            service.PdfProcessingServices.save_highlights_and_comments(pdf, comments, highlights)
+
+        self.assertLess(len(queries), 10)
+        self.assertEqual(pdf.pdfhighlight_set.filter(owner=self.user.profile).count(), 100)
+        self.assertEqual(pdf.pdfcomment_set.filter(owner=self.user.profile).count(), 50)
+        self.assertFalse(pdf.pdfhighlight_set.filter(text='old highlight').exists())
+        self.assertFalse(pdf.pdfcomment_set.filter(text='old comment').exists())
+
+    def test_set_page_texts(self):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf_with_text', file=get_demo_pdf())
+
+        self.assertTrue(service.PdfProcessingServices.set_page_texts(pdf))
+
+        page_texts = pdf.pdfpagetext_set.order_by('page')
+        self.assertEqual([page_text.page for page_text in page_texts], [1, 2, 3, 4, 5])
+        self.assertIn('Semper curabitur est maecenas orci dis accumsan sem dictum commodo?', page_texts[1].text)
+        self.assertTrue(all(page_text.content_hash for page_text in page_texts))
+
+    def test_set_page_texts_exception(self):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf_with_text', file='dummy_file')
+
+        self.assertFalse(service.PdfProcessingServices.set_page_texts(pdf))
+        self.assertFalse(pdf.pdfpagetext_set.count())
+
+    def test_save_page_texts(self):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf')
+        service.PdfProcessingServices.save_page_texts(pdf, {1: 'one', 2: 'two', 3: 'three'}, ['a', 'b', 'c'])
+
+        # page 2 changed and page 3 was removed
+        service.PdfProcessingServices.save_page_texts(pdf, {2: 'new two'}, ['a', 'd'])
+
+        self.assertEqual(
+            list(pdf.pdfpagetext_set.order_by('page').values_list('page', 'text', 'content_hash')),
+            [(1, 'one', 'a'), (2, 'new two', 'd')],
+        )
+
+    def test_bulk_create_pdfs(self):
+        result = service.PdfProcessingServices.bulk_create_pdfs(
+            pdf_files=[get_demo_pdf(), get_demo_pdf()],
+            owner=self.user.profile,
+            description='some description',
+            tag_string='some tags',
+            file_directory='some/dir',
+        )
+
+        pdfs = self.user.profile.pdfs
+        self.assertEqual(len(result.added), 2)
+        self.assertEqual(result.failed, [])
+        # the second pdf gets a suffix as the name is already used by the first one
+        self.assertEqual(sorted(result.added), sorted(pdf.name for pdf in pdfs))
+        self.assertEqual(pdfs[0].name, 'demo')
+
+        for pdf in pdfs:
+            self.assertEqual(pdf.description, 'some description')
+            self.assertEqual(pdf.file_directory, 'some/dir')
+            self.assertEqual(sorted(tag.name for tag in pdf.tags.all()), ['some', 'tags'])
+            self.assertEqual(pdf.number_of_pages, 5)
+            self.assertTrue(pdf.thumbnail)
+            self.assertTrue(pdf.preview)
+            self.assertEqual(pdf.pdfcomment_set.count(), 2)
+            self.assertEqual(pdf.pdfhighlight_set.count(), 2)
+            self.assertEqual(pdf.processing_status, Pdf.ProcessingStatus.DONE)
+
+    @override_settings(PDF_PROCESSING_WORKERS=2, PDF_PROCESSING_BATCH_SIZE=1)
+    def test_bulk_create_pdfs_process_pool(self):
+        dummy_path = Path(__file__).parent / 'data' / 'dummy.pdf'
+
+        with dummy_path.open(mode='rb') as f:
+            result = service.PdfProcessingServices.bulk_create_pdfs(
+                pdf_files=[get_demo_pdf(), File(f, name=dummy_path.name)], owner=self.user.profile
+            )
+
+        self.assertEqual(sorted(result.added), ['demo', 'dummy'])
+        self.assertEqual(self.user.profile.pdfs.get(name='demo').number_of_pages, 5)
+        self.assertEqual(self.user.profile.pdfs.get(name='demo').pdfhighlight_set.count(), 2)
+        self.assertEqual(self.user.profile.pdfs.get(name='dummy').number_of_pages, 2)
+
+    def test_bulk_create_pdfs_processing_failed(self):
+        file = File(BytesIO(b'no pdf'), name='no_pdf.pdf')
+
+        result = service.PdfProcessingServices.bulk_create_pdfs(pdf_files=[file], owner=self.user.profile)
+
+        pdf = self.user.profile.pdfs.get(name='no_pdf')
+        self.assertEqual(result.added, [])
+        self.assertEqual(result.failed, ['no_pdf'])
+        self.assertEqual(pdf.number_of_pages, -1)
+        self.assertEqual(pdf.processing_status, Pdf.ProcessingStatus.FAILED)
+
+    @mock.patch('pdf.service.PdfProcessingServices.process_pdfs_in_parallel', return_value=[])
+    @mock.patch('pdf.service.create_unique_name_from_file', side_effect=[ValueError, 'other'])
+    def test_bulk_create_pdfs_creation_failed(self, mock_create_unique_name_from_file, mock_process_pdfs_in_parallel):
+        other_file = get_demo_pdf()
+        other_file.name = 'other.pdf'
+
+        result = service.PdfProcessingServices.bulk_create_pdfs(
+            pdf_files=[get_demo_pdf(), other_file], owner=self.user.profile
+        )
+
+        self.assertEqual(result.failed, ['demo.pdf'])
+        self.assertEqual([pdf.name for pdf in self.user.profile.pdfs], ['other'])
+        mock_process_pdfs_in_parallel.assert_called_once_with([self.user.profile.pdfs.get(name='other')])
+
+    @mock.patch('pdf.service.PdfProcessingServices.process_pdfs_in_parallel', return_value=[])
+    @mock.patch('pdf.service.create_unique_name_from_file', side_effect=ValueError)
+    def test_bulk_create_pdfs_no_orphan_tags(self, mock_create_unique_name_from_file, mock_process_pdfs_in_parallel):
+        result = service.PdfProcessingServices.bulk_create_pdfs(
+            pdf_files=[get_demo_pdf(), get_demo_pdf()], owner=self.user.profile, tag_string='some tags'
+        )
+
+        self.assertEqual(result.failed, ['demo.pdf', 'demo.pdf'])
+        self.assertFalse(Tag.objects.filter(owner=self.user.profile).exists())
+
+    @mock.patch('pdf.service.PdfProcessingServices.process_pdfs_in_parallel', return_value=[])
+    def test_bulk_create_pdfs_tags_rolled_back(self, mock_process_pdfs_in_parallel):
+        process_tag_names = service.TagServices.process_tag_names
+
+        def create_tags_and_fail_once(tag_names, owner_profile):
+            tags = process_tag_names(tag_names, owner_profile)
+
+            if mock_process_tag_names.call_count == 1:
+                raise ValueError
+
+            return tags
+
+        other_file = get_demo_pdf()
+        other_file.name = 'other.pdf'
+
+        with mock.patch(
+            'pdf.service.TagServices.process_tag_names', side_effect=create_tags_and_fail_once
+        ) as mock_process_tag_names:
+            result = service.PdfProcessingServices.bulk_create_pdfs(
+                pdf_files=[get_demo_pdf(), get_demo_pdf(), other_file], owner=self.user.profile, tag_string='some tags'
+            )
+
+        # the tags of the failed first pdf are rolled back, so they are resolved again for the second pdf only
+        self.assertEqual(result.failed, ['demo.pdf'])
+        self.assertEqual(mock_process_tag_names.call_count, 2)
+        self.assertEqual(Tag.objects.filter(owner=self.user.profile).count(), 2)
+
+        for pdf in self.user.profile.pdfs:
+            self.assertEqual(sorted(tag.name for tag in pdf.tags.all()), ['some', 'tags'])
+
+    @override_settings(DEFERRED_PROCESSING_ENABLED=True)
+    @mock.patch('pdf.service.PdfProcessingServices.process_pdfs_in_parallel')
+    @mock.patch('pdf.service.PdfProcessingServices.enqueue_processing')
+    def test_bulk_create_pdfs_deferred(self, mock_enqueue_processing, mock_process_pdfs_in_parallel):
+        result = service.PdfProcessingServices.bulk_create_pdfs(pdf_files=[get_demo_pdf()], owner=self.user.profile)
+
+        pdf = self.user.profile.pdfs.get(name='demo')
+        self.assertEqual(result.added, ['demo'])
+        mock_enqueue_processing.assert_called_once_with(pdf)
+        mock_process_pdfs_in_parallel.assert_not_called()
+
+    def test_get_future_result_exception(self):
+        future = Future()
+        future.set_exception(BrokenProcessPool())
+
+        result = service.PdfProcessingServices.get_future_result(future)
+
+        self.assertEqual(len(result.errors), 1)
+        self.assertIsNone(result.number_of_pages)
+
+    def test_apply_analysis_result_partial(self):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf')
+        analysis_result = service.PdfAnalysisResult(number_of_pages=3, errors=['error'])
+
+        self.assertFalse(service.PdfProcessingServices.apply_analysis_result(pdf, analysis_result))
+
+        pdf = Pdf.objects.get(id=pdf.id)
+        self.assertEqual(pdf.number_of_pages, 3)
+        self.assertFalse(pdf.thumbnail)
+        self.assertEqual(pdf.processing_status, Pdf.ProcessingStatus.FAILED)
+
+    @override_settings(PDF_LINEARIZATION_ENABLED=True)
+    @mock.patch('pdf.tasks.linearize_pdf_task')
+    @mock.patch('pdf.service.linearize_pdf_file')
+    def test_process_pdf_linearization_enabled(self, mock_linearize_pdf_file, mock_linearize_pdf_task):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf', file=get_demo_pdf())
+
+        self.assertTrue(service.PdfProcessingServices.process_pdf(pdf))
+
+        # the linearized copy is created by the huey worker and not while processing the request
+        mock_linearize_pdf_file.assert_not_called()
+        mock_linearize_pdf_task.assert_called_once_with(str(pdf.id))
+
+    @mock.patch('pdf.tasks.linearize_pdf_task')
+    def test_enqueue_linearization_disabled(self, mock_linearize_pdf_task):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf')
+
+        service.PdfProcessingServices.enqueue_linearization(pdf)
+
+        mock_linearize_pdf_task.assert_not_called()
+
+    @mock.patch('pdf.service.linearize_pdf_file')
+    def test_set_linearized_file(self, mock_linearize_pdf_file):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf', file=get_demo_pdf())
+        linearized_file_path = Path(MEDIA_ROOT) / 'tmp_linearized.pdf'
+        linearized_file_path.write_bytes(b'linearized')
+        mock_linearize_pdf_file.return_value = str(linearized_file_path)
+
+        self.assertTrue(service.PdfProcessingServices.set_linearized_file(pdf))
+
+        pdf = Pdf.objects.get(id=pdf.id)
+        self.assertEqual(pdf.linearized_file.read(), b'linearized')
+        self.assertFalse(linearized_file_path.exists())
+
+    @mock.patch('pdf.service.linearize_pdf_file', return_value=None)
+    def test_set_linearized_file_already_linearized(self, mock_linearize_pdf_file):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf', file=get_demo_pdf())
+
+        self.assertTrue(service.PdfProcessingServices.set_linearized_file(pdf))
+        self.assertFalse(Pdf.objects.get(id=pdf.id).linearized_file)
+
+    @mock.patch('pdf.service.linearize_pdf_file', side_effect=RuntimeError)
+    def test_set_linearized_file_failure(self, mock_linearize_pdf_file):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf', file=get_demo_pdf())
+
+        with self.assertLogs(service.logger, level='INFO'):
+            self.assertFalse(service.PdfProcessingServices.set_linearized_file(pdf))
+
+        self.assertFalse(Pdf.objects.get(id=pdf.id).linearized_file)
+
     @mock.patch('pdf.service.PdfProcessingServices.export_annotations_to_yaml')
     def test_export_annotations(self, mock_export_annotation_to_yaml):
         pdf_1 = Pdf.objects.create(owner=self.user.profile, name='pdf_1')
@@ -566,6 +997,19 @@ class TestOtherServices(TestCase):
         with self.assertRaises(Http404):
             self.get_object(str(uuid4()), self.user)
 
+    async def test_check_object_access_allowed_async(self):
+        @service.check_object_access_allowed
+        async def aget_object(pdf_id: str, user: User):
+            return await Pdf.objects.aget(owner__user=user, id=pdf_id)
+
+        pdf = await Pdf.objects.acreate(owner=await Profile.objects.aget(user=self.user), name='pdf')
+
+        self.assertEqual(pdf, await aget_object(pdf.id, self.user))
+
+        for pdf_id in ['12345', str(uuid4())]:
+            with self.assertRaises(Http404):
+                await aget_object(pdf_id, self.user)
+
     def test_get_future_datetime(self):
         expected_result = datetime.now(timezone.utc) + timedelta(days=1, hours=0, minutes=22)
         generated_result = service.get_future_datetime('1d0h22m')
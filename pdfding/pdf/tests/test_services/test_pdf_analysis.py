@@ -0,0 +1,242 @@
+from datetime import datetime
+from hashlib import blake2b
+from io import BufferedReader, BytesIO
+from pathlib import Path
+from unittest import mock
+
+from django.conf import settings
+from django.test import TestCase
+from pdf.services import pdf_analysis
+from PIL import Image
+from pypdf import PdfReader, PdfWriter
+from pypdfium2 import PdfPage
+
+DEMO_PDF_PATH = settings.BASE_DIR / 'users' / 'demo_data' / 'demo.pdf'
+
+
+class TestPdfAnalysis(TestCase):
+    def test_analyse_pdf_file(self):
+        result = pdf_analysis.analyse_pdf_file(str(DEMO_PDF_PATH))
+
+        self.assertEqual(result.number_of_pages, 5)
+        self.assertEqual(Image.open(BytesIO(result.thumbnail)).size, (135, 175))
+        self.assertEqual(Image.open(BytesIO(result.preview)).width, 450)
+        self.assertEqual(len(result.comments), 2)
+        self.assertEqual(len(result.highlights), 2)
+        self.assertEqual(sorted(result.page_texts), [1, 2, 3, 4, 5])
+        self.assertEqual(len(result.content_hashes), 5)
+        self.assertEqual(result.errors, [])
+
+    def test_analyse_pdf_file_no_images(self):
+        dummy_path = Path(__file__).parents[1] / 'data' / 'dummy.pdf'
+
+        result = pdf_analysis.analyse_pdf_file(str(dummy_path), extract_thumbnail_and_preview=False)
+
+        self.assertEqual(result.number_of_pages, 2)
+        self.assertIsNone(result.thumbnail)
+        self.assertIsNone(result.preview)
+        self.assertEqual(result.errors, [])
+
+    def test_analyse_pdf_file_not_existing(self):
+        result = pdf_analysis.analyse_pdf_file('not_existing.pdf')
+
+        self.assertIsNone(result.number_of_pages)
+        self.assertIsNone(result.comments)
+        self.assertEqual(len(result.errors), 1)
+
+    @mock.patch('pdf.services.pdf_analysis.shutil.which', return_value='/usr/bin/qpdf')
+    @mock.patch('pdf.services.pdf_analysis.subprocess.run')
+    def test_linearize_pdf_file(self, mock_run, mock_which):
+        mock_run.return_value.returncode = 3
+
+        linearized_file_path = pdf_analysis.linearize_pdf_file(str(DEMO_PDF_PATH))
+
+        try:
+            mock_run.assert_called_once_with(
+                ['/usr/bin/qpdf', '--linearize', str(DEMO_PDF_PATH), linearized_file_path], capture_output=True
+            )
+            self.assertTrue(Path(linearized_file_path).exists())
+        finally:
+            Path(linearized_file_path).unlink()
+
+    @mock.patch('pdf.services.pdf_analysis.shutil.which', return_value='/usr/bin/qpdf')
+    @mock.patch('pdf.services.pdf_analysis.subprocess.run')
+    def test_linearize_pdf_file_failure(self, mock_run, mock_which):
+        mock_run.return_value.returncode = 2
+        mock_run.return_value.stderr = b'damaged pdf'
+
+        with self.assertRaisesMessage(RuntimeError, 'damaged pdf'):
+            pdf_analysis.linearize_pdf_file(str(DEMO_PDF_PATH))
+
+        # the temporary copy is deleted
+        self.assertFalse(Path(mock_run.call_args.args[0][3]).exists())
+
+    @mock.patch('pdf.services.pdf_analysis.shutil.which', return_value=None)
+    def test_linearize_pdf_file_qpdf_missing(self, mock_which):
+        with self.assertRaises(FileNotFoundError):
+            pdf_analysis.linearize_pdf_file(str(DEMO_PDF_PATH))
+
+    @mock.patch('pdf.services.pdf_analysis.subprocess.run')
+    def test_linearize_pdf_file_already_linearized(self, mock_run):
+        with mock.patch('pdf.services.pdf_analysis.is_linearized', return_value=True):
+            self.assertIsNone(pdf_analysis.linearize_pdf_file(str(DEMO_PDF_PATH)))
+
+        mock_run.assert_not_called()
+
+    def test_is_linearized(self):
+        linearized_path = Path(__file__).parents[1] / 'data' / 'linearized.pdf'
+        linearized_path.write_bytes(b'%PDF-1.7\n%\xe2\xe3\xcf\xd3\n1 0 obj\n<< /Linearized 1 /L 8885 >>\nendobj\n')
+
+        try:
+            self.assertTrue(pdf_analysis.is_linearized(str(linearized_path)))
+        finally:
+            linearized_path.unlink()
+
+        self.assertFalse(pdf_analysis.is_linearized(str(DEMO_PDF_PATH)))
+
+    def test_analyse_pdf_no_pdf(self):
+        result = pdf_analysis.analyse_pdf(__file__)
+
+        self.assertIsNone(result.number_of_pages)
+        self.assertIsNone(result.comments)
+        self.assertEqual(len(result.errors), 1)
+
+    @mock.patch('pdf.services.pdf_analysis.render_thumbnail_and_preview', side_effect=ValueError)
+    def test_analyse_pdf_images_exception(self, mock_render_thumbnail_and_preview):
+        result = pdf_analysis.analyse_pdf(str(DEMO_PDF_PATH))
+
+        self.assertEqual(result.number_of_pages, 5)
+        self.assertIsNone(result.thumbnail)
+        self.assertEqual(len(result.comments), 2)
+        self.assertEqual(len(result.errors), 1)
+
+    @mock.patch('pdf.services.pdf_analysis.extract_annotations', side_effect=ValueError)
+    def test_analyse_pdf_annotation_exception(self, mock_extract_annotations):
+        result = pdf_analysis.analyse_pdf(str(DEMO_PDF_PATH), extract_thumbnail_and_preview=False)
+
+        self.assertEqual(result.number_of_pages, 5)
+        self.assertIsNone(result.comments)
+        self.assertEqual(len(result.errors), 1)
+
+    @mock.patch('pdf.services.pdf_analysis.PdfReader', wraps=pdf_analysis.PdfReader)
+    @mock.patch('pdf.services.pdf_analysis.PdfDocument', wraps=pdf_analysis.PdfDocument)
+    def test_analyse_pdf_opens_document_once(self, mock_pdf_document, mock_pdf_reader):
+        with mock.patch.object(PdfPage, 'get_textpage', autospec=True, side_effect=PdfPage.get_textpage) as mock_get:
+            result = pdf_analysis.analyse_pdf(str(DEMO_PDF_PATH))
+
+        self.assertEqual(result.errors, [])
+        # the pdf is not loaded into memory as a whole, pypdfium opens it by path and pypdf reads it from the file
+        mock_pdf_document.assert_called_once_with(str(DEMO_PDF_PATH))
+        self.assertIsInstance(mock_pdf_reader.call_args.args[0], BufferedReader)
+        # the demo pdf has highlights on two pages and the texts of all five pages are extracted
+        self.assertEqual(mock_get.call_count, 7)
+
+    def test_extract_highlights_and_comments(self):
+        creation_date = datetime.strptime('20250311081649-+00:00', '%Y%m%d%H%M%S-%z')
+
+        comments, highlights = pdf_analysis.extract_highlights_and_comments(str(DEMO_PDF_PATH))
+
+        self.assertEqual(sorted(comments), [('demo comment page 2', 2, creation_date), ('last page', 5, creation_date)])
+        self.assertEqual(
+            sorted(highlights),
+            [
+                (
+                    'Massa ullamcorper aenean molestie laoreet aenean sed laoreet. '
+                    'Ante non cursus proin mauris dictumst magnis',
+                    3,
+                    creation_date,
+                ),
+                ('Semper curabitur est maecenas orci dis accumsan sem dictum commodo?', 2, creation_date),
+            ],
+        )
+
+    def test_analyse_pdf_only_changed_pages(self):
+        pdf_path = str(DEMO_PDF_PATH)
+        previous_fingerprints = pdf_analysis.analyse_pdf(pdf_path, False).annotation_fingerprints
+        previous_fingerprints[1] = 'outdated'
+
+        result = pdf_analysis.analyse_pdf(pdf_path, False, previous_fingerprints)
+
+        self.assertEqual(result.changed_pages, [2])
+        self.assertEqual([comment[:2] for comment in result.comments], [('demo comment page 2', 2)])
+        self.assertEqual([highlight[1] for highlight in result.highlights], [2])
+        self.assertNotEqual(result.annotation_fingerprints[1], 'outdated')
+
+    def test_analyse_pdf_no_changed_pages(self):
+        pdf_path = str(DEMO_PDF_PATH)
+        previous_result = pdf_analysis.analyse_pdf(pdf_path, False)
+
+        with mock.patch.object(PdfPage, 'get_textpage') as mock_get_textpage:
+            result = pdf_analysis.analyse_pdf(
+                pdf_path, False, previous_result.annotation_fingerprints, previous_result.content_hashes
+            )
+
+        self.assertEqual(result.changed_pages, [])
+        self.assertEqual(result.comments, [])
+        self.assertEqual(result.highlights, [])
+        self.assertEqual(result.page_texts, {})
+        self.assertEqual(result.annotation_fingerprints, previous_result.annotation_fingerprints)
+        self.assertEqual(result.content_hashes, previous_result.content_hashes)
+        mock_get_textpage.assert_not_called()
+
+    def test_analyse_pdf_only_changed_page_texts(self):
+        pdf_path = str(DEMO_PDF_PATH)
+        previous_content_hashes = pdf_analysis.analyse_pdf(pdf_path, False).content_hashes
+        previous_content_hashes[3] = 'outdated'
+
+        result = pdf_analysis.analyse_pdf(pdf_path, False, None, previous_content_hashes)
+
+        self.assertEqual(list(result.page_texts), [4])
+        self.assertNotEqual(result.content_hashes[3], 'outdated')
+
+    def test_extract_page_texts(self):
+        pdfium_document = pdf_analysis.PdfDocument(str(DEMO_PDF_PATH))
+
+        page_texts = pdf_analysis.extract_page_texts(pdfium_document)
+        page_texts_subset = pdf_analysis.extract_page_texts(pdfium_document, [2])
+
+        self.assertEqual(sorted(page_texts), [1, 2, 3, 4, 5])
+        self.assertIn('Semper curabitur est maecenas orci dis accumsan sem dictum commodo?', page_texts[2])
+        # whitespace including line breaks is normalized
+        self.assertNotIn('\n', page_texts[2])
+        self.assertNotIn('  ', page_texts[2])
+        self.assertEqual(page_texts_subset, {2: page_texts[2]})
+
+    def test_extract_page_texts_and_content_hashes(self):
+        page_texts, content_hashes = pdf_analysis.extract_page_texts_and_content_hashes(str(DEMO_PDF_PATH))
+
+        self.assertEqual(sorted(page_texts), [1, 2, 3, 4, 5])
+        self.assertEqual(content_hashes, pdf_analysis.get_content_hashes(PdfReader(DEMO_PDF_PATH)))
+
+    def test_get_content_hashes(self):
+        content_hashes = pdf_analysis.get_content_hashes(PdfReader(DEMO_PDF_PATH))
+
+        self.assertEqual(len(content_hashes), 5)
+        self.assertEqual(len(set(content_hashes)), 5)
+        self.assertTrue(all(len(content_hash) == 32 for content_hash in content_hashes))
+
+    def test_get_content_hashes_empty_page(self):
+        writer = PdfWriter()
+        writer.add_blank_page(width=100, height=100)
+        pdf_io = BytesIO()
+        writer.write(pdf_io)
+
+        content_hashes = pdf_analysis.get_content_hashes(PdfReader(pdf_io))
+
+        self.assertEqual(content_hashes, [blake2b(b'', digest_size=16).hexdigest()])
+
+    def test_get_annotation_fingerprints(self):
+        fingerprints = pdf_analysis.get_annotation_fingerprints(PdfReader(DEMO_PDF_PATH))
+
+        # the demo pdf has comments and highlights on page 2, 3 and 5
+        self.assertEqual([bool(fingerprint) for fingerprint in fingerprints], [False, True, True, False, True])
+        self.assertEqual(len(set(fingerprints)), 4)
+
+    def test_get_changed_pages(self):
+        self.assertEqual(pdf_analysis.get_changed_pages(['a', '', 'b'], ['a', 'c', '']), [2, 3])
+        self.assertEqual(pdf_analysis.get_changed_pages(['a', 'b'], ['a', 'b']), [])
+
+    def test_get_changed_pages_no_match(self):
+        self.assertIsNone(pdf_analysis.get_changed_pages(None, ['a']))
+        self.assertIsNone(pdf_analysis.get_changed_pages([], ['a']))
+        self.assertIsNone(pdf_analysis.get_changed_pages(['a', 'b'], ['a']))
@@ -0,0 +1,126 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from pdf.models.pdf_models import Pdf
+from pdf.services import reading_progress
+
+
+class TestReadingProgress(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='user', password='12345', email='a@a.com')
+        # only the current pages of pdfs viewed within the buffer timeout are buffered
+        now = datetime.now(timezone.utc)
+        self.pdf_1 = Pdf.objects.create(owner=self.user.profile, name='pdf_1', current_page=2, last_viewed_date=now)
+        self.pdf_2 = Pdf.objects.create(owner=self.user.profile, name='pdf_2', current_page=5, last_viewed_date=now)
+
+    async def test_abuffer_current_page(self):
+        await reading_progress.abuffer_current_page(self.pdf_1, 3)
+        await reading_progress.abuffer_current_page(self.pdf_1, 4)
+        await reading_progress.abuffer_current_page(self.pdf_2, 6)
+
+        self.assertEqual(await cache.aget(reading_progress.get_current_page_cache_key(self.pdf_1.id)), 4)
+        self.assertEqual(await cache.aget(reading_progress.get_current_page_cache_key(self.pdf_2.id)), 6)
+        # the database is not changed
+        self.assertEqual((await Pdf.objects.aget(id=self.pdf_1.id)).current_page, 2)
+
+    async def test_abuffer_current_page_interleaved(self):
+        original_aset = cache.aset
+
+        # hand over to the other buffering request before every cache access
+        async def interleaved_aset(*args, **kwargs):
+            await asyncio.sleep(0)
+            return await original_aset(*args, **kwargs)
+
+        with mock.patch.object(reading_progress.cache, 'aset', interleaved_aset):
+            await asyncio.gather(
+                reading_progress.abuffer_current_page(self.pdf_1, 3),
+                reading_progress.abuffer_current_page(self.pdf_2, 6),
+            )
+
+        # neither request overwrote the page buffered by the other one
+        self.assertEqual(await sync_to_async(reading_progress.flush_current_pages)(), 2)
+        self.assertEqual((await Pdf.objects.aget(id=self.pdf_1.id)).current_page, 3)
+        self.assertEqual((await Pdf.objects.aget(id=self.pdf_2.id)).current_page, 6)
+
+    async def test_abuffer_current_page_not_viewed_recently(self):
+        self.pdf_1.last_viewed_date = datetime.now(timezone.utc) - timedelta(seconds=reading_progress.BUFFER_TIMEOUT)
+
+        await reading_progress.abuffer_current_page(self.pdf_1, 3)
+
+        # the page would not be found by the flush, so it is written directly
+        self.assertIsNone(await cache.aget(reading_progress.get_current_page_cache_key(self.pdf_1.id)))
+        self.assertEqual((await Pdf.objects.aget(id=self.pdf_1.id)).current_page, 3)
+
+    def test_get_current_page(self):
+        self.assertEqual(reading_progress.get_current_page(self.pdf_1), 2)
+
+        cache.set(reading_progress.get_current_page_cache_key(self.pdf_1.id), 7)
+
+        self.assertEqual(reading_progress.get_current_page(self.pdf_1), 7)
+
+    def test_flush_current_pages(self):
+        other_user = User.objects.create_user(username='other', password='12345', email='b@a.com')
+        other_pdf = Pdf.objects.create(
+            owner=other_user.profile, name='other_pdf', last_viewed_date=datetime.now(timezone.utc)
+        )
+
+        for pdf, current_page in [(self.pdf_1, 3), (self.pdf_1, 8), (self.pdf_2, 5), (other_pdf, 4)]:
+            self.buffer_current_page(pdf, current_page)
+
+        # the unchanged current page of pdf 2 is not written
+        self.assertEqual(reading_progress.flush_current_pages(), 2)
+
+        # the last buffered page wins
+        self.assertEqual(Pdf.objects.get(id=self.pdf_1.id).current_page, 8)
+        self.assertEqual(Pdf.objects.get(id=self.pdf_2.id).current_page, 5)
+        self.assertEqual(Pdf.objects.get(id=other_pdf.id).current_page, 4)
+
+        # the buffered pages are kept, but are not written again
+        self.assertEqual(reading_progress.get_current_page(self.pdf_1), 8)
+        self.assertEqual(reading_progress.flush_current_pages(), 0)
+
+    @mock.patch('pdf.services.reading_progress.FLUSH_BATCH_SIZE', 1)
+    def test_flush_current_pages_batched(self):
+        self.buffer_current_page(self.pdf_1, 3)
+        self.buffer_current_page(self.pdf_2, 6)
+
+        # one query for the viewed pdfs and an update per batch
+        with self.assertNumQueries(3):
+            self.assertEqual(reading_progress.flush_current_pages(), 2)
+
+    def test_flush_current_pages_expired(self):
+        self.buffer_current_page(self.pdf_1, 3)
+        self.buffer_current_page(self.pdf_2, 6)
+        cache.delete(reading_progress.get_current_page_cache_key(self.pdf_2.id))
+
+        self.assertEqual(reading_progress.flush_current_pages(), 1)
+        self.assertEqual(Pdf.objects.get(id=self.pdf_2.id).current_page, 5)
+
+    def test_flush_current_pages_not_viewed_recently(self):
+        self.buffer_current_page(self.pdf_1, 3)
+        Pdf.objects.filter(id=self.pdf_1.id).update(
+            last_viewed_date=datetime.now(timezone.utc) - timedelta(seconds=reading_progress.BUFFER_TIMEOUT + 1)
+        )
+
+        # the buffered page of a pdf outside the buffer timeout has already expired and is not looked up
+        self.assertEqual(reading_progress.flush_current_pages(), 0)
+
+    def test_flush_current_pages_deleted_pdf(self):
+        self.buffer_current_page(self.pdf_1, 3)
+        self.pdf_1.delete()
+
+        self.assertEqual(reading_progress.flush_current_pages(), 0)
+
+    def test_flush_current_pages_nothing_buffered(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(reading_progress.flush_current_pages(), 0)
+
+    @staticmethod
+    def buffer_current_page(pdf: Pdf, current_page: int):
+        async_to_sync(reading_progress.abuffer_current_page)(pdf, current_page)
@@ -0,0 +1,149 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from pdf.models.pdf_models import Pdf, PdfPageText
+from pdf.services import search_services
+from rapidfuzz import fuzz, utils
+from users.models import Profile
+
+
+class TestSearchServices(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user', password='12345', email='a@a.com')
+        self.pdf_1 = Pdf.objects.create(owner=self.user.profile, name='pdf_1')
+        self.pdf_2 = Pdf.objects.create(owner=self.user.profile, name='pdf_2')
+
+        PdfPageText.objects.create(pdf=self.pdf_1, page=1, text='The quick brown fox jumps over the lazy dog.')
+        PdfPageText.objects.create(pdf=self.pdf_1, page=2, text='Foxes are foxes, a fox is a fox. Fox!')
+        PdfPageText.objects.create(pdf=self.pdf_2, page=3, text='Nothing to see here, just a dog.')
+
+    def test_search_page_texts(self):
+        results = search_services.search_page_texts(self.user.profile, 'fox')
+
+        # the page mentioning fox more often is ranked higher, prefix matching also finds "foxes"
+        self.assertEqual([(result.pdf, result.page) for result in results], [(self.pdf_1, 2), (self.pdf_1, 1)])
+        self.assertGreater(results[0].rank, results[1].rank)
+        self.assertIn('<mark>fox</mark>', results[1].snippet)
+        self.assertIn('<mark>Foxes</mark>', results[0].snippet)
+
+    def test_search_page_texts_all_terms_needed(self):
+        results = search_services.search_page_texts(self.user.profile, 'lazy dog')
+
+        self.assertEqual([(result.pdf, result.page) for result in results], [(self.pdf_1, 1)])
+
+    def test_search_page_texts_other_user(self):
+        other_user = User.objects.create_user(username='other', password='12345', email='b@a.com')
+
+        self.assertEqual(search_services.search_page_texts(other_user.profile, 'fox'), [])
+
+    def test_search_page_texts_special_characters(self):
+        # fts5 syntax is not interpreted, only the words are searched
+        results = search_services.search_page_texts(self.user.profile, '"fox* OR (NEAR')
+
+        self.assertEqual(results, [])
+        self.assertEqual(search_services.search_page_texts(self.user.profile, '"*()'), [])
+
+    def test_search_page_texts_limit(self):
+        self.assertEqual(len(search_services.search_page_texts(self.user.profile, 'fox', limit=1)), 1)
+
+    def test_search_page_texts_index_in_sync(self):
+        page_text = PdfPageText.objects.get(pdf=self.pdf_2, page=3)
+        page_text.text = 'A fox appeared.'
+        page_text.save()
+        PdfPageText.objects.filter(pdf=self.pdf_1, page=2).delete()
+
+        results = search_services.search_page_texts(self.user.profile, 'fox')
+
+        self.assertEqual(sorted((result.pdf.name, result.page) for result in results), [('pdf_1', 1), ('pdf_2', 3)])
+        self.assertEqual(search_services.search_page_texts(self.user.profile, 'nothing'), [])
+
+    def test_search_page_texts_deleted_pdf(self):
+        self.pdf_1.delete()
+
+        self.assertEqual(search_services.search_page_texts(self.user.profile, 'fox'), [])
+
+    def test_full_text_index_integrity(self):
+        # the integrity check raises an error if the index is out of sync with the page texts
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO pdf_pdfpagetext_fts(pdf_pdfpagetext_fts) VALUES ('integrity-check')")
+
+    def test_format_snippet(self):
+        raw_snippet = f'<script>alert(1)</script> {search_services.SNIPPET_START}fox{search_services.SNIPPET_STOP}'
+
+        self.assertEqual(
+            search_services.format_snippet(raw_snippet), '&lt;script&gt;alert(1)&lt;/script&gt; <mark>fox</mark>'
+        )
+
+
+class TestFuzzySearchPdfNames(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user', password='12345', email='a@a.com')
+        search_services.PDF_NAME_INDEXES.clear()
+
+    def test_fuzzy_search_pdf_names(self):
+        Pdf.objects.create(owner=self.user.profile, name='pdf_not_to_be_found')
+        pdf_self_hosted = Pdf.objects.create(owner=self.user.profile, name='The best self-hosted applications ')
+        pdf_self_hosting = Pdf.objects.create(owner=self.user.profile, name='Self-hosting Guide')
+        Pdf.objects.create(owner=self.user.profile, name='self sufficiency')
+
+        pdf_ids = search_services.fuzzy_search_pdf_names(self.user.profile, 'self hosted')
+
+        self.assertEqual(sorted(pdf_ids), sorted([str(pdf_self_hosted.id), str(pdf_self_hosting.id)]))
+
+    def test_fuzzy_search_pdf_names_no_pdfs(self):
+        self.assertEqual(search_services.fuzzy_search_pdf_names(self.user.profile, 'self hosted'), [])
+
+    def test_fuzzy_search_pdf_names_same_as_pairwise_scoring(self):
+        names = ['Self-hosting Guide', 'selfhosted', 'host', 'The Art of Computer Programming', 'art', 'Self', '']
+        for name in names:
+            Pdf.objects.create(owner=self.user.profile, name=name)
+
+        for search in ['self hosted', 'art', 'computer programing', 'hosting', 'x']:
+            expected = {
+                str(pdf.id)
+                for pdf in Pdf.objects.filter(owner=self.user.profile)
+                if (
+                    fuzz.WRatio(search, pdf.name, processor=utils.default_process)
+                    + fuzz.partial_ratio(search, pdf.name, processor=utils.default_process)
+                )
+                / 2
+                > 85
+                or fuzz.partial_ratio(search, pdf.name, processor=utils.default_process) > 95
+            }
+
+            self.assertEqual(set(search_services.fuzzy_search_pdf_names(self.user.profile, search)), expected)
+
+    def test_get_pdf_name_index_cached(self):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='Some PDF!')
+        profile = Profile.objects.get(id=self.user.profile.id)
+
+        self.assertEqual(search_services.get_pdf_name_index(profile), {str(pdf.id): 'some pdf'})
+
+        with self.assertNumQueries(0):
+            search_services.get_pdf_name_index(profile)
+
+    def test_get_pdf_name_index_invalidated(self):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='old')
+        search_services.get_pdf_name_index(Profile.objects.get(id=self.user.profile.id))
+
+        pdf.name = 'new'
+        pdf.save()
+
+        self.assertEqual(
+            search_services.get_pdf_name_index(Profile.objects.get(id=self.user.profile.id)), {str(pdf.id): 'new'}
+        )
+
+        pdf.delete()
+
+        self.assertEqual(search_services.get_pdf_name_index(Profile.objects.get(id=self.user.profile.id)), {})
+
+    @mock.patch('pdf.services.search_services.MAX_CACHED_PDF_NAME_INDEXES', 1)
+    def test_get_pdf_name_index_evicted(self):
+        other_user = User.objects.create_user(username='other', password='12345', email='b@a.com')
+
+        search_services.get_pdf_name_index(self.user.profile)
+        search_services.get_pdf_name_index(other_user.profile)
+
+        self.assertEqual(list(search_services.PDF_NAME_INDEXES), [other_user.profile.id])
@@ -1,8 +1,10 @@
 from unittest.mock import patch
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import TestCase
 from pdf.models.pdf_models import Pdf, Tag
+from pdf.service import TagServices
 from pdf.models.workspace_models import Workspace, WorkspaceRoles
 from pdf.services import workspace_services
 
@@ -17,6 +19,7 @@ class TestSignals(TestCase):
         tag_2 = Tag.objects.create(name='tag_2', owner=pdf_2.owner)
         pdf_1.tags.set([tag_1, tag_2])
         pdf_2.tags.set([tag_2])
+        TagServices.get_tag_info_dict(user.profile)
 
         pdf_1.delete()
 
@@ -26,6 +29,10 @@ class TestSignals(TestCase):
 
         # check that tag 1 was deleted
         self.assertFalse(user.profile.tags.filter(name='tag_1').exists())
+        # check that the cached tag tree was invalidated
+        self.assertIsNone(
+            cache.get(TagServices.get_tag_info_dict_cache_key(user.profile.id, user.profile.tag_tree_mode))
+        )
 
     @patch('pdf.signals.create_personal_workspace')
     def test_create_workspace(self, mock_create_personal_workspace):
@@ -1,12 +1,16 @@
 from pathlib import Path
 from shutil import copy
 from unittest import mock
+from uuid import uuid4
 
 from django.contrib.auth.models import User
 from django.core.files import File
 from django.test import TestCase, override_settings
+from huey.contrib.djhuey import HUEY
 from pdf import tasks
 from pdf.models.pdf_models import Pdf
+from pdf.services.pdf_analysis import PdfAnalysisResult
+from users.service import get_demo_pdf
 
 
 class TestTasks(TestCase):
@@ -14,9 +18,8 @@ class TestTasks(TestCase):
         self.user = User.objects.create_user(username='username', password='password', email='a@a.com')
 
     @override_settings(CONSUME_DIR=Path(__file__).parent / 'data' / 'consume')
-    @mock.patch('pdf.service.PdfProcessingServices.set_highlights_and_comments')
     @mock.patch('pdf.service.uuid4', return_value='12345678')
-    def test_consume_function(self, mock_uuid4, mock_set_highlights_and_comments):
+    def test_consume_function(self, mock_uuid4):
         # prepare data
         dummy_path = Path(__file__).parent / 'data' / 'dummy.pdf'
         pdf = Pdf.objects.create(owner=self.user.profile, name='dummy_1')
@@ -68,12 +71,14 @@ class TestTasks(TestCase):
         # check tags are generated and added
         dummy_3 = Pdf.objects.get(name='dummy_3')
         self.assertEqual(sorted(['consumed', 'file']), sorted([tag.name for tag in dummy_3.tags.all()]))
+        # the tags are shared by all consumed pdfs
+        self.assertEqual(self.user.profile.tags.count(), 2)
 
         # test number_of_pages and thumbnail were created
         self.assertEqual(dummy_3.number_of_pages, 2)
         self.assertTrue(dummy_3.thumbnail)
 
-        self.assertEqual(mock_set_highlights_and_comments.call_count, 3)
+        self.assertEqual(dummy_3.processing_status, Pdf.ProcessingStatus.DONE)
 
         # clean up
         wrong_pdf_path.unlink()
@@ -98,3 +103,134 @@ class TestTasks(TestCase):
         # pdf file, skipping but not existing
         pdf_info_list = [('some_pdf', 123456789), ('other', 8885)]
         self.assertTrue(tasks.passes_consume_condition(dummy_path, skip_existing=True, pdf_info_list=pdf_info_list))
+
+
+class TestReadingProgressTasks(TestCase):
+    @override_settings(READING_PROGRESS_BUFFER_ENABLED=True)
+    @mock.patch('pdf.tasks.reading_progress.flush_current_pages')
+    def test_flush_reading_progress_task(self, mock_flush_current_pages):
+        tasks.flush_reading_progress_task.call_local()
+
+        mock_flush_current_pages.assert_called_once_with()
+
+    @mock.patch('pdf.tasks.reading_progress.flush_current_pages')
+    def test_flush_reading_progress_task_disabled(self, mock_flush_current_pages):
+        tasks.flush_reading_progress_task.call_local()
+
+        mock_flush_current_pages.assert_not_called()
+
+
+class TestProcessingTasks(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='username', password='password', email='a@a.com')
+
+    def test_enqueue_pdf_processing(self):
+        pdf = Pdf.objects.create(
+            owner=self.user.profile,
+            name='pdf',
+            file=get_demo_pdf(),
+            processing_status=Pdf.ProcessingStatus.PENDING,
+        )
+
+        # run the pipeline synchronously
+        HUEY.immediate = True
+        try:
+            tasks.enqueue_pdf_processing(str(pdf.id))
+        finally:
+            HUEY.immediate = False
+
+        pdf = Pdf.objects.get(id=pdf.id)
+        self.assertEqual(pdf.processing_status, Pdf.ProcessingStatus.DONE)
+        self.assertEqual(pdf.number_of_pages, 5)
+        self.assertTrue(pdf.thumbnail)
+        self.assertEqual(pdf.pdfcomment_set.count(), 2)
+        self.assertEqual(pdf.pdfhighlight_set.count(), 2)
+
+    @override_settings(PDF_LINEARIZATION_ENABLED=True)
+    @mock.patch('pdf.service.PdfProcessingServices.set_linearized_file')
+    def test_enqueue_pdf_processing_linearization_enabled(self, mock_set_linearized_file):
+        pdf = Pdf.objects.create(
+            owner=self.user.profile,
+            name='pdf',
+            file=get_demo_pdf(),
+            processing_status=Pdf.ProcessingStatus.PENDING,
+        )
+
+        HUEY.immediate = True
+        try:
+            tasks.enqueue_pdf_processing(str(pdf.id))
+        finally:
+            HUEY.immediate = False
+
+        self.assertEqual(Pdf.objects.get(id=pdf.id).processing_status, Pdf.ProcessingStatus.DONE)
+        self.assertEqual(mock_set_linearized_file.call_args.args[0].id, pdf.id)
+
+    @mock.patch('pdf.service.PdfProcessingServices.set_linearized_file', return_value=False)
+    def test_linearize_pdf_task_failure(self, mock_set_linearized_file):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf', processing_status=Pdf.ProcessingStatus.DONE)
+
+        tasks.linearize_pdf_task.call_local(str(pdf.id))
+
+        mock_set_linearized_file.assert_called_once()
+        # linearizing is optional, so the pdf is still processed successfully
+        self.assertEqual(Pdf.objects.get(id=pdf.id).processing_status, Pdf.ProcessingStatus.DONE)
+
+    def test_process_pdf_task_incremental(self):
+        pdf = Pdf.objects.create(
+            owner=self.user.profile, name='pdf', file=get_demo_pdf(), processing_status=Pdf.ProcessingStatus.PENDING
+        )
+
+        with mock.patch('pdf.tasks.analyse_pdf_file', wraps=tasks.analyse_pdf_file) as mock_analyse_pdf_file:
+            self.assertEqual(tasks.process_pdf_task.call_local(str(pdf.id)), str(pdf.id))
+
+        # the file is analysed only once for the images, the annotations and the page texts
+        mock_analyse_pdf_file.assert_called_once()
+        pdf = Pdf.objects.get(id=pdf.id)
+        self.assertEqual(pdf.processing_status, Pdf.ProcessingStatus.DONE)
+        self.assertEqual(pdf.number_of_pages, 5)
+        self.assertTrue(pdf.thumbnail)
+        self.assertTrue(pdf.preview)
+        self.assertEqual(len(pdf.annotation_fingerprints), 5)
+        self.assertEqual(pdf.pdfcomment_set.count(), 2)
+        self.assertEqual(pdf.pdfpagetext_set.count(), 5)
+
+        with mock.patch('pdf.tasks.analyse_pdf_file', wraps=tasks.analyse_pdf_file) as mock_analyse_pdf_file:
+            tasks.process_pdf_task.call_local(str(pdf.id), extract_thumbnail_and_preview=False)
+
+        # nothing is re-extracted, as no page changed
+        mock_analyse_pdf_file.assert_called_once_with(
+            pdf.file.path,
+            False,
+            previous_annotation_fingerprints=pdf.annotation_fingerprints,
+            previous_content_hashes=list(pdf.pdfpagetext_set.order_by('page').values_list('content_hash', flat=True)),
+        )
+        self.assertEqual(pdf.pdfcomment_set.count(), 2)
+        self.assertEqual(pdf.pdfpagetext_set.count(), 5)
+
+    @mock.patch('pdf.tasks.analyse_pdf_file', return_value=PdfAnalysisResult(errors=['error']))
+    def test_process_pdf_task_failure(self, mock_analyse_pdf_file):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf', processing_status=Pdf.ProcessingStatus.PENDING)
+
+        self.assertEqual(tasks.process_pdf_task.call_local(str(pdf.id)), str(pdf.id))
+        self.assertEqual(Pdf.objects.get(id=pdf.id).processing_status, Pdf.ProcessingStatus.FAILED)
+
+    @mock.patch('pdf.service.PdfProcessingServices.apply_analysis_result', side_effect=OSError)
+    @mock.patch('pdf.tasks.analyse_pdf_file', return_value=PdfAnalysisResult())
+    def test_process_pdf_task_exception(self, mock_analyse_pdf_file, mock_apply_analysis_result):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf', processing_status=Pdf.ProcessingStatus.PENDING)
+
+        tasks.process_pdf_task.call_local(str(pdf.id))
+
+        # the pdf does not stay in processing
+        self.assertEqual(Pdf.objects.get(id=pdf.id).processing_status, Pdf.ProcessingStatus.FAILED)
+
+    @mock.patch('pdf.service.PdfProcessingServices.set_linearized_file')
+    @mock.patch('pdf.tasks.analyse_pdf_file')
+    def test_tasks_deleted_pdf(self, mock_analyse_pdf_file, mock_set_linearized_file):
+        pdf_id = str(uuid4())
+
+        tasks.process_pdf_task.call_local(pdf_id)
+        tasks.linearize_pdf_task.call_local(pdf_id)
+
+        mock_analyse_pdf_file.assert_not_called()
+        mock_set_linearized_file.assert_not_called()
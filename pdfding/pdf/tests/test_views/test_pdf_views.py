@@ -11,9 +11,11 @@ from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from django.utils.datastructures import MultiValueDict
 from pdf import forms
-from pdf.models.pdf_models import Pdf, PdfComment, PdfHighlight, Tag
-from pdf.service import PdfProcessingServices
+from pdf.management.commands.benchmark_tag_filter import filter_pdfs_by_joins, seed_tagged_pdfs
+from pdf.models.pdf_models import Pdf, PdfComment, PdfHighlight, PdfPageText, Tag
+from pdf.service import BulkIngestionResult, PdfProcessingServices
 from pdf.views import pdf_views
+from users.models import Profile
 from users.service import get_demo_pdf
 
 DEMO_FILE_SIZE = 29451
@@ -39,10 +41,9 @@ class TestAddPDFMixin(TestCase):
 
         self.assertEqual({'form': forms.AddForm}, generated_context)
 
-    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.set_highlights_and_comments')
-    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.process_with_pypdfium')
+    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.process_pdf')
     @mock.patch('pdf.forms.magic.from_buffer', return_value='application/pdf')
-    def test_obj_save(self, mock_from_buffer, mock_process_with_pypdfium, mock_set_highlights_and_comments):
+    def test_obj_save(self, mock_from_buffer, mock_process_pdf):
         # do a dummy request so we can get a request object
         response = self.client.get(reverse('pdf_overview'))
         form = forms.AddForm(
@@ -67,15 +68,11 @@ class TestAddPDFMixin(TestCase):
         self.assertEqual(pdf.file_directory, 'some/dir')
         self.assertEqual(pdf.owner, self.user.profile)
         self.assertEqual(pdf.file.size, DEMO_FILE_SIZE)
-        mock_process_with_pypdfium.assert_called_once_with(pdf)
-        mock_set_highlights_and_comments.assert_called_once_with(pdf)
+        mock_process_pdf.assert_called_once_with(pdf)
 
-    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.set_highlights_and_comments')
-    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.process_with_pypdfium')
+    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.process_pdf')
     @mock.patch('pdf.forms.magic.from_buffer', return_value='application/pdf')
-    def test_obj_save_use_file_name(
-        self, mock_from_buffer, mock_process_with_pypdfium, mock_set_highlights_and_comments
-    ):
+    def test_obj_save_use_file_name(self, mock_from_buffer, mock_process_pdf):
         # do a dummy request so we can get a request object
         response = self.client.get(reverse('pdf_overview'))
         form = forms.AddForm(
@@ -91,13 +88,11 @@ class TestAddPDFMixin(TestCase):
         self.assertEqual(set(tag_names), {'tag_2', 'tag_a'})
         self.assertEqual(pdf.owner, self.user.profile)
 
-        mock_process_with_pypdfium.assert_called_once_with(pdf)
-        mock_set_highlights_and_comments.assert_called_once_with(pdf)
+        mock_process_pdf.assert_called_once_with(pdf)
 
-    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.set_highlights_and_comments')
-    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.process_with_pypdfium')
+    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.process_pdf')
     @override_settings(DEMO_MODE=True)
-    def test_obj_save_demo_mode(self, mock_process_with_pypdfium, mock_set_highlights_and_comments):
+    def test_obj_save_demo_mode(self, mock_process_pdf):
         # do a dummy request so we can get a request object
         response = self.client.get(reverse('pdf_overview'))
         form = forms.AddFormNoFile(data={'name': 'some_pdf', 'tag_string': 'tag_a tag_2'}, owner=self.user.profile)
@@ -110,8 +105,7 @@ class TestAddPDFMixin(TestCase):
         self.assertEqual(set(tag_names), {'tag_2', 'tag_a'})
         self.assertEqual(pdf.file.size, DEMO_FILE_SIZE)
 
-        mock_process_with_pypdfium.assert_called_once_with(pdf)
-        mock_set_highlights_and_comments.assert_called_once_with(pdf)
+        mock_process_pdf.assert_called_once_with(pdf)
 
 
 class TestBulkAddPDFMixin(TestCase):
@@ -128,12 +122,9 @@ class TestBulkAddPDFMixin(TestCase):
 
         self.assertEqual({'form': forms.BulkAddForm}, generated_context)
 
-    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.set_highlights_and_comments')
-    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.process_with_pypdfium')
+    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.process_pdfs_in_parallel', return_value=[])
     @mock.patch('pdf.forms.magic.from_buffer', return_value='application/pdf')
-    def test_obj_save_single_file_no_skipping(
-        self, mock_from_buffer, mock_process_with_pypdfium, mock_set_highlights_and_comments
-    ):
+    def test_obj_save_single_file_no_skipping(self, mock_from_buffer, mock_process_pdfs_in_parallel):
         # do a dummy request so we can get a request object
         response = self.client.get(reverse('pdf_overview'))
         form = forms.BulkAddForm(
@@ -150,15 +141,11 @@ class TestBulkAddPDFMixin(TestCase):
         self.assertEqual(pdf.owner, self.user.profile)
         self.assertEqual(pdf.file_directory, 'some/dir')
         self.assertEqual(pdf.file.size, DEMO_FILE_SIZE)
-        mock_process_with_pypdfium.assert_called_once_with(pdf)
-        mock_set_highlights_and_comments.assert_called_once_with(pdf)
+        mock_process_pdfs_in_parallel.assert_called_once_with([pdf])
 
-    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.set_highlights_and_comments')
-    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.process_with_pypdfium')
+    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.process_pdfs_in_parallel', return_value=[])
     @mock.patch('pdf.forms.magic.from_buffer', return_value='application/pdf')
-    def test_obj_save_multiple_files_no_skipping(
-        self, mock_from_buffer, mock_process_with_pypdfium, mock_set_highlights_and_comments
-    ):
+    def test_obj_save_multiple_files_no_skipping(self, mock_from_buffer, mock_process_pdfs_in_parallel):
         # do a dummy request so we can get a request object
         response = self.client.get(reverse('pdf_overview'))
 
@@ -181,17 +168,13 @@ class TestBulkAddPDFMixin(TestCase):
             self.assertEqual(pdf.description, 'some_description')
             self.assertEqual(pdf.notes, 'some_notes')
             self.assertEqual(pdf.owner, self.user.profile)
-            # check that pdf pages are set to -1 in case of exception.
-            # in this test there should be an exception as a mock file is used.
-            self.assertEqual(pdf.number_of_pages, -1)
 
-    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.set_highlights_and_comments')
-    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.process_with_pypdfium')
+        mock_process_pdfs_in_parallel.assert_called_once_with(list(self.user.profile.pdfs))
+
+    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.process_pdfs_in_parallel', return_value=[])
     @mock.patch('pdf.service.uuid4', return_value='123456789')
     @mock.patch('pdf.forms.magic.from_buffer', return_value='application/pdf')
-    def test_obj_save_multiple_files_skipping(
-        self, mock_from_buffer, mock_uuid4, mock_process_with_pypdfium, mock_set_highlights_and_comments
-    ):
+    def test_obj_save_multiple_files_skipping(self, mock_from_buffer, mock_uuid4, mock_process_pdfs_in_parallel):
         # do a dummy request so we can get a request object
         response = self.client.get(reverse('pdf_overview'))
 
@@ -229,10 +212,9 @@ class TestBulkAddPDFMixin(TestCase):
         for i in range(2):
             self.assertEqual(old_pdfs[i], self.user.profile.pdfs.get(name=f'test{i + 1}'))
 
-    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.set_highlights_and_comments')
-    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.process_with_pypdfium')
+    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.process_pdfs_in_parallel', return_value=[])
     @override_settings(DEMO_MODE=True)
-    def test_obj_save_demo_mode(self, mock_process_with_pypdfium, mock_set_highlights_and_comments):
+    def test_obj_save_demo_mode(self, mock_process_pdfs_in_parallel):
         # do a dummy request so we can get a request object
         response = self.client.get(reverse('pdf_overview'))
         form = forms.BulkAddFormNoFile(
@@ -248,8 +230,27 @@ class TestBulkAddPDFMixin(TestCase):
         self.assertEqual(pdf.owner, self.user.profile)
         self.assertEqual(pdf.file.size, DEMO_FILE_SIZE)
 
-        mock_process_with_pypdfium.assert_called_once_with(pdf)
-        mock_set_highlights_and_comments.assert_called_once_with(pdf)
+        mock_process_pdfs_in_parallel.assert_called_once_with([pdf])
+
+    @mock.patch(
+        'pdf.views.pdf_views.service.PdfProcessingServices.bulk_create_pdfs',
+        return_value=BulkIngestionResult(added=['demo'], failed=['broken', 'other']),
+    )
+    @mock.patch('pdf.forms.magic.from_buffer', return_value='application/pdf')
+    def test_obj_save_failed_files(self, mock_from_buffer, mock_bulk_create_pdfs):
+        # do a dummy request so we can get a request object
+        response = self.client.get(reverse('pdf_overview'))
+        form = forms.BulkAddForm(
+            data={'tag_string': '', 'description': ''},
+            owner=self.user.profile,
+            files=MultiValueDict({'file': [get_demo_pdf()]}),
+        )
+
+        pdf_views.BulkAddPdfMixin.obj_save(form, response.wsgi_request, None)
+
+        messages = list(get_messages(response.wsgi_request))
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(str(messages[0]), 'Could not process: broken, other')
 
 
 class TestOverviewMixin(TestCase):
@@ -289,6 +290,47 @@ class TestOverviewMixin(TestCase):
 
         self.assertEqual(sorted(list(filtered_pdfs), key=lambda a: a.name), [pdf_1, pdf_2])
 
+    def test_filter_pdfs_by_tags(self):
+        tags = {
+            name: Tag.objects.create(name=name, owner=self.user.profile)
+            for name in ['programming', 'programming/python', 'programmingx', 'books', 'books/fantasy']
+        }
+        pdf_1 = Pdf.objects.create(owner=self.user.profile, name='pdf_1')
+        pdf_1.tags.set([tags['programming'], tags['programming/python'], tags['books/fantasy']])
+        pdf_2 = Pdf.objects.create(owner=self.user.profile, name='pdf_2')
+        pdf_2.tags.set([tags['programming/python'], tags['books']])
+        pdf_3 = Pdf.objects.create(owner=self.user.profile, name='pdf_3')
+        pdf_3.tags.set([tags['programmingx'], tags['books']])
+        # tags of other users are not used
+        other_user = User.objects.create_user(username='other', password='12345', email='b@a.com')
+        other_pdf = Pdf.objects.create(owner=other_user.profile, name='other_pdf')
+        other_pdf.tags.set([Tag.objects.create(name='other', owner=other_user.profile)])
+
+        for tag_names, expected_pdfs in [
+            (['programming'], [pdf_1, pdf_2]),
+            (['programming', 'books'], [pdf_1, pdf_2]),
+            (['books/fantasy', 'programming/python'], [pdf_1]),
+            (['programmingx', 'books'], [pdf_3]),
+            (['programming', 'not_existing'], []),
+            (['other'], []),
+        ]:
+            with self.assertNumQueries(2):
+                filtered_pdfs = list(
+                    pdf_views.OverviewMixin.filter_pdfs_by_tags(Pdf.objects.all(), tag_names, self.user.profile)
+                )
+
+            self.assertEqual(sorted(filtered_pdfs, key=lambda a: a.name), expected_pdfs)
+
+    def test_filter_pdfs_by_tags_same_as_joins(self):
+        seed_tagged_pdfs(self.user.profile, number_of_pdfs=40, number_of_topics=5)
+        pdfs = Pdf.objects.filter(owner=self.user.profile)
+
+        for tag_names in [['topic_1', 'topic_3'], ['library', 'topic_1/sub_2'], ['library/shelf_1'], ['library']]:
+            filtered_pdfs = pdf_views.OverviewMixin.filter_pdfs_by_tags(pdfs, tag_names, self.user.profile)
+
+            self.assertTrue(filtered_pdfs.exists())
+            self.assertEqual(set(filtered_pdfs), set(filter_pdfs_by_joins(pdfs, tag_names)))
+
     def test_filter_objects_starred(self):
         pdf_1 = Pdf.objects.create(owner=self.user.profile, name='pdf_to_be_found_1', starred=True)
         pdf_2 = Pdf.objects.create(owner=self.user.profile, name='pdf_to_be_found_2', starred=True)
@@ -322,13 +364,77 @@ class TestOverviewMixin(TestCase):
 
         self.assertEqual(list(filtered_pdfs), [pdf_1])
 
+    def test_overview_number_of_queries(self):
+        tags = [Tag.objects.create(name=f'tag_{i}', owner=self.user.profile) for i in range(3)]
+        for i in range(12):
+            pdf = Pdf.objects.create(owner=self.user.profile, name=f'pdf_{i}', description='description')
+            pdf.tags.set(tags)
+
+        for layout in ['Compact', 'Grid']:
+            self.user.profile.layout = layout
+            self.user.profile.save()
+
+            for headers in [{}, {'HTTP_HX-Request': 'true'}]:
+                request = self.client.get(reverse('pdf_overview'), **headers).wsgi_request
+
+                # the number of queries does not depend on the number of displayed pdfs: one query for the pdfs and one
+                # for the tags of the pdfs. the tags of the sidebar are cached.
+                for items_per_page in [1, 5, 11]:
+                    with self.assertNumQueries(2):
+                        response = pdf_views.Overview.as_view()(request, page=1, items_per_page=items_per_page)
+
+                    self.assertEqual(response.status_code, 200)
+
+    def test_overview_pagination_all_sortings(self):
+        tag = Tag.objects.create(name='tag', owner=self.user.profile)
+        # use few distinct views and names, so that the id is needed as tie-breaker
+        for i in range(30):
+            pdf = Pdf.objects.create(
+                owner=self.user.profile,
+                name=f'{'Pdf' if i % 2 else 'pdf'}_{i % 3}',
+                views=i % 2,
+                last_viewed_date=datetime(2025, 1, i % 4 + 1, tzinfo=timezone.utc),
+            )
+            pdf.tags.set([tag])
+
+        pdfs = list(Pdf.objects.all())
+        sort_keys = {
+            'Newest': (lambda pdf: (pdf.creation_date, pdf.id), True),
+            'Oldest': (lambda pdf: (pdf.creation_date, pdf.id), False),
+            'Name_asc': (lambda pdf: (pdf.name.lower(), pdf.id), False),
+            'Name_desc': (lambda pdf: (pdf.name.lower(), pdf.id), True),
+            'Least_viewed': (lambda pdf: (pdf.views, pdf.id), False),
+            'Most_viewed': (lambda pdf: (pdf.views, pdf.id), True),
+            'Recently_viewed': (lambda pdf: (pdf.last_viewed_date, pdf.id), True),
+        }
+        headers = {'HTTP_HX-Request': 'true'}
+
+        for sorting, (sort_key, descending) in sort_keys.items():
+            self.user.profile.pdf_sorting = sorting
+            self.user.profile.save()
+
+            response = self.client.get(reverse('pdf_overview'))
+            displayed_pdfs = list(response.context['page_obj'])
+            page = 1
+
+            while response.context['next_page_available']:
+                page += 1
+                url = reverse(
+                    'get_next_pdf_overview_page', kwargs={'page': page, 'cursor': response.context['next_page_cursor']}
+                )
+                response = self.client.get(f'{url}?tags=tag', **headers)
+                displayed_pdfs += list(response.context['page_obj'])
+
+            self.assertEqual(displayed_pdfs, sorted(pdfs, key=sort_key, reverse=descending))
+            self.assertEqual(page, 3)
+
     def test_fuzzy_filter_pdfs(self):
         Pdf.objects.create(owner=self.user.profile, name='pdf_not_to_be_found')
         pdf_self_hosted = Pdf.objects.create(owner=self.user.profile, name='The best self-hosted applications ')
         pdf_self_hosting = Pdf.objects.create(owner=self.user.profile, name='Self-hosting Guide')
         Pdf.objects.create(owner=self.user.profile, name='self sufficiency')
 
-        filtered_pdfs = pdf_views.OverviewMixin.fuzzy_filter_pdfs(Pdf.objects.all(), 'self hosted')
+        filtered_pdfs = pdf_views.OverviewMixin.fuzzy_filter_pdfs(Pdf.objects.all(), 'self hosted', self.user.profile)
         self.assertEqual(sorted(list(filtered_pdfs), key=lambda a: a.name), [pdf_self_hosting, pdf_self_hosted])
 
     @override_settings(SUPPORTER_EDITION=True)
@@ -350,6 +456,15 @@ class TestOverviewMixin(TestCase):
         self.assertEqual(generated_extra_context, expected_extra_context)
 
     @override_settings(SUPPORTER_EDITION=True)
+    @patch('pdf.service.TagServices.get_tag_info_dict')
+    def test_get_extra_context_htmx(self, mock_get_tag_info_dict):
+        response = self.client.get(reverse('pdf_overview'), HTTP_HX_REQUEST='true')
+
+        generated_extra_context = pdf_views.OverviewMixin.get_extra_context(response.wsgi_request)
+
+        self.assertNotIn('tag_info_dict', generated_extra_context)
+        mock_get_tag_info_dict.assert_not_called()
+
     @patch('pdf.service.TagServices.get_tag_info_dict', return_value='tag_info_dict')
     def test_get_extra_context_selection(self, mock_get_tag_info_dict):
         response = self.client.get(f'{reverse('pdf_overview')}?selection=starred')
@@ -479,7 +594,8 @@ class TestEditPdfMixin(TestCase):
                 field = 'tag_string'
             self.assertEqual(form.initial, {field: field_value})
 
-    def test_process_field_tag(self):
+    @patch('pdf.service.TagServices.clear_tag_info_dict_cache')
+    def test_process_field_tag(self, mock_clear_tag_info_dict_cache):
         pdf = Pdf.objects.create(owner=self.user.profile, name='pdf', description='something')
         tag_1 = Tag.objects.create(name='tag_1', owner=self.user.profile)
         tag_2 = Tag.objects.create(name='tag_2', owner=self.user.profile)
@@ -497,6 +613,8 @@ class TestEditPdfMixin(TestCase):
         self.assertEqual(sorted(tag_names), sorted(['tag_1', 'tag_3']))
         # check that tag 2 was deleted
         self.assertFalse(self.user.profile.tags.filter(name='tag_2').exists())
+        # once for deleting tag 2 and once for creating tag 3
+        mock_clear_tag_info_dict_cache.assert_has_calls([mock.call(self.user.profile.id)] * 2)
 
     @patch('pdf.service.PdfProcessingServices.process_renaming_pdf')
     def test_process_field_name(self, mock_process_renaming_pdf):
@@ -579,6 +697,26 @@ class TestViews(TestCase):
 
         self.assertEqual(response.context['current_page'], '20')
 
+    def test_content_search_get(self):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf')
+        PdfPageText.objects.create(pdf=pdf, page=4, text='Some <b>text</b> about pdfs.')
+
+        response = self.client.get(f"{reverse('pdf_content_search')}?search=text")
+
+        search_results = response.context['search_results']
+        self.assertEqual([(search_result.pdf, search_result.page) for search_result in search_results], [(pdf, 4)])
+        self.assertEqual(response.context['search_query'], 'text')
+        self.assertEqual(response.context['page'], 'pdf_content_search')
+        self.assertTemplateUsed(response, 'pdf_content_search.html')
+        self.assertContains(response, f"{reverse('view_pdf', kwargs={'identifier': pdf.id})}?page=4")
+        self.assertContains(response, '&lt;b&gt;<mark>text</mark>&lt;/b&gt;')
+
+    def test_content_search_get_no_search(self):
+        response = self.client.get(reverse('pdf_content_search'))
+
+        self.assertEqual(response.context['search_results'], [])
+        self.assertEqual(response.context['search_query'], '')
+
     def test_get_notes_no_htmx(self):
         pdf = Pdf.objects.create(owner=self.user.profile, name='pdf')
         response = self.client.get(reverse('get_notes', kwargs={'identifier': pdf.id}))
@@ -626,7 +764,9 @@ class TestViews(TestCase):
     def test_update_page_post(self):
         pdf = Pdf.objects.create(owner=self.user.profile, name='pdf')
 
-        response = self.client.post(reverse('update_page'), data={'pdf_id': pdf.id, 'current_page': 10})
+        # session, user, pdf and a single update of the current page
+        with self.assertNumQueries(5):
+            response = self.client.post(reverse('update_page'), data={'pdf_id': pdf.id, 'current_page': 10})
 
         # get pdf again with the changes
         pdf = self.user.profile.pdfs.get(id=pdf.id)
@@ -634,6 +774,68 @@ class TestViews(TestCase):
         self.assertEqual(pdf.current_page, 10)
         self.assertEqual(200, response.status_code)
 
+    async def test_update_page_post_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        pdf = await Pdf.objects.acreate(owner=await Profile.objects.aget(user=self.user), name='pdf')
+
+        response = await self.async_client.post(reverse('update_page'), data={'pdf_id': pdf.id, 'current_page': 10})
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual((await Pdf.objects.aget(id=pdf.id)).current_page, 10)
+
+    @override_settings(READING_PROGRESS_BUFFER_ENABLED=True)
+    def test_update_page_post_buffered(self):
+        # the viewer sends the current page of the pdf it just opened
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf', last_viewed_date=datetime.now(timezone.utc))
+
+        # no update of the pdf, the current page is only buffered
+        with self.assertNumQueries(4):
+            response = self.client.post(reverse('update_page'), data={'pdf_id': pdf.id, 'current_page': 10})
+
+        self.assertEqual(200, response.status_code)
+        # the current page is written to the database later, but the viewer already uses it
+        self.assertEqual(Pdf.objects.get(id=pdf.id).current_page, 1)
+        response = self.client.get(reverse('view_pdf', kwargs={'identifier': pdf.id}))
+        self.assertEqual(response.context['current_page'], 10)
+
+    def test_update_page_post_invalid_page(self):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf')
+
+        for data in [{'pdf_id': pdf.id, 'current_page': 'abc'}, {'pdf_id': pdf.id}]:
+            response = self.client.post(reverse('update_page'), data=data)
+
+            self.assertEqual(400, response.status_code)
+
+    async def test_update_page_post_other_user_asgi(self):
+        other_user = await User.objects.acreate_user(username='other', password='12345', email='b@a.com')
+        pdf = await Pdf.objects.acreate(owner=await Profile.objects.aget(user=other_user), name='pdf')
+        await self.async_client.aforce_login(self.user)
+
+        for pdf_id in [pdf.id, '12345']:
+            response = await self.async_client.post(reverse('update_page'), data={'pdf_id': pdf_id, 'current_page': 10})
+
+            self.assertEqual(404, response.status_code)
+
+        self.assertEqual((await Pdf.objects.aget(id=pdf.id)).current_page, 1)
+
+    def test_serve_linearized_file(self):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf', file=get_demo_pdf())
+        url = reverse('serve_pdf', kwargs={'identifier': pdf.id, 'revision': 0})
+
+        response = self.client.get(url)
+        self.assertEqual(int(response.headers['Content-Length']), DEMO_FILE_SIZE)
+
+        pdf.linearized_file = SimpleUploadedFile('linearized.pdf', b'linearized')
+        pdf.save()
+
+        # the linearized copy is served instead of the original file
+        response = self.client.get(url)
+        self.assertEqual(b''.join(response.streaming_content), b'linearized')
+
+        # the original file is still downloaded
+        response = self.client.get(reverse('download_pdf', kwargs={'identifier': pdf.id}))
+        self.assertEqual(int(response.headers['Content-Length']), DEMO_FILE_SIZE)
+
     def test_update_pdf_post_wrong_file_type(self):
         pdf = Pdf.objects.create(owner=self.user.profile, name='pdf')
 
@@ -644,8 +846,8 @@ class TestViews(TestCase):
 
         self.assertEqual(response.status_code, 422)
 
-    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.set_highlights_and_comments')
-    def test_update_pdf_post_correct(self, mock_set_highlights_and_comments):
+    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.process_pdf')
+    def test_update_pdf_post_correct(self, mock_process_pdf):
         pdf = Pdf.objects.create(owner=self.user.profile, name='pdf')
 
         # assign empty file and check size
@@ -655,6 +857,9 @@ class TestViews(TestCase):
             pdf.file = file
             pdf.save()
 
+        pdf.linearized_file = SimpleUploadedFile('linearized.pdf', b'linearized')
+        pdf.save()
+
         self.assertEqual(pdf.file.size, 0)
         self.assertEqual(pdf.revision, 0)
 
@@ -669,11 +874,29 @@ class TestViews(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(pdf.file.size, 8885)
         self.assertEqual(pdf.revision, 1)
-        mock_set_highlights_and_comments.assert_called_once_with(pdf)
+        # the outdated linearized copy is removed
+        self.assertFalse(pdf.linearized_file)
+        mock_process_pdf.assert_called_once_with(pdf, extract_thumbnail_and_preview=False)
+
+    @override_settings(DEFERRED_PROCESSING_ENABLED=True)
+    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.enqueue_processing')
+    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.process_pdf')
+    def test_update_pdf_post_deferred(self, mock_process_pdf, mock_enqueue_processing):
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf')
+
+        dummy_path = Path(__file__).parents[1] / 'data' / 'dummy.pdf'
+        with dummy_path.open(mode="rb") as f:
+            file = File(f, name='dummy')
+            response = self.client.post(reverse('update_pdf'), data={'pdf_id': pdf.id, 'updated_pdf': file})
+
+        self.assertEqual(response.status_code, 200)
+        # the updated pdf is processed by the huey worker
+        mock_process_pdf.assert_not_called()
+        mock_enqueue_processing.assert_called_once_with(pdf, extract_thumbnail_and_preview=False)
 
-    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.set_highlights_and_comments')
+    @mock.patch('pdf.views.pdf_views.service.PdfProcessingServices.process_pdf')
     @override_settings(DEMO_MODE=True)
-    def test_update_pdf_post_demo_mode(self, mock_set_highlights_and_comments):
+    def test_update_pdf_post_demo_mode(self, mock_process_pdf):
         pdf = Pdf.objects.create(owner=self.user.profile, name='pdf')
 
         # assign empty file and check size
@@ -691,7 +914,7 @@ class TestViews(TestCase):
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(pdf.file.size, DEMO_FILE_SIZE)
-        mock_set_highlights_and_comments.assert_called_once_with(pdf)
+        mock_process_pdf.assert_called_once_with(pdf, extract_thumbnail_and_preview=False)
 
     def test_star(self):
         headers = {'HTTP_HX-Request': 'true'}
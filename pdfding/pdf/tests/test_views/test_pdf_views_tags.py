@@ -1,11 +1,12 @@
-from unittest import mock
 from unittest.mock import patch
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import Client, TestCase
 from django.urls import reverse
 from django_htmx.http import HttpResponseClientRedirect
 from pdf import forms
+from pdf.service import TagServices
 from pdf.models.pdf_models import Pdf, Tag
 from pdf.views import pdf_views
 
@@ -51,9 +52,9 @@ class TestTagViews(TestCase):
         self.assertEqual(message.message, 'This field is required.')
         self.assertEqual(message.tags, 'warning')
 
-    @patch('pdf.views.pdf_views.EditTag.rename_tag')
+    @patch('pdf.views.pdf_views.EditTag.rename_tags')
     @patch('pdf.service.TagServices.adjust_referer_for_tag_view', return_value='pdf_overview')
-    def test_edit_tag_post_normal_mode(self, mock_adjust_referer_for_tag_view, mock_rename_tag):
+    def test_edit_tag_post_normal_mode(self, mock_adjust_referer_for_tag_view, mock_rename_tags):
         profile = self.user.profile
         profile.tag_tree_mode = False
         profile.save()
@@ -64,12 +65,12 @@ class TestTagViews(TestCase):
         self.client.post(reverse('edit_tag'), data={'name': 'new', 'current_name': 'tag_name'})
 
         mock_adjust_referer_for_tag_view.assert_called_once_with('pdf_overview', 'tag_name', 'new')
-        mock_rename_tag.assert_called_once_with(tag, 'new', self.user.profile)
+        mock_rename_tags.assert_called_once_with([(tag, 'new')], self.user.profile)
         self.assertEqual(tag_2.name, 'tag_name/child')
 
-    @patch('pdf.views.pdf_views.EditTag.rename_tag')
+    @patch('pdf.views.pdf_views.EditTag.rename_tags')
     @patch('pdf.service.TagServices.adjust_referer_for_tag_view', return_value='pdf_overview')
-    def test_edit_tag_post_tree_mode(self, mock_adjust_referer_for_tag_view, mock_rename_tag):
+    def test_edit_tag_post_tree_mode(self, mock_adjust_referer_for_tag_view, mock_rename_tags):
         profile = self.user.profile
         profile.tag_tree_mode = True
         profile.save()
@@ -83,21 +84,21 @@ class TestTagViews(TestCase):
         self.client.post(reverse('edit_tag'), data={'name': 'new', 'current_name': 'programming/python'})
 
         mock_adjust_referer_for_tag_view.assert_called_once_with('pdf_overview', 'programming/python', 'new')
-        mock_rename_tag.assert_has_calls(
-            [
-                mock.call(tags[1], 'new', self.user.profile),
-                mock.call(tags[2], 'new/django', self.user.profile),
-                mock.call(tags[3], 'new/flask', self.user.profile),
-            ]
+        mock_rename_tags.assert_called_once_with(
+            [(tags[1], 'new'), (tags[2], 'new/django'), (tags[3], 'new/flask')], self.user.profile
         )
 
     def test_rename_tag_normal(self):
         tag = Tag.objects.create(name='tag_name', owner=self.user.profile)
-        pdf_views.EditTag.rename_tag(tag, 'new', self.user.profile)
+        TagServices.get_tag_info_dict(self.user.profile)
+        pdf_views.EditTag.rename_tags([(tag, 'new')], self.user.profile)
 
         # get pdf again with the changes
         tag = self.user.profile.tags.get(id=tag.id)
         self.assertEqual(tag.name, 'new')
+        # check that the cached tag tree was invalidated
+        cache_key = TagServices.get_tag_info_dict_cache_key(self.user.profile.id, self.user.profile.tag_tree_mode)
+        self.assertIsNone(cache.get(cache_key))
 
     def test_rename_tag_existing(self):
         tag_1 = Tag.objects.create(name='tag_1', owner=self.user.profile)
@@ -105,7 +106,7 @@ class TestTagViews(TestCase):
         pdf = Pdf.objects.create(owner=self.user.profile, name='pdf')
         pdf.tags.set([tag_2])
 
-        pdf_views.EditTag.rename_tag(tag_2, tag_1.name, self.user.profile)
+        pdf_views.EditTag.rename_tags([(tag_2, tag_1.name)], self.user.profile)
 
         self.assertEqual(pdf.tags.count(), 1)
         self.assertEqual(self.user.profile.tags.count(), 1)
@@ -118,12 +119,59 @@ class TestTagViews(TestCase):
         pdf = Pdf.objects.create(owner=self.user.profile, name='pdf')
         pdf.tags.set([tag_1, tag_2])
 
-        pdf_views.EditTag.rename_tag(tag_2, tag_1.name, self.user.profile)
+        pdf_views.EditTag.rename_tags([(tag_2, tag_1.name)], self.user.profile)
 
         self.assertEqual(pdf.tags.count(), 1)
         self.assertEqual(self.user.profile.tags.count(), 1)
         self.assertEqual(pdf.tags.first(), tag_1)
 
+    def test_rename_tag_same_name(self):
+        tag = Tag.objects.create(name='tag_name', owner=self.user.profile)
+        pdf = Pdf.objects.create(owner=self.user.profile, name='pdf')
+        pdf.tags.set([tag])
+
+        # a tag is not merged into itself
+        pdf_views.EditTag.rename_tags([(tag, 'TAG_NAME')], self.user.profile)
+
+        self.assertEqual(list(pdf.tags.values_list('name', flat=True)), ['TAG_NAME'])
+
+    def test_rename_tags_tree_mode_merge(self):
+        tags = {
+            name: Tag.objects.create(name=name, owner=self.user.profile)
+            for name in ['old', 'old/python', 'old/java', 'new/python', 'other']
+        }
+        pdf_1 = Pdf.objects.create(owner=self.user.profile, name='pdf_1')
+        pdf_1.tags.set([tags['old'], tags['old/python'], tags['new/python']])
+        pdf_2 = Pdf.objects.create(owner=self.user.profile, name='pdf_2')
+        pdf_2.tags.set([tags['old/python'], tags['old/java'], tags['other']])
+
+        pdf_views.EditTag.rename_tags(
+            [(tags['old'], 'new'), (tags['old/python'], 'new/python'), (tags['old/java'], 'new/java')],
+            self.user.profile,
+        )
+
+        self.assertEqual(
+            sorted(self.user.profile.tags.values_list('name', flat=True)), ['new', 'new/java', 'new/python', 'other']
+        )
+        self.assertEqual(sorted(pdf_1.tags.values_list('name', flat=True)), ['new', 'new/python'])
+        self.assertEqual(sorted(pdf_2.tags.values_list('name', flat=True)), ['new/java', 'new/python', 'other'])
+        # renamed tags keep their ids, merged tags are replaced by the existing tag
+        self.assertEqual(self.user.profile.tags.get(name='new').id, tags['old'].id)
+        self.assertEqual(self.user.profile.tags.get(name='new/python').id, tags['new/python'].id)
+
+    def test_rename_tags_number_of_queries(self):
+        tags = [Tag.objects.create(name=name, owner=self.user.profile) for name in ['old', 'old/a', 'old/b', 'new/b']]
+        for i in range(20):
+            pdf = Pdf.objects.create(owner=self.user.profile, name=f'pdf_{i}')
+            pdf.tags.set(tags)
+
+        # fetching the merge targets, renaming, merging and deleting the merged tag do not depend on the pdfs. the
+        # transaction adds two queries for the savepoint.
+        with self.assertNumQueries(8):
+            pdf_views.EditTag.rename_tags([(tags[0], 'new'), (tags[1], 'new/a'), (tags[2], 'new/b')], self.user.profile)
+
+        self.assertEqual(Pdf.tags.through.objects.count(), 60)
+
     @patch('pdf.service.TagServices.adjust_referer_for_tag_view', return_value='pdf_overview')
     def test_delete_tag_normal_mode(self, mock_adjust_referer_for_tag_view):
         profile = self.user.profile
@@ -132,6 +180,7 @@ class TestTagViews(TestCase):
 
         tag = Tag.objects.create(name='tag_name', owner=self.user.profile)
         tag_2 = Tag.objects.create(name='tag_name/child', owner=self.user.profile)
+        TagServices.get_tag_info_dict(profile)
 
         headers = {'HTTP_HX-Request': 'true'}
         response = self.client.post(reverse('delete_tag'), **headers, data={'tag_name': tag.name})
@@ -139,6 +188,7 @@ class TestTagViews(TestCase):
         self.assertFalse(self.user.profile.tags.filter(id=tag.id).exists())
         self.assertTrue(self.user.profile.tags.filter(id=tag_2.id).exists())
         self.assertEqual(type(response), HttpResponseClientRedirect)
+        self.assertIsNone(cache.get(TagServices.get_tag_info_dict_cache_key(profile.id, False)))
 
         mock_adjust_referer_for_tag_view.assert_called_with('pdf_overview', 'tag_name', '')
 
@@ -1,11 +1,15 @@
+import asyncio
 from datetime import datetime, timedelta, timezone
 from io import BytesIO
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
 
 from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
 from django.contrib.messages import get_messages
-from django.test import Client, TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import Http404
+from django.contrib.sessions.backends.db import SessionStore
+from django.test import AsyncRequestFactory, Client, TestCase, override_settings
 from django.urls import reverse
 from pdf.forms import (
     SharedDeletionDateForm,
@@ -26,6 +30,8 @@ from pdf.views.share_views import (
     OverviewMixin,
     PdfPublicMixin,
     SharedPdfMixin,
+    ViewShared,
+    get_unlocked_session_key,
 )
 
 
@@ -141,6 +147,19 @@ class TestSharedPdfMixin(TestCase):
 
         self.assertEqual(shared_pdf, SharedPdfMixin.get_object(response.wsgi_request, shared_pdf.id))
 
+    async def test_aget_object(self):
+        other_user = await User.objects.acreate_user(username='other', password='12345', email='b@a.com')
+        shared_pdf = await SharedPdf.objects.acreate(owner_id=self.pdf.owner_id, pdf=self.pdf, name='share')
+        request = AsyncRequestFactory().get('/')
+
+        request.auser = AsyncMock(return_value=self.user)
+        self.assertEqual(shared_pdf, await SharedPdfMixin.aget_object(request, shared_pdf.id))
+
+        # the shared pdf of another user cannot be accessed
+        request.auser = AsyncMock(return_value=other_user)
+        with self.assertRaises(Http404):
+            await SharedPdfMixin.aget_object(request, shared_pdf.id)
+
 
 class TestEditSharedPdfMixin(TestCase):
     username = 'user'
@@ -231,10 +250,49 @@ class TestPdfPublicMixin(TestCase):
         self.pdf = None
         set_up(self)
 
-    def test_get_object(self):
-        shared_pdf = SharedPdf.objects.create(owner=self.user.profile, pdf=self.pdf, name='share')
+    async def test_aget_object(self):
+        shared_pdf = await SharedPdf.objects.acreate(owner_id=self.pdf.owner_id, pdf=self.pdf, name='share')
+        request = self.get_request()
+
+        self.assertEqual(self.pdf, await PdfPublicMixin.aget_object(request, shared_pdf.id))
+
+        with self.assertRaises(Http404):
+            await PdfPublicMixin.aget_object(request, '12345')
+
+    async def test_aget_object_locked(self):
+        for kwargs in [{'password': make_password('some_pw')}, {'views': 1, 'max_views': 1}]:
+            shared_pdf = await SharedPdf.objects.acreate(
+                owner_id=self.pdf.owner_id, pdf=self.pdf, name='share', **kwargs
+            )
+            request = self.get_request()
+
+            with self.assertRaises(Http404):
+                await PdfPublicMixin.aget_object(request, shared_pdf.id)
+
+            # the shared pdf is unlocked after it was viewed in the session
+            await request.session.aset(get_unlocked_session_key(shared_pdf.id), True)
+            self.assertEqual(self.pdf, await PdfPublicMixin.aget_object(request, shared_pdf.id))
+
+    async def test_aget_object_deleted_and_expired(self):
+        past_date = datetime.now(timezone.utc) - timedelta(minutes=5)
+
+        for kwargs in [{'deletion_date': past_date}, {'expiration_date': past_date}]:
+            shared_pdf = await SharedPdf.objects.acreate(
+                owner_id=self.pdf.owner_id, pdf=self.pdf, name='share', **kwargs
+            )
+            request = self.get_request()
+            # unlocking does not allow accessing deleted or expired shared pdfs
+            await request.session.aset(get_unlocked_session_key(shared_pdf.id), True)
+
+            with self.assertRaises(Http404):
+                await PdfPublicMixin.aget_object(request, shared_pdf.id)
+
+    @staticmethod
+    def get_request():
+        request = AsyncRequestFactory().get('/')
+        request.session = SessionStore()
 
-        self.assertEqual(shared_pdf.pdf, PdfPublicMixin.get_object(None, shared_pdf.id))
+        return request
 
 
 class TestBaseSharedPdfPublicView(TestCase):
@@ -246,10 +304,10 @@ class TestBaseSharedPdfPublicView(TestCase):
         self.pdf = None
         set_up(self)
 
-    def test_get_object(self):
-        shared_pdf = SharedPdf.objects.create(owner=self.user.profile, pdf=self.pdf, name='share')
+    async def test_aget_shared_pdf_public(self):
+        shared_pdf = await SharedPdf.objects.acreate(owner_id=self.pdf.owner_id, pdf=self.pdf, name='share')
 
-        self.assertEqual(shared_pdf, BaseSharedPdfPublicView.get_shared_pdf_public(None, shared_pdf.id))
+        self.assertEqual(shared_pdf, await BaseSharedPdfPublicView.aget_shared_pdf_public(None, shared_pdf.id))
 
 
 class TestLoginNotRequiredViews(TestCase):
@@ -271,6 +329,81 @@ class TestLoginNotRequiredViews(TestCase):
         self.assertEqual(response.context['host'], 'testserver')
         self.assertEqual(response.context['form'], ViewSharedPasswordForm)
 
+    def test_serve_linearized_file(self):
+        self.pdf.file = SimpleUploadedFile('pdf.pdf', b'original')
+        self.pdf.linearized_file = SimpleUploadedFile('linearized.pdf', b'linearized')
+        self.pdf.save()
+
+        response = self.client.get(
+            reverse('serve_shared_pdf', kwargs={'identifier': self.shared_pdf.id, 'revision': 0})
+        )
+
+        self.assertEqual(b''.join(response.streaming_content), b'linearized')
+
+    @override_settings(FILE_OFFLOAD='X_ACCEL_REDIRECT')
+    @patch('pdf.views.share_views.get_viewer_theme_and_color', return_value=('creme', '4 4 4'))
+    def test_serve_and_download_offload_password(self, mock_get_viewer_theme_and_color):
+        self.pdf.file = SimpleUploadedFile('pdf.pdf', b'content')
+        self.pdf.save()
+        protected_shared_pdf = SharedPdf.objects.create(
+            owner=self.user.profile, pdf=self.pdf, name='protected_shared_pdf', password=make_password('some_pw')
+        )
+        serve_url = reverse('serve_shared_pdf', kwargs={'identifier': protected_shared_pdf.id, 'revision': 0})
+        download_url = reverse('download_shared_pdf', kwargs={'identifier': protected_shared_pdf.id})
+
+        # the file is not offloaded before the password was entered
+        for url in [serve_url, download_url]:
+            response = self.client.get(url)
+
+            self.assertEqual(response.status_code, 404)
+            self.assertNotIn('X-Accel-Redirect', response.headers)
+
+        self.client.post(
+            reverse('view_shared_pdf', kwargs={'identifier': protected_shared_pdf.id}),
+            data={'password_input': 'some_pw'},
+        )
+
+        for url in [serve_url, download_url]:
+            response = self.client.get(url)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers['X-Accel-Redirect'], f'/protected_media/{self.pdf.file.name}')
+
+    @override_settings(FILE_OFFLOAD='X_ACCEL_REDIRECT')
+    def test_serve_and_download_offload_inactive(self):
+        self.pdf.file = SimpleUploadedFile('pdf.pdf', b'content')
+        self.pdf.save()
+        past_date = datetime.now(timezone.utc) - timedelta(minutes=5)
+
+        for kwargs in [{'views': 1, 'max_views': 1}, {'expiration_date': past_date}, {'deletion_date': past_date}]:
+            shared_pdf = SharedPdf.objects.create(owner=self.user.profile, pdf=self.pdf, name='share', **kwargs)
+
+            for url in [
+                reverse('serve_shared_pdf', kwargs={'identifier': shared_pdf.id, 'revision': 0}),
+                reverse('download_shared_pdf', kwargs={'identifier': shared_pdf.id}),
+            ]:
+                response = self.client.get(url)
+
+                self.assertEqual(response.status_code, 404)
+                self.assertNotIn('X-Accel-Redirect', response.headers)
+
+    @patch('pdf.views.share_views.get_viewer_theme_and_color', return_value=('creme', '4 4 4'))
+    def test_serve_after_last_view(self, mock_get_viewer_theme_and_color):
+        self.pdf.file = SimpleUploadedFile('pdf.pdf', b'content')
+        self.pdf.save()
+        limited_shared_pdf = SharedPdf.objects.create(
+            owner=self.user.profile, pdf=self.pdf, name='limited_shared_pdf', max_views=1
+        )
+
+        # the last view reaches the max views, the viewer still needs to load the file
+        self.client.post(reverse('view_shared_pdf', kwargs={'identifier': limited_shared_pdf.id}))
+        response = self.client.get(
+            reverse('serve_shared_pdf', kwargs={'identifier': limited_shared_pdf.id, 'revision': 0})
+        )
+
+        self.assertEqual(b''.join(response.streaming_content), b'content')
+        self.assertEqual(Client().get(response.request['PATH_INFO']).status_code, 404)
+
     def test_view_get_inactive(self):
         inactive_shared_pdf = SharedPdf.objects.create(
             owner=self.user.profile, pdf=self.pdf, name='inactive_shared_pdf', views=2, max_views=1
@@ -339,6 +472,62 @@ class TestLoginNotRequiredViews(TestCase):
         self.assertIsInstance(response.context['form'], ViewSharedPasswordForm)
         self.assertTemplateUsed(response, 'view_shared_info.html')
 
+    async def test_view_get_and_post_asgi(self):
+        protected_shared_pdf = await SharedPdf.objects.acreate(
+            owner_id=self.pdf.owner_id, pdf=self.pdf, name='protected_shared_pdf', password=make_password('some_pw')
+        )
+        url = reverse('view_shared_pdf', kwargs={'identifier': protected_shared_pdf.id})
+
+        response = await self.async_client.get(url)
+        self.assertTemplateUsed(response, 'view_shared_info.html')
+
+        response = await self.async_client.post(url, data={'password_input': 'some_pw'})
+        self.assertTemplateUsed(response, 'viewer.html')
+        self.assertEqual((await SharedPdf.objects.aget(pk=protected_shared_pdf.id)).views, 1)
+
+    @patch('pdf.views.share_views.arender', new_callable=AsyncMock)
+    async def test_render_shared_pdf_view_concurrent(self, mock_arender):
+        shared_pdf = await SharedPdf.objects.acreate(
+            owner_id=self.pdf.owner_id, pdf=self.pdf, name='limited_shared_pdf', max_views=3
+        )
+        request = AsyncRequestFactory().post('/')
+        request.session = SessionStore()
+
+        # simulate parallel views, all of them loaded the shared pdf before any of them increased the view counter
+        shared_pdfs = [await SharedPdf.objects.select_related('pdf').aget(pk=shared_pdf.id) for _ in range(10)]
+        await asyncio.gather(*[ViewShared.render_shared_pdf_view(request, loaded) for loaded in shared_pdfs])
+
+        # no view is lost and only the views within the max views display the pdf
+        templates = [call.args[1] for call in mock_arender.call_args_list]
+        self.assertEqual(templates.count('viewer.html'), 3)
+        self.assertEqual(templates.count('view_shared_inactive.html'), 7)
+        self.assertEqual((await SharedPdf.objects.aget(pk=shared_pdf.id)).views, 3)
+
+    async def test_aincrease_views(self):
+        shared_pdf = await SharedPdf.objects.acreate(
+            owner_id=self.pdf.owner_id, pdf=self.pdf, name='limited_shared_pdf', views=1, max_views=2
+        )
+
+        self.assertTrue(await ViewShared.aincrease_views(shared_pdf))
+        self.assertFalse(await ViewShared.aincrease_views(shared_pdf))
+        self.assertEqual((await SharedPdf.objects.aget(pk=shared_pdf.id)).views, 2)
+
+        # a max views of 0 means no limit
+        await SharedPdf.objects.filter(pk=shared_pdf.id).aupdate(max_views=0)
+        self.assertTrue(await ViewShared.aincrease_views(shared_pdf))
+
+        # expired shared pdfs are not counted
+        await SharedPdf.objects.filter(pk=shared_pdf.id).aupdate(
+            expiration_date=datetime.now(timezone.utc) - timedelta(minutes=1)
+        )
+        self.assertFalse(await ViewShared.aincrease_views(shared_pdf))
+        self.assertEqual((await SharedPdf.objects.aget(pk=shared_pdf.id)).views, 3)
+
+    async def test_serve_not_existing_asgi(self):
+        response = await self.async_client.get(reverse('serve_shared_pdf', kwargs={'identifier': '123', 'revision': 0}))
+
+        self.assertEqual(response.status_code, 404)
+
     def test_view_post_inactive(self):
         inactive_shared_pdf = SharedPdf.objects.create(
             owner=self.user.profile, pdf=self.pdf, name='inactive_shared_pdf', views=2, max_views=1
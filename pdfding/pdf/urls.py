@@ -6,7 +6,9 @@ urlpatterns = [
     # pdf related views
     path('', pdf_views.Overview.as_view(), name='pdf_overview'),
     path('query/', pdf_views.OverviewQuery.as_view(), name='pdf_overview_query'),
-    path('get_next_overview_page/<int:page>/', pdf_views.Overview.as_view(), name='get_next_pdf_overview_page'),
+    path(
+        'get_next_overview_page/<int:page>/<cursor>/', pdf_views.Overview.as_view(), name='get_next_pdf_overview_page'
+    ),
     path('add', pdf_views.Add.as_view(), name='add_pdf'),
     path('bulk_add', pdf_views.BulkAdd.as_view(), name='bulk_add_pdfs'),
     path('delete/<identifier>', pdf_views.Delete.as_view(), name='delete_pdf'),
@@ -22,15 +24,16 @@ urlpatterns = [
     path('view/<identifier>', pdf_views.ViewerView.as_view(), name='view_pdf'),
     path('star/<identifier>', pdf_views.Star.as_view(), name='star'),
     path('archive/<identifier>', pdf_views.Archive.as_view(), name='archive'),
+    path('search', pdf_views.ContentSearch.as_view(), name='pdf_content_search'),
     path('highlights', pdf_views.HighlightOverview.as_view(), name='pdf_highlight_overview'),
     path(
-        'highlights/get_next_overview_page/<int:page>/',
+        'highlights/get_next_overview_page/<int:page>/<cursor>/',
         pdf_views.HighlightOverview.as_view(),
         name='get_next_pdf_highlight_overview_page',
     ),
     path('comments', pdf_views.CommentOverview.as_view(), name='pdf_comment_overview'),
     path(
-        'comments/get_next_overview_page/<int:page>/',
+        'comments/get_next_overview_page/<int:page>/<cursor>/',
         pdf_views.CommentOverview.as_view(),
         name='get_next_pdf_comment_overview_page',
     ),
@@ -44,7 +47,7 @@ urlpatterns = [
         name='pdf_details_highlight_overview',
     ),
     path(
-        'details/<identifier>/get_next_highlight_overview_page/<int:page>/',
+        'details/<identifier>/get_next_highlight_overview_page/<int:page>/<cursor>/',
         pdf_views.DetailsHighlightOverview.as_view(),
         name='get_next_pdf_details_highlight_overview_page',
     ),
@@ -54,7 +57,7 @@ urlpatterns = [
         name='pdf_details_comment_overview',
     ),
     path(
-        'details/<identifier>/get_next_comment_overview_page/<int:page>/',
+        'details/<identifier>/get_next_comment_overview_page/<int:page>/<cursor>/',
         pdf_views.DetailsCommentOverview.as_view(),
         name='get_next_pdf_details_comment_overview_page',
     ),
@@ -62,7 +65,7 @@ urlpatterns = [
     path('share/<identifier>', share_views.Share.as_view(), name='share_pdf'),
     path('shared/overview/', share_views.Overview.as_view(), name='shared_pdf_overview'),
     path(
-        'shared/get_next_overview_page/<int:page>/',
+        'shared/get_next_overview_page/<int:page>/<cursor>/',
         share_views.Overview.as_view(),
         name='get_next_shared_overview_page',
     ),
@@ -4,7 +4,8 @@ from base import base_views
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_not_required
-from django.db.models import Q, QuerySet
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q, QuerySet
 from django.db.models.functions import Lower
 from django.forms import ValidationError
 from django.http import FileResponse, HttpRequest, HttpResponse
@@ -14,7 +15,7 @@ from django_htmx.http import HttpResponseClientRedirect, HttpResponseClientRefre
 from pdf import forms, service
 from pdf.models.pdf_models import Pdf, PdfComment, PdfHighlight, Tag
 from pdf.service import PdfProcessingServices
-from rapidfuzz import fuzz, utils
+from pdf.services import reading_progress, search_services
 from users.models import Profile
 from users.service import get_demo_pdf, get_viewer_theme_and_color
 
@@ -103,26 +104,46 @@ class BulkAddPdfMixin(BasePdfMixin):
         else:
             files = form.files.getlist('file')
 
-        for file in files:
-            # add file unless skipping existing is set and a PDF with the same name and file size already exists
+        # add file unless skipping existing is set and a PDF with the same name and file size already exists
+        files_to_add = [
+            file
+            for file in files
             if not (
                 form.data.get('skip_existing') and (service.create_name_from_file(file), file.size) in pdf_info_list
-            ):
-                pdf_name = service.create_unique_name_from_file(file, profile)
+            )
+        ]
+
+        bulk_ingestion_result = service.PdfProcessingServices.bulk_create_pdfs(
+            pdf_files=files_to_add,
+            owner=profile,
+            description=description,
+            notes=notes,
+            file_directory=file_directory,
+            tag_string=tag_string,
+        )
 
-                service.PdfProcessingServices.create_pdf(
-                    name=pdf_name,
-                    owner=profile,
-                    pdf_file=file,
-                    description=description,
-                    notes=notes,
-                    file_directory=file_directory,
-                    tag_string=tag_string,
-                )
+        if bulk_ingestion_result.failed:
+            messages.warning(request, f'Could not process: {", ".join(bulk_ingestion_result.failed)}')
 
 
 class OverviewMixin(BasePdfMixin):
     overview_page_name = 'pdf_overview/overview_page'
+    # the fields that are displayed in the overview, all other fields are not loaded
+    overview_fields = [
+        'archived',
+        'creation_date',
+        'current_page',
+        'description',
+        'id',
+        'name',
+        'notes',
+        'number_of_pages',
+        'owner',
+        'processing_status',
+        'starred',
+        'thumbnail',
+        'views',
+    ]
 
     @staticmethod
     def get_sorting(request: HttpRequest):
@@ -162,27 +183,44 @@ class OverviewMixin(BasePdfMixin):
                 pdfs = pdfs.filter(starred=True)
 
         if tags:
-            tags = tags.split(' ')
-
-        for tag in tags:
-            pdfs = pdfs.filter(Q(tags__name=tag) | Q(tags__name__startswith=f'{tag}/')).distinct()
+            pdfs = cls.filter_pdfs_by_tags(pdfs, tags.split(' '), request.user.profile)
 
         if search:
-            pdfs = cls.fuzzy_filter_pdfs(pdfs, search)
+            pdfs = cls.fuzzy_filter_pdfs(pdfs, search, request.user.profile)
+
+        # prefetch the tags, so that displaying the tags of the pdfs does not cause a query per pdf
+        pdfs = pdfs.only(*cls.overview_fields).prefetch_related('tags')
 
         return pdfs
 
     @staticmethod
-    def fuzzy_filter_pdfs(pdfs: QuerySet, search: str) -> QuerySet:
-        fuzzy_result = []
+    def filter_pdfs_by_tags(pdfs: QuerySet, tag_names: list[str], profile: Profile) -> QuerySet:
+        """
+        Filter the PDFs by tags. A PDF needs to have all specified tags, where a tag can also be replaced by one of its
+        children, e.g. 'programming/python' for 'programming'. The tags and their children are resolved to ids in a
+        single query, so that each tag is checked by an EXISTS subquery instead of joining the tags and removing
+        duplicates. Thereby the database can go through the PDFs in the order of the overview and stop as soon as the
+        page is filled.
+        """
+
+        tag_query = Q()
+        for tag_name in tag_names:
+            tag_query |= Q(name=tag_name) | Q(name__startswith=f'{tag_name}/')
 
-        for pdf in pdfs:
-            w_ratio = fuzz.WRatio(search, pdf.name, processor=utils.default_process)
-            partial_ratio = fuzz.partial_ratio(search, pdf.name, processor=utils.default_process)
+        tags = list(profile.tags.filter(tag_query).values_list('id', 'name'))
 
-            # better to be a bit more strict regarding this so we avoid false positives
-            if (w_ratio + partial_ratio) / 2 > 85 or partial_ratio > 95:
-                fuzzy_result.append(pdf.id)
+        for tag_name in tag_names:
+            tag_ids = [tag_id for tag_id, name in tags if name == tag_name or name.startswith(f'{tag_name}/')]
+            pdf_tags = Pdf.tags.through.objects.filter(pdf_id=OuterRef('id'), tag_id__in=tag_ids)
+            pdfs = pdfs.filter(Exists(pdf_tags))
+
+        return pdfs
+
+    @staticmethod
+    def fuzzy_filter_pdfs(pdfs: QuerySet, search: str, profile: Profile) -> QuerySet:
+        """Filter the PDFs by fuzzy matching their names with the search query."""
+
+        fuzzy_result = search_services.fuzzy_search_pdf_names(profile, search)
 
         pdfs = pdfs.filter(id__in=fuzzy_result)
 
@@ -210,10 +248,13 @@ class OverviewMixin(BasePdfMixin):
             'page': page,
             'search_query': request.GET.get('search', ''),
             'special_pdf_selection': special_pdf_selection,
-            'tag_info_dict': service.TagServices.get_tag_info_dict(request.user.profile),
             'tag_query': tag_query,
         }
 
+        # the tags are only displayed in the sidebar, which is not part of the pages loaded via htmx
+        if not request.htmx:
+            extra_context['tag_info_dict'] = service.TagServices.get_tag_info_dict(request.user.profile)
+
         return extra_context
 
 
@@ -228,6 +269,15 @@ class PdfMixin(BasePdfMixin):
 
         return pdf
 
+    @staticmethod
+    @service.check_object_access_allowed
+    async def aget_object(request: HttpRequest, pdf_id: str):
+        """Get the pdf specified by the ID asynchronously"""
+
+        user = await request.auser()
+
+        return await Pdf.objects.aget(owner__user=user, id=pdf_id)
+
 
 class TagMixin:
     @staticmethod
@@ -302,14 +352,12 @@ class EditPdfMixin(PdfMixin):
             tag_string = form_data.get('tag_string', '')
             tag_names = Tag.parse_tag_string(tag_string)
 
-            # check if tag needs to be deleted
-            for tag in pdf.tags.all():
-                if tag.name not in tag_names and tag.pdf_set.count() == 1:
-                    tag.delete()
+            with transaction.atomic():
+                # delete the removed tags that are not used by other pdfs
+                service.TagServices.delete_orphan_tags(pdf, tag_names)
+                tags = service.TagServices.process_tag_names(tag_names, request.user.profile)
 
-            tags = service.TagServices.process_tag_names(tag_names, request.user.profile)
-
-            pdf.tags.set(tags)
+                pdf.tags.set(tags)
 
         elif field_name == 'name':
             existing_obj = cls.obj_class.objects.filter(
@@ -350,7 +398,7 @@ class HighlightOverviewMixin(AnnotationOverviewMixin):
         Filter the PDF highlights in the overview. As there is no filtering needed this is just a dummy function.
         """
 
-        highlights = PdfHighlight.objects.filter(pdf__owner=request.user.profile)
+        highlights = PdfHighlight.objects.filter(owner=request.user.profile).select_related('pdf')
 
         return highlights
 
@@ -372,7 +420,7 @@ class CommentOverviewMixin(AnnotationOverviewMixin):
         Filter the PDF comments in the overview. As there is no filtering needed this is just a dummy function.
         """
 
-        comments = PdfComment.objects.filter(pdf__owner=request.user.profile)
+        comments = PdfComment.objects.filter(owner=request.user.profile).select_related('pdf')
 
         return comments
 
@@ -462,11 +510,9 @@ class ViewerView(PdfMixin, View):
     def get(self, request: HttpRequest, identifier: str):
         """Display the PDF file in the browser"""
 
-        # increase view counter by 1
+        # increase view counter by 1, only the view fields are updated, so that the row does not need to be rewritten
         pdf = self.get_object(request, identifier)
-        pdf.views += 1
-        pdf.last_viewed_date = datetime.now(timezone.utc)
-        pdf.save()
+        Pdf.objects.filter(id=pdf.id).update(views=F('views') + 1, last_viewed_date=datetime.now(timezone.utc))
 
         theme, theme_color = get_viewer_theme_and_color(request.user.profile)
 
@@ -475,7 +521,7 @@ class ViewerView(PdfMixin, View):
         if page:
             current_page = page
         else:
-            current_page = pdf.current_page
+            current_page = reading_progress.get_current_page(pdf)
 
         return render(
             request,
@@ -493,6 +539,26 @@ class ViewerView(PdfMixin, View):
         )
 
 
+class ContentSearch(View):
+    """The view responsible for searching the texts of the user's PDFs."""
+
+    def get(self, request: HttpRequest):
+        """Display the pages matching the search query ordered by their rank."""
+
+        search_query = request.GET.get('search', '')
+
+        if search_query:
+            search_results = search_services.search_page_texts(request.user.profile, search_query)
+        else:
+            search_results = []
+
+        return render(
+            request,
+            'pdf_content_search.html',
+            {'page': 'pdf_content_search', 'search_query': search_query, 'search_results': search_results},
+        )
+
+
 class GetNotes(PdfMixin, View):
     """View for getting a pdf's markdown notes as html, so it can be displayed via htmx."""
 
@@ -510,19 +576,26 @@ class GetNotes(PdfMixin, View):
 class UpdatePage(PdfMixin, View):
     """
     View for updating the current page of the viewed PDF. This is triggered everytime the page the user changes the
-    displayed page in the browser.
+    displayed page in the browser. As every open viewer sends these requests, the view is asynchronous. If enabled,
+    the current page is buffered in the cache and written to the database later.
     """
 
-    def post(self, request: HttpRequest):
+    async def post(self, request: HttpRequest):
         """Change the current page."""
 
         pdf_id = request.POST.get('pdf_id')
-        pdf = self.get_object(request, pdf_id)
+        pdf = await self.aget_object(request, pdf_id)
 
-        # update current page
-        current_page = request.POST.get('current_page')
-        pdf.current_page = current_page
-        pdf.save()
+        try:
+            current_page = int(request.POST.get('current_page'))
+        except (TypeError, ValueError):
+            return HttpResponse(status=400)
+
+        if settings.READING_PROGRESS_BUFFER_ENABLED:
+            await reading_progress.abuffer_current_page(pdf, current_page)
+        else:
+            # only update the current page, so that the row does not need to be rewritten
+            await Pdf.objects.filter(id=pdf.id).aupdate(current_page=current_page)
 
         return HttpResponse(status=200)
 
@@ -546,10 +619,16 @@ class UpdatePdf(PdfMixin, View):
             # make sure a valid pdf is sent
             updated_pdf = forms.CleanHelpers.clean_file(updated_pdf)
             pdf.file = updated_pdf
+            # the linearized copy is outdated, it is recreated after the processing if enabled
+            pdf.linearized_file = None
             pdf.revision += 1
             pdf.save()
 
-            PdfProcessingServices.set_highlights_and_comments(pdf)
+            # the thumbnail and preview are kept, but the annotations and the number of pages might have changed
+            if settings.DEFERRED_PROCESSING_ENABLED:
+                PdfProcessingServices.enqueue_processing(pdf, extract_thumbnail_and_preview=False)
+            else:
+                PdfProcessingServices.process_pdf(pdf, extract_thumbnail_and_preview=False)
 
             return HttpResponse(status=200)
         except ValidationError:
@@ -579,6 +658,11 @@ class OverviewQuery(BasePdfMixin, base_views.BaseOverviewQuery):
 class Serve(PdfMixin, base_views.BaseServe):
     """View used for serving PDF files specified by the PDF id"""
 
+    @staticmethod
+    def get_file_path(pdf):
+        # the linearized copy is preferred, as its first page can be displayed before the whole file is loaded
+        return pdf.linearized_file.name or pdf.file.name
+
 
 class Add(AddPdfMixin, base_views.BaseAdd):
     """View for adding new PDF files."""
@@ -717,6 +801,7 @@ class EditTag(TagMixin, View):
 
             if user_profile.tag_tree_mode:
                 tags = self.get_tags_by_name(request, original_tag_name)
+                tags_with_new_names = []
 
                 for tag in tags:
                     # change
@@ -724,10 +809,12 @@ class EditTag(TagMixin, View):
                     if tag.name != new_name:
                         new_tag_name = tag.name.replace(original_tag_name, new_tag_name)
 
-                    self.rename_tag(tag, new_tag_name, user_profile)
+                    tags_with_new_names.append((tag, new_tag_name))
+
+                self.rename_tags(tags_with_new_names, user_profile)
             else:
                 tag = self.get_tag_by_name(request, original_tag_name)
-                self.rename_tag(tag, new_name, user_profile)
+                self.rename_tags([(tag, new_name)], user_profile)
 
             redirect_url = service.TagServices.adjust_referer_for_tag_view(redirect_url, original_tag_name, new_name)
         else:
@@ -739,27 +826,50 @@ class EditTag(TagMixin, View):
         return redirect(redirect_url)
 
     @staticmethod
-    def rename_tag(tag: Tag, new_tag_name: str, profile: Profile):
+    def rename_tags(tags_with_new_names: list[tuple[Tag, str]], profile: Profile):
         """
-        Rename a tag. If tag name already exist merge.
+        Rename the tags. If a tag with the new name already exists, the tag is merged into the existing tag. Renaming
+        and merging is done with set-based queries inside a single transaction, so that the number of queries does not
+        depend on the number of pdfs.
         """
 
-        existing_tag = profile.tags.filter(name__iexact=new_tag_name).first()
+        renamed_tag_ids = [tag.id for tag, _ in tags_with_new_names]
+        new_names_filter = Q()
+        for _, new_tag_name in tags_with_new_names:
+            new_names_filter |= Q(name__iexact=new_tag_name)
 
-        # if there is already a tag with the same name, delete the tag and add the existing tag to the pdfs
-        if existing_tag and str(existing_tag.id) != tag.id:
-            pdfs = profile.pdfs
-            pdfs_with_tag = pdfs.filter(tags__id=tag.id)
+        # the tags that are renamed free up their names, so they are not merge targets
+        merge_targets = {
+            tag.name.lower(): tag for tag in profile.tags.filter(new_names_filter).exclude(id__in=renamed_tag_ids)
+        }
+        renamed_tags = []
+        merged_tags = []
 
-            for pdf_with_tag in pdfs_with_tag:
-                # we are safe to use add, even if the pdf already has the tag as the documentation states:
-                # Using add() on a relation that already exists won’t duplicate the relation,
-                # but it will still trigger signals.
-                pdf_with_tag.tags.add(existing_tag)
-            tag.delete()
-        else:
-            tag.name = new_tag_name
-            tag.save()
+        for tag, new_tag_name in tags_with_new_names:
+            merge_target = merge_targets.get(new_tag_name.lower())
+
+            if merge_target:
+                merged_tags.append((tag, merge_target))
+            else:
+                tag.name = new_tag_name
+                renamed_tags.append(tag)
+                merge_targets[new_tag_name.lower()] = tag
+
+        pdf_tags = Pdf.tags.through.objects
+
+        with transaction.atomic():
+            Tag.objects.bulk_update(renamed_tags, ['name'])
+
+            for tag, merge_target in merged_tags:
+                # move the tag to the merge target for all pdfs, that do not have the merge target yet. the remaining
+                # relations of the tag are deleted together with the tag.
+                pdf_tags.filter(tag_id=tag.id).exclude(
+                    pdf_id__in=pdf_tags.filter(tag_id=merge_target.id).values('pdf_id')
+                ).update(tag_id=merge_target.id)
+
+            Tag.objects.filter(id__in=[tag.id for tag, _ in merged_tags]).delete()
+
+        service.TagServices.clear_tag_info_dict_cache(profile.id)
 
 
 class DeleteTag(TagMixin, View):
@@ -778,9 +888,9 @@ class DeleteTag(TagMixin, View):
             else:
                 tags = [self.get_tag_by_name(request, tag_name)]
 
-            for tag in tags:
-                tag.delete()
+            Tag.objects.filter(id__in=[tag.id for tag in tags]).delete()
 
+            service.TagServices.clear_tag_info_dict_cache(request.user.profile.id)
             redirect_url = service.TagServices.adjust_referer_for_tag_view(redirect_url, tag_name, '')
 
             return HttpResponseClientRedirect(redirect_url)
@@ -2,13 +2,14 @@ from datetime import datetime, timezone
 from io import BytesIO
 
 import qrcode
+from asgiref.sync import sync_to_async
 from base import base_views
 from django.contrib import messages
 from django.contrib.auth.decorators import login_not_required
 from django.core.files import File
-from django.db.models import Q, QuerySet
+from django.db.models import F, Q, QuerySet
 from django.db.models.functions import Lower
-from django.http import HttpRequest
+from django.http import Http404, HttpRequest
 from django.shortcuts import render
 from django.urls import reverse
 from django.utils.decorators import method_decorator
@@ -29,6 +30,13 @@ from pdf.views.pdf_views import PdfMixin
 from qrcode.image import svg
 from users.service import get_viewer_theme_and_color
 
+# templates are rendered in a thread, as rendering them might access the database, e.g. when loading the session
+arender = sync_to_async(render)
+
+
+def get_unlocked_session_key(shared_id: str) -> str:
+    return f'shared_pdf_unlocked_{shared_id}'
+
 
 class BaseShareMixin:
     obj_name = 'shared_pdf'
@@ -124,7 +132,7 @@ class OverviewMixin(BaseShareMixin):
         just a dummy function
         """
 
-        shared_pdfs = SharedPdf.objects.filter(owner=request.user.profile).all()
+        shared_pdfs = SharedPdf.objects.filter(owner=request.user.profile).select_related('pdf')
         shared_pdfs = shared_pdfs.filter(
             Q(deletion_date__isnull=True) | Q(deletion_date__gt=datetime.now(timezone.utc))
         )
@@ -151,6 +159,15 @@ class SharedPdfMixin(BaseShareMixin):
 
         return shared_pdf
 
+    @staticmethod
+    @check_object_access_allowed
+    async def aget_object(request: HttpRequest, identifier: str):
+        """Get the shared pdf specified by the ID asynchronously"""
+
+        user = await request.auser()
+
+        return await SharedPdf.objects.aget(owner__user=user, id=identifier)
+
 
 class EditSharedPdfMixin(SharedPdfMixin):
     fields_requiring_extra_processing = ['expiration_date', 'deletion_date', 'name']
@@ -213,10 +230,22 @@ class EditSharedPdfMixin(SharedPdfMixin):
 class PdfPublicMixin:
     @staticmethod
     @check_object_access_allowed
-    def get_object(_, shared_id: str):
-        """Get the shared pdf specified by the ID"""
+    async def aget_object(request: HttpRequest, shared_id: str):
+        """
+        Get the pdf of the shared pdf specified by the ID. Deleted and expired shared pdfs cannot be accessed. Password
+        protected shared pdfs and shared pdfs that reached their max views can only be accessed in sessions that
+        unlocked them in ViewShared. This is checked before the file is served or offloaded to the reverse proxy.
+        """
 
-        shared_pdf = SharedPdf.objects.get(pk=shared_id)
+        shared_pdf = await SharedPdf.objects.select_related('pdf').aget(pk=shared_id)
+
+        if shared_pdf.deleted or shared_pdf.expired:
+            raise Http404("Given query not found...")
+
+        if (shared_pdf.password or shared_pdf.inactive) and not await request.session.aget(
+            get_unlocked_session_key(shared_pdf.id)
+        ):
+            raise Http404("Given query not found...")
 
         return shared_pdf.pdf
 
@@ -225,12 +254,10 @@ class BaseSharedPdfPublicView(View):
     @staticmethod
     @check_object_access_allowed
     # first parameter needed because of the decorator
-    def get_shared_pdf_public(_, shared_id: str):
+    async def aget_shared_pdf_public(_, shared_id: str):
         """Get the shared pdf specified by the ID without being logged in."""
 
-        shared_pdf = SharedPdf.objects.get(pk=shared_id)
-
-        return shared_pdf
+        return await SharedPdf.objects.select_related('pdf').aget(pk=shared_id)
 
 
 class Share(AddSharedPdfMixin, base_views.BaseAdd):
@@ -282,6 +309,11 @@ class DownloadQrCode(SharedPdfMixin, base_views.BaseDownload):
 class Serve(PdfPublicMixin, base_views.BaseServe):
     """View used for serving shared PDF files specified by the shared PDF id"""
 
+    @staticmethod
+    def get_file_path(pdf):
+        # the linearized copy is preferred, as its first page can be displayed before the whole file is loaded
+        return pdf.linearized_file.name or pdf.file.name
+
 
 @method_decorator(login_not_required, name="dispatch")
 class Download(PdfPublicMixin, base_views.BaseDownload):
@@ -290,44 +322,50 @@ class Download(PdfPublicMixin, base_views.BaseDownload):
 
 @method_decorator(login_not_required, name="dispatch")
 class ViewShared(BaseSharedPdfPublicView):
-    """The view responsible for displaying the shared PDF file specified by the shared PDF id in the browser."""
+    """
+    The view responsible for displaying the shared PDF file specified by the shared PDF id in the browser. The view is
+    asynchronous, rendering the templates and checking the password are executed in a thread.
+    """
 
-    def get(self, request: HttpRequest, identifier: str):
-        shared_pdf = self.get_shared_pdf_public(request, identifier)
+    async def get(self, request: HttpRequest, identifier: str):
+        shared_pdf = await self.aget_shared_pdf_public(request, identifier)
 
         if shared_pdf.inactive or shared_pdf.deleted:
-            return render(request, 'view_shared_inactive.html')
+            return await arender(request, 'view_shared_inactive.html')
         else:
-            return render(
+            return await arender(
                 request,
                 'view_shared_info.html',
                 {'shared_pdf': shared_pdf, 'form': ViewSharedPasswordForm, 'host': request.get_host()},
             )
 
-    def post(self, request: HttpRequest, identifier: str):
-        shared_pdf = self.get_shared_pdf_public(request, identifier)
+    async def post(self, request: HttpRequest, identifier: str):
+        shared_pdf = await self.aget_shared_pdf_public(request, identifier)
 
         if shared_pdf.inactive:
-            return render(request, 'view_shared_inactive.html')
+            return await arender(request, 'view_shared_inactive.html')
         else:
             if shared_pdf.password:
                 form = ViewSharedPasswordForm(request.POST, shared_pdf=shared_pdf)
 
-                if form.is_valid():
-                    return self.render_shared_pdf_view(request, shared_pdf)
+                # hashing the password is cpu intensive, so it should not block the event loop
+                if await sync_to_async(form.is_valid)():
+                    return await self.render_shared_pdf_view(request, shared_pdf)
                 else:
-                    return render(request, 'view_shared_info.html', {'shared_pdf': shared_pdf, 'form': form})
+                    return await arender(request, 'view_shared_info.html', {'shared_pdf': shared_pdf, 'form': form})
             else:
-                return self.render_shared_pdf_view(request, shared_pdf)
+                return await self.render_shared_pdf_view(request, shared_pdf)
 
     @staticmethod
-    def render_shared_pdf_view(request: HttpRequest, shared_pdf: SharedPdf):
-        shared_pdf.views += 1
-        shared_pdf.save()
+    async def render_shared_pdf_view(request: HttpRequest, shared_pdf: SharedPdf):
+        if not await ViewShared.aincrease_views(shared_pdf):
+            return await arender(request, 'view_shared_inactive.html')
 
+        # the viewer loads the file via Serve, which requires the shared pdf to be unlocked in the session
+        await request.session.aset(get_unlocked_session_key(shared_pdf.id), True)
         theme, theme_color = get_viewer_theme_and_color()
 
-        return render(
+        return await arender(
             request,
             'viewer.html',
             {
@@ -340,3 +378,20 @@ class ViewShared(BaseSharedPdfPublicView):
                 'user_view_bool': False,
             },
         )
+
+    @staticmethod
+    async def aincrease_views(shared_pdf: SharedPdf) -> bool:
+        """
+        Increase the view counter of the shared pdf by 1. The counter is only increased if the shared pdf is still
+        active, so that concurrent views cannot exceed the max views. Returns whether the counter was increased.
+        """
+
+        now = datetime.now(timezone.utc)
+        # the max views and the expiration date are checked in the same statement that increases the counter
+        number_of_updated_rows = await SharedPdf.objects.filter(
+            Q(max_views__isnull=True) | Q(max_views=0) | Q(views__lt=F('max_views')),
+            Q(expiration_date__isnull=True) | Q(expiration_date__gt=now),
+            id=shared_pdf.id,
+        ).aupdate(views=F('views') + 1)
+
+        return number_of_updated_rows == 1
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:41
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0024_add_current_collection_workspace'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='pdf_names_version',
+            field=models.UUIDField(default=uuid.uuid4, editable=False),
+        ),
+    ]
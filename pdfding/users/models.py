@@ -1,4 +1,5 @@
 from datetime import datetime, timedelta, timezone
+from uuid import uuid4
 
 from django.conf import settings
 from django.contrib.auth.models import User
@@ -87,6 +88,8 @@ class Profile(models.Model):
     pdf_keep_screen_awake = models.CharField(
         choices=EnabledChoice.choices, max_length=8, default=EnabledChoice.DISABLED
     )
+    # changed whenever a pdf of the profile is added, renamed or deleted, used for invalidating cached pdf names
+    pdf_names_version = models.UUIDField(default=uuid4, editable=False)
     pdf_sorting = models.CharField(choices=PdfSortingChoice, max_length=15, default=PdfSortingChoice.NEWEST)
     pdfs_total_size = models.IntegerField(default=0)
     show_progress_bars = models.CharField(choices=EnabledChoice.choices, max_length=8, default=EnabledChoice.ENABLED)
@@ -109,6 +112,11 @@ class Profile(models.Model):
 
         return str.lower(str(self.dark_mode))
 
+    def change_pdf_names_version(self) -> None:
+        """Change the version of the pdf names, so that cached pdf names of the profile are reloaded."""
+
+        self.pdf_names_version = uuid4()
+
     @property
     def needs_nagging(self):
         """
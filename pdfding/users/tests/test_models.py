@@ -25,6 +25,13 @@ class TestProfile(TestCase):
 
         self.assertEqual(self.user.profile.dark_mode_str, 'dark')
 
+    def test_change_pdf_names_version(self):
+        old_version = self.user.profile.pdf_names_version
+
+        self.user.profile.change_pdf_names_version()
+
+        self.assertNotEqual(self.user.profile.pdf_names_version, old_version)
+
     @override_settings(SUPPORTER_EDITION=True)
     def test_needs_nagging_supporter_edition(self):
         self.user.profile.last_time_nagged = datetime.now(tz=timezone.utc) - timedelta(weeks=9)
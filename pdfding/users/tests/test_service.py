@@ -50,12 +50,12 @@ class TestUserServices(TestCase):
 
         self.assertEqual(demo_pdf.size, 29451)
 
-    @patch('users.service.PdfProcessingServices.process_with_pypdfium')
-    def test_create_demo_user(self, mock_process_with_pypdfium):
+    @patch('users.service.PdfProcessingServices.process_pdf')
+    def test_create_demo_user(self, mock_process_pdf):
         email = 'demo@pdfding.com'
         user = service.create_demo_user(email, 'password')
 
         self.assertEqual(user.profile.pdfs.count(), 4)
         self.assertEqual(user.profile.tags.count(), 5)
-        self.assertEqual(mock_process_with_pypdfium.call_count, 4)
+        self.assertEqual(mock_process_pdf.call_count, 4)
         self.assertEqual(user.email, email)